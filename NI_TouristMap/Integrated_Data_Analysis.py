@@ -2,32 +2,38 @@
 
 #========================================= Intergrated Data Analysis ============================================================================================================
 #================================================================================================================================================================================
-    """
-    the process of repairing or adjusting the geometric properties of spatial data, such as points, lines, or polygons, to ensure they meet certain criteria or standards. 
-    This could involve tasks such as removing or correcting invalid geometries, simplifying shapes, snapping vertices to a grid, or resolving topological errors. 
-    Libraries such as Shapely and GeoPandas provide functionality to perform these operations efficiently.
-    """
+"""
+the process of repairing or adjusting the geometric properties of spatial data, such as points, lines, or polygons, to ensure they meet certain criteria or standards. 
+This could involve tasks such as removing or correcting invalid geometries, simplifying shapes, snapping vertices to a grid, or resolving topological errors. 
+Libraries such as Shapely and GeoPandas provide functionality to perform these operations efficiently.
+"""
 
 
 
 #=========================================== 1. Fixing Geometry in Shapefiles ===================================================================================================
 
-# Importing the `pandas` library with the alias `pd`
-# Importing the `geopandas` library with the alias `gpd` 
-import pandas as pd
-import geopandas as gpd
-
-# Read the shapefile
-input_data = gpd.read_file("data_files/download_data/OSNI_Open_Data_-_Largescale_Boundaries_-_NI_Outline.shp")  # Path to the input shapefile
-
-# Fix geometries using buffer method
-fix_data = input_data.buffer(0)
-
-# Re-project the CRS to WGS84 latitude/longitude(EPSG:4326)
-fixed_data = fix_data.to_crs("epsg:4326")
-
-# Save the fixed geometries to a new shapefile
-fixed_data.to_file("data_files/NI_Outline.shp") # Path to the fixed output shapefile
+# Each section runs the matching stage of analysis_pipeline.py, which holds the code of every step; run
+# "python analysis_pipeline.py" instead to only rerun the sections whose inputs changed since the last run.
+from analysis_pipeline import (clip_counties, coastal, distances, fix_outline, geocode_gp, index_postcodes,
+                               reproject_parks)
+from layer_registry import LayerRegistry
+from postcode_index import is_index_current
+from run_report import enabled_by_environment, start_run
+
+# Path to the downloaded data folder
+download = "data_files/download_data"
+
+# Time each section (wall and CPU time, peak memory, rows) when the NI_RUN_REPORT environment variable is set to 1;
+# the JSON report is saved to data_files/reports at the end of the script (see run_report.py)
+report = start_run("Integrated_Data_Analysis", enabled=enabled_by_environment())
+report.section("1. fixing geometry")
+
+# Read the shapefile straight from the downloaded zip archive (see archive_reader.py), fix geometries (only the invalid
+# geometries, and invalid parts of large multipolygons, are repaired with make_valid or buffer(0) as a fallback, see
+# geometry_repair.py), re-project the CRS to WGS84 latitude/longitude(EPSG:4326) and save them to a new shapefile
+repair_report = fix_outline({"outline": f"{download}/OSNI_Open_Data_-_Largescale_Boundaries_-_NI_Outline.zip"},
+                            {"outline": "data_files/NI_Outline.shp"}, crs="epsg:4326")
+print(f"Repaired {repair_report.repaired} of {repair_report.checked} geometries ({repair_report.parts} parts)")
 
 #======================================================== End of 1. ==============================================================================================================
         
@@ -37,20 +43,18 @@ fixed_data.to_file("data_files/NI_Outline.shp") # Path to the fixed output shape
 
 
 # =============================== 2. Coordinate Reference System (CRS) Re-Projection =============================================================================================
-    """
-    Coordinate Re-Projection is the process of transforming coordinates from one Coordinate Reference System (CRS)(documentation) to another. 
-    A CRS is a framework used to specify locations on the Earth's surface. 
-    It's essentially a coordinate-based system that allows for the precise identification of geographic features and positions.
-    """
+"""
+Coordinate Re-Projection is the process of transforming coordinates from one Coordinate Reference System (CRS)(documentation) to another. 
+A CRS is a framework used to specify locations on the Earth's surface. 
+It's essentially a coordinate-based system that allows for the precise identification of geographic features and positions.
+"""
 
-# Read the downloaded shapefiles of Historic Park and Garden Data.
-tourist_tmp = gpd.read_file("data_files/download_data/Historic_Parks_and_Gardens20240410.shp")  # Path to the input shapefile of Historic Park and Garden Data.
+report.section("2. re-projection")
 
-# Re-project the CRS to WGS84 latitude/longitude(EPSG:4326)
-tourist_prj = tourist_tmp.to_crs("epsg:4326")
-
-# Save the re-projected shapefile to a new shapefile
-tourist_prj.to_file("data_files/NI_Tourist_Sites.shp") # Path to the output shapefile 
+# Read the downloaded shapefiles of Historic Park and Garden Data, re-project the CRS to WGS84 latitude/longitude(EPSG:4326)
+# and save them to a new shapefile
+reproject_parks({"parks": f"{download}/historic-parks-and-gardens.zip"},
+                {"tourist": "data_files/NI_Tourist_Sites.shp"}, crs="epsg:4326")
 
 #===================================================== End of 2. ===================================================================================================================
 
@@ -60,28 +64,19 @@ tourist_prj.to_file("data_files/NI_Tourist_Sites.shp") # Path to the output shap
 
 
 #================================================= 3. Clipping shapefiles ==========================================================================================================
-    """
-    Clipping shapefiles refers to the process of spatially limiting or cutting down the extent of a shapefile based on the boundary of another shapefile or a defined boundary area. 
-    When examining a shapefile of counties in ArcGIS or QGIS, you might notice that county boundaries extend across water features, which can be confusing for map users. 
-    To address this, we will refine the map by removing extraneous elements using the country's outline border.
-    """
-
-# Read the input and mask/clip shapefiles
-input_counties = gpd.read_file("data_files/download_data/OSNI_Open_Data_-_Largescale_Boundaries_-_County_Boundaries_.shp")# Path to the input shapefile of County Boundaries
-clip_data = gpd.read_file("data_files/NI_outline.shp")# path to the mask shapefile of geometry fixed country boarder
-
-# To ensure that all files are in a common CRS (Coordinate Reference System),
-# Re-project the CRS of the clipped data (assuming the original data uses the same CRS) WGS84 latitude/longitude(EPSG:4326)
-prj_counties = input_counties.to_crs ("epsg:4326")
+"""
+Clipping shapefiles refers to the process of spatially limiting or cutting down the extent of a shapefile based on the boundary of another shapefile or a defined boundary area. 
+When examining a shapefile of counties in ArcGIS or QGIS, you might notice that county boundaries extend across water features, which can be confusing for map users. 
+To address this, we will refine the map by removing extraneous elements using the country's outline border.
+"""
 
-# Verifying of existing CRS
-prj_counties.crs
+report.section("3. clipping")
 
-# Clipping the counties polygon layer using an outline polygon layer
-clipped_counties = gpd.overlay(prj_counties, clip_data, how='intersection', keep_geom_type=True)
-
-# Save the clipped data to a new shapefile
-clipped_counties.to_file("data_files/NI_Counties.shp") # Path to the fixed output shapefile of County Boundaries
+# Clipping the counties polygon layer using the geometry fixed outline polygon layer, both in WGS84 latitude/longitude(EPSG:4326).
+# Only the counties crossing the outline are intersected with it; counties fully inside are copied through (see mask_clip.py)
+clip_counties({"counties": f"{download}/OSNI_Open_Data_-_Largescale_Boundaries_-_County_Boundaries_.zip",
+               "outline": "data_files/NI_Outline.shp"},
+              {"counties": "data_files/NI_Counties.shp"}, crs="epsg:4326")
 
 #===================================================== End of 3. ==================================================================================================================  
 
@@ -91,167 +86,80 @@ clipped_counties.to_file("data_files/NI_Counties.shp") # Path to the fixed outpu
 
 
 #=============================================== 4. Data Intergration ==============================================================================================================
-    """
-    Python typically refers to the process of combining data from multiple sources, formats, or databases into a unified format that can be analyzed or used for further processing.
-    """
+"""
+Python typically refers to the process of combining data from multiple sources, formats, or databases into a unified format that can be analyzed or used for further processing.
+"""
 
 # -------------------------------------i. Integrating GP Surgeries Data by Postal Code ---------------------------------------------------------------------------------------------
-    """
-    We're going to combine the data from GP surgery with postal code data, creating a unified dataset that includes information from both sources.
-    """
-
-# Load csv data sets
-uk_postcodes = pd.read_csv("data_files/download_data/ukpostcodes.csv") # path to UK postal code csv file
-gp_practices = pd.read_csv("data_files/download_data/gp-practice-reference-file---jan-2024.csv") #path to GP practice csv file
-
-# check the head of uk_postcodes DataFrame
-uk_postcodes.head()
-
-# check the head of gp_practices DataFrame
-gp_practices.head()
-
-# merge datasets base on postal code
-merge_data = pd.merge(uk_postcodes, gp_practices, left_on="postcode", right_on="Postcode" , how="inner")
-
-#check the head of merged data
-merge_data.head()
-
-# Filtering Northern Ireland postcodes
-ni_postcodes_tmp = merge_data[merge_data["postcode"].str.startswith("BT")]
+"""
+We're going to combine the data from GP surgery with postal code data, creating a unified dataset that includes information from both sources.
+"""
 
-# remove unnecessary columns
-ni_postcodes = ni_postcodes_tmp.drop(columns=["id" , "Postcode", "LCG" , "Registered_Patients"])
+report.section("4.i. GP postcodes")
 
-# check the head of DataFrame.
-ni_postcodes.head()
+# The UK postal codes are read once into a prebuilt, memory-mapped postcode index (see postcode_index.py);
+# later runs (e.g. a fresh monthly GP file) only look the GP postcodes up in it, without reading ~1.8M rows.
+# The index is built again when a new ukpostcodes.csv is downloaded (a different size or modification time);
+# once it is built, ukpostcodes.csv can be deleted.
+if not is_index_current(f"{download}/ukpostcodes.csv", "data_files/postcode_index", prefix="BT"):
+    index_postcodes({"uk_postcodes": f"{download}/ukpostcodes.csv"}, {"postcode_index": "data_files/postcode_index"},
+                    prefix="BT")
 
-# convert the Dataframe to a Geodataframe
-ni_postcodes_geo = gpd.GeoDataFrame(ni_postcodes, geometry=gpd.points_from_xy(ni_postcodes.longitude, ni_postcodes.latitude))
-
-# Save the filtered dataset
-ni_postcodes_geo.to_file("data_files/NI_PostCodes_GP.geojson", driver="GeoJSON")
+# geocode the GP practices by postal code (keeps the practices whose postcode is found, as the inner merge did),
+# remove the unnecessary columns and save the GP surgeries as points
+geocode_gp({"gp_practices": f"{download}/gp-practice-reference-file---jan-2024.csv",
+            "postcode_index": "data_files/postcode_index"},
+           {"post_gp": "data_files/NI_PostCodes_GP.geojson"})
 
 
 
 #--------------------------------------------- ii. Distance Calculation ------------------------------------------------------------------------------------------------------------
-    """
-    We'll locate the closest transport hub along with its distance and also identify the nearest GP surgery and its distance from the tourist sites.
-    """
-
-# Read previously projected tourist sites data.
-tourist = gpd.read_file("data_files/NI_Tourist_Sites.shp")  # Path to the input shapefile of projected tourist sites 
-
-#Check the head
-tourist.head()
-
-#Read the downloaded Transport hub "geojson" and transform to Irish Transverse Mercator 
-transport = gpd.read_file("data_files/download_data/translink-stations-ni.geojson").to_crs("epsg:2157")
-
-# Read the previously integrated "geojson" dataset containing GP surgeries and postal codes and re-Projected to Irish Transverse Mercator coordinate reference system
-post_gp = gpd.read_file("data_files/NI_PostCodes_GP.geojson").to_crs("epsg:2157")
-
-# for each tourist site centroid,find the closest bus/train station
-# Record the Shortest distance in km and the name of the station.
-for ind, row in tourist.to_crs("epsg:2157").iterrows():
-    pt = row["geometry"].centroid # get the centroid of the each tourist site polygon.
-    
-    distance_trans = transport.distance(pt) # find the distance between the centroid and all train station
-    distance_postgp = post_gp.distance(pt) # find the distance between the centroid and all GP pratices
-    
-    min_ind_trans = distance_trans.argmin() # get the index of minimum value
-    min_dist_trans = distance_trans.min() # get the minimum distance
-
-    min_ind_postgp = distance_postgp.argmin()
-    min_dist_postgp = distance_postgp.min()
+"""
+We'll locate the closest transport hub along with its distance and also identify the nearest GP surgery and its distance from the tourist sites.
+"""
 
-    # define column head
-    tourist.loc[ind, "Near_T_Hub"] = transport.loc[min_ind_trans].Station.title() # assigns the name of the nearest transport hub and capitalizes the first letter of each word in the station name
-    tourist.loc[ind, "Near_GP"] = post_gp.loc[min_ind_postgp].PracticeName #assigns the name of the nearest GP Surgery
+report.section("4.ii. distances")
 
-    # add distance to the closest transport hub
-    tourist.loc[ind, "Trans_Dist"] = min_dist_trans / 1000 # distance in km
-    tourist.loc[ind, "GP_Dist"] = min_dist_postgp / 1000
+# The layers are registered once: each one is re-projected to Irish Transverse Mercator the first time it is needed, and
+# the projected copy (the transport hubs and GP surgeries) is reused by section iii (see layer_registry.py)
+registry = LayerRegistry()
+facilities = {"transport": f"{download}/translink-stations-ni.geojson", "post_gp": "data_files/NI_PostCodes_GP.geojson"}
 
-# round the distance to cm accuracy (2 decimal places)
-tourist.Trans_Dist = tourist.Trans_Dist.round(2)
-tourist.GP_Dist = tourist.GP_Dist.round(2)
+# Optional: a road network extract (.osm.pbf or GraphML) to measure distances along the roads instead of straight lines,
+# e.g. "data_files/download_data/northern-ireland-latest.osm.pbf". Each index then runs one multi-source shortest-path
+# search from all its facilities, and every site is looked up by its nearest road node (see road_network.py).
+road_graph = None
 
-#check the head and verify that all index in the "PracticeName" column are in uppercase.
-# check the head
-tourist.head() # check the head of final data set
+# How the tourist sites are measured: "centroid" (from the middle of each park or garden) or "geometry" (the exact
+# distance from its nearest edge, 0 for a station or surgery inside it). Both are one batched query.
+distance_measure = "centroid"
 
-# check the head
-post_gp.head()
+# Build a spatial index over each facility layer once, then find the closest bus/train station and GP surgery for
+# every tourist site in one batched query (see nearest_facility.py), in km rounded to 2 decimal places.
+# Practices at the same address (e.g. the practices of LIMAVADY HEALTH CENTRE) share one entry of the index; the nearest
+# one found is the first practice listed there. The postcode of the nearest GP practice is attached by its practice
+# number (PracNo), not by its name, so there is exactly one row per tourist site, and so is the county containing a
+# point inside the site polygon (see county_index.py). The output is saved to a CSV file.
+distances({"tourist": "data_files/NI_Tourist_Sites.shp", "counties": "data_files/NI_Counties.shp", **facilities},
+          {"distances": "data_files/NI_Tourist_trans_GP_Dist.csv"},
+          road_graph=road_graph, measure=distance_measure, registry=registry)
 
-# Filter necessary columns
-tourist_out = pd.DataFrame(tourist[["SITE", "Near_T_Hub","Trans_Dist","Near_GP", "GP_Dist"]])
 
-# check the head
-tourist_out.head()
 
-# Merge DataFrame and GeoDataFrame
-merged = pd.merge(post_gp, tourist_out,left_on="PracticeName", right_on="Near_GP", how="inner")
-
-# check the head
-merged.head()
-
-#Filter necessary coloumns
-output = pd.DataFrame(merged[["SITE", "Near_T_Hub","Trans_Dist","Near_GP", "GP_Dist","postcode"]])
-
-# rename specified columns to defined new names
-output.rename(columns={"SITE":"Tourist Sites", "postcode":"PostCode"},inplace=True)
-
-# saves the output DataFrame to a CSV file.
-output.to_csv("data_files/NI_Tourist_trans_GP_Dist.csv")
+#--------------------------------------- iii. Coastline spots intergration ------------------------------------------------------------------------------------------------------------------------------
+"""
+We'll locate the closest transport hub along with its distance and also identify the nearest GP surgery and its distance from the Coastline spots.
+"""
 
+report.section("4.iii. coastline spots")
 
+# for each coastline spot (Places_to_Visit_in_Causeway_Coast_and_Glens), find the closest bus/train station and GP
+# surgery, reusing the layers read in section ii. The output is saved to a GeoJSON file.
+coastal({"coastline": f"{download}/Places_to_Visit_in_Causeway_Coast_and_Glens.zip", **facilities},
+        {"coastal": "data_files/NI_Coastal_spots.geojson"}, road_graph=road_graph, registry=registry)
 
-#--------------------------------------- iii. Coastline spots intergration ------------------------------------------------------------------------------------------------------------------------------
-    """
-    We'll locate the closest transport hub along with its distance and also identify the nearest GP surgery and its distance from the Coastline spots.
-    """
-
-# Read Places_to_Visit_in_Causeway_Coast_and_Glens
-coastline_tmp = gpd.read_file("data_files/download_data/Places_to_Visit_in_Causeway_Coast_and_Glens.shp") # Path to the input shapefile of Places to Visit in coastaline data
-
-# check the head
-coastline_tmp.head()
-
-# for each coastline spots ,find the closest bus/train station
-# Record the Shortest distance in km and the name of the station.
-for ind, row in coastline_tmp.to_crs("epsg:2157").iterrows():
-    pt = row["geometry"] # consider geometry point.
-    
-    distance_trans = transport.distance(pt) # find the distance between the coastline spots and all train station
-    distance_postgp = post_gp.distance(pt) # find the distance between the coastline spots and all GP pratices
-    
-    min_ind_trans = distance_trans.argmin() # get the index of minimum value
-    min_dist_trans = distance_trans.min() # get the minimum distance
-
-    min_ind_postgp = distance_postgp.argmin()
-    min_dist_postgp = distance_postgp.min()
-
-    # define column head
-    coastline_tmp.loc[ind, "Near_T_Hub"] = transport.loc[min_ind_trans].Station.title() # assigns the name of the nearest transport hub and capitalizes the first letter of each word in the station name
-    coastline_tmp.loc[ind, "Near_GP"] = post_gp.loc[min_ind_postgp].PracticeName #assigns the name of the nearest GP Surgery
-
-    # add distance to the closest transport hub
-    coastline_tmp.loc[ind, "Trans_Dist"] = min_dist_trans / 1000 # distance in km
-    coastline_tmp.loc[ind, "GP_Dist"] = min_dist_postgp / 1000
-
-# round the distance to cm accuracy (2 decimal places)
-coastline_tmp.Trans_Dist = coastline_tmp.Trans_Dist.round(2)
-coastline_tmp.GP_Dist = coastline_tmp.GP_Dist.round(2)
-
-# check the head
-coastline_tmp.head()
-
-# This code filters the necessary columns 
-coastal_out = gpd.GeoDataFrame(coastline_tmp[["Name", "Website","geometry", "Near_T_Hub","Trans_Dist","Near_GP", "GP_Dist","Postcode"]])
-# reprojected
-coastal_out.to_crs("epsg:4326")
-# saves the output DataFrame to a CSV file.
-coastal_out.to_file("data_files/NI_Coastal_spots.geojson",driver="GeoJSON")
+# Save the run report (only written when NI_RUN_REPORT is set)
+report.finish("data_files/reports")
 
 #======================================================= End of 4. =============================================================================================================
 
@@ -259,6 +167,7 @@ coastal_out.to_file("data_files/NI_Coastal_spots.geojson",driver="GeoJSON")
 
 
 
+
 #===================================================== End of Script ===========================================================================================================
 
 
@@ -13,10 +13,46 @@
 
 #================================================== Importing Libraries =========================================================================
 
+import json
 import os
 import pandas as pd
 import geopandas as gpd
 import folium
+from matplotlib import colormaps
+from matplotlib.colors import to_hex
+from county_index import assign_counties
+from map_data import load_map_layers, print_timings
+from map_payloads import save_external
+from point_clusters import add_clustered_points
+from run_report import enabled_by_environment, start_run
+from simplify_tiers import add_zoom_tiers
+from vector_tiles import add_vector_tile_layer, export_mbtiles
+
+# Format of the data_files written by the analysis: "native" (shapefile/GeoJSON/CSV), "parquet" or "feather"
+# (see analysis_pipeline.py --output-format). Only the columns used by the map are read.
+data_format = "native"
+
+# Largest zoom level of the map (18, street level). The polygons are added once per simplification tier of
+# simplify_tiers.py, each shown only at its own zoom levels: ~100 m vertices up to zoom 9 (regional views), finer ones
+# up to zoom 14, and the full-resolution geometry beyond. A smaller zoom level (e.g. 9) ships fewer tiers.
+map_zoom = 18
+
+# How the coastal spots are drawn: "markers" (one Leaflet marker per spot) or "cluster" (the points are written once as
+# a compact array and clustered in the browser, see point_clusters.py). "cluster" also adds the GP surgeries.
+point_mode = "markers"
+
+# True to also export the layers as vector tiles (data_files/NI_tiles.mbtiles) and a map that loads them from a
+# local tile server (see vector_tiles.py): python vector_tiles.py data_files/NI_tiles.mbtiles
+export_tiles = False
+
+# How the map is saved: "inline" (the layer data inside NI_tourist_MAP.html) or "external" (each GeoJSON layer in its
+# own file in NI_tourist_MAP_data, with gzip and brotli copies, fetched by the page; see map_payloads.py). The
+# external map has to be opened over HTTP: python map_payloads.py NI_tourist_MAP.html
+save_mode = "inline"
+
+# Time each section (wall and CPU time, peak memory) when the NI_RUN_REPORT environment variable is set to 1;
+# the JSON report is saved to data_files/reports at the end of the script (see run_report.py)
+report = start_run("NI_TouristMap", enabled=enabled_by_environment())
 
 
 
@@ -24,9 +60,17 @@ import folium
 
 #================================================== Reading Geospatial Data =========================================================================
 
-# Read the shapefiles
-outline = gpd.read_file(os.path.abspath("data_files/NI_Outline.shp")) # Path to the input shapefile of Country Outline data 
-counties = gpd.read_file(os.path.abspath("data_files/NI_Counties.shp")) # Path to the input shapefile of Counties data 
+report.section("reading layers")
+
+# Read all the map layers at once, in parallel threads (see map_data.py): the outline, counties, distance CSV,
+# tourist sites and coastal spots, and the GP surgeries for the clustered map. Only the columns used by the map are read.
+layers = load_map_layers(os.path.abspath("data_files"), data_format, skip=() if point_mode == "cluster" else ("gp",))
+
+# Time taken by each read
+print_timings(layers.timings)
+
+outline = layers.outline # Country Outline data
+counties = layers.counties # Counties data
 
 
 
@@ -34,18 +78,26 @@ counties = gpd.read_file(os.path.abspath("data_files/NI_Counties.shp")) # Path t
 
 #================================================== Creating a Base Folium Map =========================================================================
 
-# Create a Base Map on Counties name.
-m = counties.explore("CountyName", cmap = "Set2")
+report.section("base map")
+
+# Simplified copies of the outline and counties for display, one per zoom tier (cached in data_files/simplified).
+# The counties tile the country, so they are simplified as a coverage: neighbouring counties keep their shared edges.
+# The outline is simplified on its own, so along the coast its line can be up to the tolerance (~100 m up to zoom 9,
+# about half a pixel) away from the edge of the counties.
+
+# Create a Base Map on Counties name, zoomable up to map_zoom.
+m = add_zoom_tiers(counties, column="CountyName", name="counties", coverage=True, max_zoom=map_zoom, cmap="Set2")
 
 # Adding Country outline into Base folium map
-folium.GeoJson(
-    outline, # outline shape data
-    style_function=lambda feature: {  # customize the style of the GeoJSON features
-        "color": "black",  # sets the color of the outline to black
-        "fillOpacity": 0 # sets the fill opacity as transparent
-    },
-    name="outline" #name of the GeoJson layer
-).add_to(m) #adds the GeoJson layer to the base folium map _m_.
+add_zoom_tiers(
+    outline, m, # outline shape data, added to the base folium map _m_
+    name="outline", # name of the GeoJson layers
+    coverage=True,
+    max_zoom=map_zoom,
+    style_kwds={"color": "black", # sets the color of the outline to black
+                "fillOpacity": 0}, # sets the fill opacity as transparent
+    tooltip=False, highlight=False # no attribute tooltip, as the plain GeoJson layer
+)
 
 # Display the base folium map
 m
@@ -56,15 +108,17 @@ m
 
 #============================= Convert DataFrame to GeoDataFrame, Display Popups and Plotting Geographic Data (Tourist Sites) ================================
 
+report.section("tourist sites")
+
 # Read DataFrame
-#read intergrated csv file
-df = pd.read_csv("data_files/NI_Tourist_trans_GP_Dist.csv")
+#intergrated csv file
+df = layers.distances
 
 # Check the first few rows of df 
 df.head()
 
 # read tourist site polygon data
-tourist = gpd.read_file(os.path.abspath("data_files/NI_Tourist_Sites.shp")) # path to the tourist site shapefile data
+tourist = layers.tourist # tourist site shapefile data
 
 # Displaying the column names of the shapefile.
 tourist.columns
@@ -79,8 +133,17 @@ visit_filter = merge_site[["Tourist Sites", "Near_T_Hub","Trans_Dist","Near_GP",
 visit_geo = gpd.GeoDataFrame(visit_filter)
 visit_geo.head()
 
-# Merge Two GeoDataFrames to attach county name
-visit_merge = gpd.sjoin(visit_geo,counties,how="inner")
+# Attach the county name: the analysis assigns exactly one county per site and writes it to the distance file
+# (see county_index.py), so there is no spatial join here. Distance files from older runs don't have the column;
+# their sites are assigned here, the same way.
+visit_merge = visit_geo.copy()
+if "CountyName" in merge_site:
+    visit_merge["CountyName"] = merge_site["CountyName"]
+else:
+    visit_merge["CountyName"] = assign_counties(visit_merge, counties)
+
+# Sites overlapping no county have no county name: they are left out of the map, as the inner spatial join did.
+visit_merge = visit_merge[visit_merge["CountyName"].notna()]
 
 # Check the Head 
 visit_merge.head()
@@ -92,13 +155,15 @@ visit_all.head()
 
 # display the Geodatabase on the folium map and popup the attribute information.
 
-# Display Created GeoDataframe on the base Map
-visit_all.explore("CountyName", # show the CountyName column
-                  cmap="gist_rainbow", # use the "hsv" colormap from matplotlib
-                  m=m, # set the base folium.map
-                  popup = True, #Show information as popup when curser move on to the polygon
-                  legend = False, #Don`t display a separated legend.
-)                  
+# Display Created GeoDataframe on the base Map, simplified per zoom tier (the county join above used the full geometries).
+add_zoom_tiers(visit_all, m, # set the base folium.map
+               "CountyName", # show the CountyName column
+               name="tourist sites",
+               max_zoom=map_zoom,
+               cmap="gist_rainbow", # use the "hsv" colormap from matplotlib
+               popup = True, #Show information as popup when curser move on to the polygon
+               legend = False, #Don`t display a separated legend.
+)
 
 
 
@@ -106,8 +171,10 @@ visit_all.explore("CountyName", # show the CountyName column
 
 #============================================== Adding Coastline visit spots into Folim map =================================================================
 
-# read geojason file
-coastalpt = gpd.read_file(os.path.abspath("data_files/NI_Coastal_spots.geojson"))
+report.section("coastal spots")
+
+# coastal spots geojason file
+coastalpt = layers.coastal
 
 # Display head
 coastalpt.head()
@@ -122,7 +189,23 @@ coastalpt_args = {
 }
 
 # Display the "coastalpt" Marker on the folium map with the customized marker dictionary
-coastalpt.explore ("Name", **coastalpt_args)
+if point_mode == "cluster":
+    add_clustered_points(m, coastalpt, ["Name", "Website", "Near_T_Hub", "Trans_Dist", "Near_GP", "GP_Dist", "Postcode"],
+                         name="Coastal spots") # red star markers, as above
+else:
+    coastalpt.explore ("Name", name="coastal spots", **coastalpt_args)
+
+
+
+
+
+#============================================== Adding GP Surgeries into Folim map (cluster mode) =================================================================
+
+# GP surgeries with their postal code, clustered (~300 points: too many for one marker object each)
+if point_mode == "cluster":
+    report.section("GP surgeries")
+    add_clustered_points(m, layers.gp, ["PracticeName", "Address1", "Address2", "Address3", "postcode"],
+                         name="GP surgeries", color="blue", icon="user-md")
 
 
 
@@ -130,8 +213,50 @@ coastalpt.explore ("Name", **coastalpt_args)
 
 #========================================================= Exporting Folium Map ==========================================================================
 
+report.section("saving map")
+
 # Export the Folium Map
-m.save("NI_tourist_MAP.html")
+if save_mode == "external":
+    save_external(m, "NI_tourist_MAP.html") # the brotli copies are only written when the brotli package is installed
+else:
+    m.save("NI_tourist_MAP.html")
+
+
+
+
+
+
+#========================================================= Exporting Vector Tile Map ==========================================================================
+
+if export_tiles:
+    report.section("vector tiles")
+
+    # Cut the full-resolution layers into vector tiles; only the zoom levels whose data changed are rebuilt, one per CPU
+    # at a time, from the simplified layers cached for the map (data_files/simplified).
+    # The tourist site polygons are smaller than a pixel below zoom 8, so they are only tiled from zoom 8: an update
+    # of the sites leaves the zoom 6 and 7 tiles as they are.
+    tile_layers = {"counties": counties,
+                   "sites": visit_merge[["Tourist Sites", "Near_T_Hub", "Trans_Dist", "Near_GP", "GP_Dist", "PostCode", "geometry", "CountyName"]],
+                   "coastal": coastalpt}
+    export_mbtiles(tile_layers, "data_files/NI_tiles.mbtiles", coverage_layers=["counties"], layer_zooms={"sites": (8, 14)})
+
+    # Colour the counties as on the GeoJSON map (Set2 colours by county name).
+    names = sorted(counties["CountyName"].unique())
+    county_colors = {name: to_hex(colormaps["Set2"](i % 8)) for i, name in enumerate(names)}
+    tile_styles = {
+        "counties": f"function (p) {{ return {{fill: true, fillColor: ({json.dumps(county_colors)})[p.CountyName], fillOpacity: 0.5, color: 'black', weight: 1}}; }}",
+        "sites": {"fill": True, "fillColor": "#e7298a", "fillOpacity": 0.7, "color": "#e7298a", "weight": 1},
+        "coastal": {"radius": 6, "fill": True, "fillColor": "red", "fillOpacity": 0.9, "color": "white", "weight": 1},
+    }
+
+    bounds = counties.total_bounds
+    m_tiles = folium.Map()
+    m_tiles.fit_bounds([[bounds[1], bounds[0]], [bounds[3], bounds[2]]])
+    add_vector_tile_layer(m_tiles, "http://localhost:8765/{z}/{x}/{y}.pbf", tile_styles)
+    m_tiles.save("NI_tourist_MAP_tiles.html")
+
+# Save the run report (only written when NI_RUN_REPORT is set)
+report.finish("data_files/reports")
 
 
 # You have successfully generated the tourist map for Northern Ireland.
@@ -0,0 +1,393 @@
+# Repository : https://github.com/sereneeosman/egm722_serenee
+
+#========================================= Integrated Data Analysis Pipeline =====================================================================================================
+#================================================================================================================================================================================
+"""
+The sections of ``Integrated_Data_Analysis.py`` as incremental pipeline stages (the script runs the same stage
+functions, every time, in order).
+
+Stages (in order): fix outline -> reproject parks -> clip counties -> postcode index -> GP geocode -> distances ->
+coastal. Each stage only reruns when one of its input files (by content hash) or parameters changed, see
+:mod:`pipeline`. When a new monthly GP reference file lands, only the GP geocode, distances and coastal stages
+(and their exports) rerun.
+
+Run from the ``NI_TouristMap`` folder::
+
+    python analysis_pipeline.py
+    python analysis_pipeline.py --gp-practices data_files/download_data/gp-practice-reference-file---feb-2024.csv
+    python analysis_pipeline.py --output-format parquet
+    python analysis_pipeline.py --metrics-sink udp://127.0.0.1:8125
+    python analysis_pipeline.py --road-graph data_files/download_data/northern-ireland-latest.osm.pbf
+
+With ``--output-format parquet`` (or ``feather``) every output is written as GeoParquet (or Feather) next to the
+native file names, e.g. ``data_files/NI_Tourist_Sites.parquet``, see :mod:`columnar_io`.
+
+With ``--road-graph``, ``Trans_Dist`` and ``GP_Dist`` are road distances along the given network extract instead of
+straight lines, see :mod:`road_network`.
+
+Each run writes a JSON report of the stages that ran (wall and CPU time, peak memory, rows and bytes read and
+written) to ``data_files/reports``, see :mod:`run_report`. ``--no-report`` turns it off.
+"""
+
+import argparse
+import functools
+import os
+
+import pandas as pd
+import geopandas as gpd
+
+from archive_reader import read_layer
+from columnar_io import output_path, read_output, write_output
+from county_index import assign_counties
+from distance_cache import DistanceCache
+from geometry_repair import repair_geometries
+from layer_registry import LayerRegistry
+from mask_clip import clip_to_mask
+from nearest_facility import ITM_CRS, MEASURE_MODES, assign_nearest, build_facility_indexes
+from pipeline import Pipeline, Stage
+from postcode_index import PostcodeIndex, build_postcode_index, is_index_current
+from road_network import NetworkFacilityIndex, read_road_graph
+from run_report import REPORTS_FOLDER, count_rows, metrics_sink, start_run
+
+# Default GP practice reference file, in the download_data folder.
+GP_PRACTICES_FILE = "gp-practice-reference-file---jan-2024.csv"
+
+# Folder of the nearest-facility results kept between runs, in the data folder (see distance_cache.py).
+DISTANCE_CACHE_FOLDER = "distance_cache"
+
+
+#================================================================== Stages ======================================================================================================
+
+def fix_outline(inputs, outputs, crs):
+    """
+    Repair the invalid NI outline geometries and re-project them (section 1), see :mod:`geometry_repair`.
+
+    Parameters
+    ----------
+    inputs : dict
+        ``{"outline": path}`` to the downloaded NI outline (zipped) shapefile.
+    outputs : dict
+        ``{"outline": path}`` to the fixed outline shapefile.
+    crs : str
+        The output CRS.
+
+    Returns
+    -------
+    geometry_repair.RepairReport
+        How many geometries (and parts) were checked and repaired.
+    """
+    input_data = read_layer(inputs["outline"])
+    fix_data, report = repair_geometries(input_data.geometry)
+    fixed_data = gpd.GeoDataFrame(geometry=fix_data.to_crs(crs))
+    write_output(fixed_data, outputs["outline"])
+    count_rows(rows_in=len(input_data), rows_out=len(fixed_data))
+    return report
+
+
+def reproject_parks(inputs, outputs, crs):
+    """
+    Re-project the Historic Parks and Gardens (section 2).
+
+    Parameters
+    ----------
+    inputs : dict
+        ``{"parks": path}`` to the downloaded Historic Parks and Gardens (zipped) shapefile.
+    outputs : dict
+        ``{"tourist": path}`` to the re-projected tourist sites shapefile.
+    crs : str
+        The output CRS.
+    """
+    parks = read_layer(inputs["parks"]).to_crs(crs)
+    write_output(parks, outputs["tourist"])
+    count_rows(rows_in=len(parks), rows_out=len(parks))
+
+
+def clip_counties(inputs, outputs, crs):
+    """
+    Clip the county boundaries with the fixed NI outline (section 3).
+
+    Parameters
+    ----------
+    inputs : dict
+        ``{"counties": path, "outline": path}`` to the downloaded (zipped) counties and the fixed outline shapefiles.
+    outputs : dict
+        ``{"counties": path}`` to the clipped counties shapefile.
+    crs : str
+        The output CRS.
+    """
+    prj_counties = read_layer(inputs["counties"]).to_crs(crs)
+    clip_data = read_output(inputs["outline"]).to_crs(crs)
+    clipped_counties = clip_to_mask(prj_counties, clip_data)
+    write_output(clipped_counties, outputs["counties"])
+    count_rows(rows_in=len(prj_counties) + len(clip_data), rows_out=len(clipped_counties))
+
+
+def index_postcodes(inputs, outputs, prefix, dtype="float64"):
+    """
+    Build the memory-mapped postcode index from the UK postcode file (section 4.i).
+
+    Parameters
+    ----------
+    inputs : dict
+        ``{"uk_postcodes": path}`` to ``ukpostcodes.csv``.
+    outputs : dict
+        ``{"postcode_index": path}`` to the index folder.
+    prefix : str
+        Only index postcodes starting with this prefix.
+    dtype : str, optional
+        The type of the stored coordinates (see :func:`postcode_index.build_postcode_index`).
+    """
+    indexed = build_postcode_index(inputs["uk_postcodes"], outputs["postcode_index"], prefix=prefix, dtype=dtype)
+    count_rows(rows_out=indexed)
+
+
+def postcode_index_kept(inputs, outputs, prefix, dtype="float64"):
+    """
+    Check whether the postcode index can be kept when ``ukpostcodes.csv`` is missing (the ``keep_outputs`` check of
+    the ``postcode_index`` stage): the 1.8M-row file is not needed any more once the index is built.
+
+    Parameters
+    ----------
+    inputs, outputs, prefix, dtype
+        As for :func:`index_postcodes`.
+
+    Returns
+    -------
+    bool
+        True if a complete index built with ``prefix`` exists (see :func:`postcode_index.is_index_current`).
+    """
+    return is_index_current(inputs["uk_postcodes"], outputs["postcode_index"], prefix=prefix)
+
+
+def geocode_gp(inputs, outputs):
+    """
+    Geocode the GP practices by postal code (section 4.i).
+
+    Parameters
+    ----------
+    inputs : dict
+        ``{"gp_practices": path, "postcode_index": path}`` to the GP reference file and the postcode index folder.
+    outputs : dict
+        ``{"post_gp": path}`` to the GP surgeries GeoJSON file.
+    """
+    gp_practices = pd.read_csv(inputs["gp_practices"])
+    ni_postcodes_tmp = PostcodeIndex(inputs["postcode_index"]).geocode(gp_practices, "Postcode")
+    ni_postcodes = ni_postcodes_tmp.drop(columns=["Postcode", "LCG", "Registered_Patients"])
+
+    ni_postcodes_geo = gpd.GeoDataFrame(ni_postcodes,
+                                        geometry=gpd.points_from_xy(ni_postcodes.longitude, ni_postcodes.latitude),
+                                        crs="epsg:4326")
+    write_output(ni_postcodes_geo, outputs["post_gp"])
+    count_rows(rows_in=len(gp_practices), rows_out=len(ni_postcodes_geo))
+
+
+def _title_stations(transport):
+    """Capitalise the first letter of each word of the station names."""
+    transport["Station"] = transport["Station"].str.title()
+    return transport
+
+
+def _facility_layers(inputs, registry, road_graph=None):
+    """Build the transport hub and GP surgery indexes used by the distance stages (by road with a ``road_graph``)."""
+    # read (and re-projected) once per run: the distance and coastal stages share the registry
+    registry.read("transport", inputs["transport"], prepare=_title_stations)
+    registry.read("post_gp", inputs["post_gp"])
+
+    facility_layers = {("Near_T_Hub", "Trans_Dist"): ("transport", "Station"),
+                       ("Near_GP", "GP_Dist", "Near_GP_No"): ("post_gp", "PracticeName", "PracNo")}
+    if road_graph is None:
+        return build_facility_indexes(facility_layers, registry=registry)
+
+    # one multi-source Dijkstra per facility layer over the road network (read once per run)
+    graph = read_road_graph(road_graph)
+    return {columns: NetworkFacilityIndex(registry.get(name, ITM_CRS), name_column, graph, *key_column)
+            for columns, (name, name_column, *key_column) in facility_layers.items()}
+
+
+def distances(inputs, outputs, road_graph=None, measure="centroid", registry=None, cache=None):
+    """
+    Find the nearest transport hub and GP surgery, and the county, of every tourist site (section 4.ii).
+
+    The county is assigned once here (one county per site, see :mod:`county_index`), so the map does not repeat the
+    spatial join.
+
+    Parameters
+    ----------
+    inputs : dict
+        ``{"tourist": path, "transport": path, "post_gp": path, "counties": path}``.
+    outputs : dict
+        ``{"distances": path}`` to the output CSV file.
+    road_graph : str, optional
+        A road network extract to measure road distances along (see :mod:`road_network`); straight lines if None.
+    measure : str, optional
+        ``"centroid"`` (default) to measure the straight-line distances from the centroid of each site, or
+        ``"geometry"`` from its nearest edge (see :func:`nearest_facility.query_points`).
+    registry : layer_registry.LayerRegistry, optional
+        The layers of the run, shared with the other stages (default: a new registry).
+    cache : distance_cache.DistanceCache, optional
+        Earlier results, so only the changed sites and facilities are searched again.
+    """
+    registry = registry or LayerRegistry()
+    facility_layers = _facility_layers(inputs, registry, road_graph)
+    registry.read("tourist", inputs["tourist"], columns=["SITE"])
+    tourist = assign_nearest("tourist", facility_layers, registry, measure, cache)
+
+    # one row per site: the nearest GP's postcode is taken by practice number, not merged on the practice name
+    gp_index = facility_layers[("Near_GP", "GP_Dist", "Near_GP_No")]
+    tourist["postcode"] = gp_index.take(gp_index.positions(tourist["Near_GP_No"]), "postcode")
+    tourist["CountyName"] = assign_counties(tourist, registry.read("counties", inputs["counties"], columns=["CountyName"]))
+
+    output = pd.DataFrame(tourist[["SITE", "Near_T_Hub", "Trans_Dist", "Near_GP", "GP_Dist", "postcode", "CountyName"]])
+    output.rename(columns={"SITE": "Tourist Sites", "postcode": "PostCode"}, inplace=True)
+    write_output(output, outputs["distances"])
+    count_rows(rows_in=len(tourist), rows_out=len(output))
+
+
+def coastal(inputs, outputs, road_graph=None, registry=None, cache=None):
+    """
+    Find the nearest transport hub and GP surgery of every coastline spot (section 4.iii).
+
+    Parameters
+    ----------
+    inputs : dict
+        ``{"coastline": path, "transport": path, "post_gp": path}``, the coastline spots being a (zipped) shapefile.
+    outputs : dict
+        ``{"coastal": path}`` to the output GeoJSON file.
+    road_graph : str, optional
+        A road network extract to measure road distances along (see :mod:`road_network`); straight lines if None.
+    registry : layer_registry.LayerRegistry, optional
+        The layers of the run, shared with the other stages (default: a new registry).
+    cache : distance_cache.DistanceCache, optional
+        Earlier results, so only the changed spots and facilities are searched again.
+    """
+    registry = registry or LayerRegistry()
+    facility_layers = _facility_layers(inputs, registry, road_graph)
+    registry.read("coastline", inputs["coastline"])
+    coastline_tmp = assign_nearest("coastline", facility_layers, registry, cache=cache)
+
+    coastal_out = gpd.GeoDataFrame(coastline_tmp[["Name", "Website", "geometry", "Near_T_Hub", "Trans_Dist",
+                                                  "Near_GP", "GP_Dist", "Postcode"]])
+    write_output(coastal_out, outputs["coastal"])
+    count_rows(rows_in=len(coastline_tmp), rows_out=len(coastal_out))
+
+
+#================================================================== Pipeline ====================================================================================================
+
+def build_pipeline(data_folder="data_files", gp_practices=None, crs="epsg:4326", output_format="native",
+                   road_graph=None, measure="centroid", distance_cache=True):
+    """
+    Build the Integrated Data Analysis pipeline.
+
+    Parameters
+    ----------
+    data_folder : str, optional
+        The folder the outputs (and the pipeline state file) are written to.
+    gp_practices : str, optional
+        Path to the GP practice reference file (a new one is published monthly). Defaults to the January 2024
+        file in ``download_data``.
+    crs : str, optional
+        The CRS of the outline, tourist sites and counties outputs (default EPSG:4326).
+    output_format : str, optional
+        ``"native"`` (shapefile/GeoJSON/CSV, default), ``"parquet"`` or ``"feather"``.
+    road_graph : str, optional
+        A road network extract (``.osm.pbf`` or GraphML) to measure the distances along, instead of straight lines
+        (see :mod:`road_network`).
+    measure : str, optional
+        ``"centroid"`` (default) or ``"geometry"``: measure the distances of the tourist sites from their centroid or
+        from their nearest edge (the coastline spots are points either way).
+    distance_cache : bool, optional
+        Keep the straight-line nearest-facility results in ``data_folder/distance_cache``, so that a new GP file
+        (or a changed site) only costs a search for what changed (default True, see :mod:`distance_cache`).
+
+    Returns
+    -------
+    Pipeline
+        The pipeline, ready to :meth:`~pipeline.Pipeline.run`.
+
+    Examples
+    --------
+    >>> build_pipeline().run()
+    """
+    download = os.path.join(data_folder, "download_data")
+    out = {"outline": "NI_Outline.shp",
+           "tourist": "NI_Tourist_Sites.shp",
+           "counties": "NI_Counties.shp",
+           "post_gp": "NI_PostCodes_GP.geojson",
+           "distances": "NI_Tourist_trans_GP_Dist.csv",
+           "coastal": "NI_Coastal_spots.geojson"}
+    out = {name: output_path(os.path.join(data_folder, filename), output_format) for name, filename in out.items()}
+    out["postcode_index"] = os.path.join(data_folder, "postcode_index")
+    transport = os.path.join(download, "translink-stations-ni.geojson")
+    gp_practices = gp_practices or os.path.join(download, GP_PRACTICES_FILE)
+    # the transport hubs and GP surgeries are read and re-projected once for both distance stages
+    registry = LayerRegistry()
+    # the road network is an input of both distance stages (hashed like the other inputs) and a parameter
+    network = {"road_graph": road_graph} if road_graph else {}
+    # results kept between runs; the cache never changes the outputs, so it is not a stage parameter
+    cache = None
+    if distance_cache and not road_graph:
+        cache = DistanceCache(os.path.join(data_folder, DISTANCE_CACHE_FOLDER),
+                              id_columns={"tourist": "SITE", "coastline": "Name"})
+
+    stages = [
+        Stage("fix_outline", fix_outline,
+              inputs={"outline": os.path.join(download, "OSNI_Open_Data_-_Largescale_Boundaries_-_NI_Outline.zip")},
+              outputs={"outline": out["outline"]},
+              params={"crs": crs}),
+        Stage("reproject_parks", reproject_parks,
+              inputs={"parks": os.path.join(download, "historic-parks-and-gardens.zip")},
+              outputs={"tourist": out["tourist"]},
+              params={"crs": crs}),
+        Stage("clip_counties", clip_counties,
+              inputs={"counties": os.path.join(download, "OSNI_Open_Data_-_Largescale_Boundaries_-_County_Boundaries_.zip"),
+                      "outline": out["outline"]},
+              outputs={"counties": out["counties"]},
+              params={"crs": crs}),
+        Stage("postcode_index", index_postcodes,
+              inputs={"uk_postcodes": os.path.join(download, "ukpostcodes.csv")},
+              outputs={"postcode_index": out["postcode_index"]},
+              params={"prefix": "BT", "dtype": "float64"},
+              keep_outputs=postcode_index_kept),
+        Stage("geocode_gp", geocode_gp,
+              inputs={"gp_practices": gp_practices, "postcode_index": out["postcode_index"]},
+              outputs={"post_gp": out["post_gp"]}),
+        Stage("distances", functools.partial(distances, registry=registry, cache=cache),
+              inputs={"tourist": out["tourist"], "transport": transport, "post_gp": out["post_gp"],
+                      "counties": out["counties"], **network},
+              outputs={"distances": out["distances"]},
+              params={"road_graph": road_graph, "measure": measure}),
+        Stage("coastal", functools.partial(coastal, registry=registry, cache=cache),
+              inputs={"coastline": os.path.join(download, "Places_to_Visit_in_Causeway_Coast_and_Glens.zip"),
+                      "transport": transport, "post_gp": out["post_gp"], **network},
+              outputs={"coastal": out["coastal"]},
+              params={"road_graph": road_graph}),
+    ]
+    return Pipeline(stages, os.path.join(data_folder, ".pipeline_state.json"))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the Integrated Data Analysis stages that are out of date.")
+    parser.add_argument("--data-folder", default="data_files", help="folder holding download_data and the outputs")
+    parser.add_argument("--gp-practices", default=None, help="GP practice reference CSV file")
+    parser.add_argument("--output-format", default="native", choices=["native", "parquet", "feather"],
+                        help="format of the outputs written to the data folder")
+    parser.add_argument("--force", nargs="*", default=None, help="stage names to rerun (no name: all stages)")
+    parser.add_argument("--no-report", action="store_true", help="do not write the JSON run report")
+    parser.add_argument("--metrics-sink", default=None,
+                        help="also send each stage's metrics to udp://host:port (StatsD) or append them to a JSONL file")
+    parser.add_argument("--road-graph", default=None,
+                        help="road network extract (.osm.pbf or GraphML) to measure road distances instead of straight lines")
+    parser.add_argument("--measure", default="centroid", choices=list(MEASURE_MODES),
+                        help="measure the tourist sites from their centroid or from their nearest edge")
+    parser.add_argument("--no-distance-cache", action="store_true",
+                        help="search every site again instead of reusing the results kept in distance_cache")
+    args = parser.parse_args()
+
+    report = start_run("analysis_pipeline", metrics_sink(args.metrics_sink), enabled=not args.no_report)
+    force = False if args.force is None else (args.force or True)
+    status = build_pipeline(args.data_folder, args.gp_practices, output_format=args.output_format,
+                            road_graph=args.road_graph, measure=args.measure,
+                            distance_cache=not args.no_distance_cache).run(force=force)
+    for name, result in status.items():
+        print(f"{name:16s} {result}")
+    report.finish(os.path.join(args.data_folder, REPORTS_FOLDER))
@@ -0,0 +1,148 @@
+# Repository : https://github.com/sereneeosman/egm722_serenee
+
+#========================================= Zip Archive Reader ====================================================================================================================
+#================================================================================================================================================================================
+"""
+Read the downloaded shapefiles straight from their zip archives, without extracting them.
+
+GDAL (used by GeoPandas to read files) can open a file inside a zip archive through its ``/vsizip/`` virtual file
+system. This module finds the dataset inside each archive (e.g. ``Historic Parks and Gardens/
+Historic_Parks_and_Gardens20240410.shp`` in ``historic-parks-and-gardens.zip``) and builds the virtual path.
+Archive listings are cached, keyed by the archive's path, size and modification time.
+
+Examples
+--------
+>>> tourist_tmp = read_layer("data_files/download_data/historic-parks-and-gardens.zip")
+>>> archive_members("data_files/download_data/historic-parks-and-gardens.zip", ".shp")
+['Historic Parks and Gardens/Historic_Parks_and_Gardens20240410.shp']
+"""
+
+import functools
+import os
+import zipfile
+
+import geopandas as gpd
+
+# Files GDAL can open as a vector dataset, in order of preference.
+DATASET_SUFFIXES = (".shp", ".geojson", ".gpkg")
+
+
+@functools.lru_cache(maxsize=64)
+def _cached_listing(zip_filepath, size, mtime):
+    """List the members of an archive; ``size`` and ``mtime`` are only part of the cache key."""
+    with zipfile.ZipFile(zip_filepath) as archive:
+        return tuple(info.filename for info in archive.infolist() if not info.is_dir())
+
+
+def archive_members(zip_filepath, suffix=None):
+    """
+    List the files in a zip archive (cached until the archive changes).
+
+    Parameters
+    ----------
+    zip_filepath : str
+        Path to the zip archive.
+    suffix : str, optional
+        Only list members ending with this suffix (case-insensitive), e.g. ``".shp"``.
+
+    Returns
+    -------
+    list of str
+        The member names, as stored in the archive.
+    """
+    zip_filepath = os.path.abspath(zip_filepath)
+    stat = os.stat(zip_filepath)
+    members = _cached_listing(zip_filepath, stat.st_size, stat.st_mtime_ns)
+    if suffix:
+        members = [name for name in members if name.lower().endswith(suffix.lower())]
+    return list(members)
+
+
+def find_dataset(zip_filepath, member=None):
+    """
+    Find the dataset to read inside a zip archive.
+
+    Parameters
+    ----------
+    zip_filepath : str
+        Path to the zip archive.
+    member : str, optional
+        The member to read, or the end of its name (e.g. ``"NI_Outline.shp"``). By default the archive must hold
+        exactly one dataset (shapefile, GeoJSON or GeoPackage).
+
+    Returns
+    -------
+    str
+        The member name of the dataset.
+
+    Raises
+    ------
+    FileNotFoundError
+        If no dataset (or more than one) matches.
+    """
+    members = archive_members(zip_filepath)
+    if member is not None:
+        matches = [name for name in members if name == member or name.endswith("/" + member)]
+    else:
+        matches = []
+        for suffix in DATASET_SUFFIXES:
+            matches = [name for name in members if name.lower().endswith(suffix)]
+            if matches:
+                break
+
+    if len(matches) != 1:
+        raise FileNotFoundError(f"expected one dataset{' ' + member if member else ''} in {zip_filepath}, "
+                                f"found {len(matches)}: {matches}")
+    return matches[0]
+
+
+def archive_path(zip_filepath, member=None):
+    """
+    Build the GDAL virtual path of a dataset inside a zip archive.
+
+    Parameters
+    ----------
+    zip_filepath : str
+        Path to the zip archive.
+    member : str, optional
+        The member to read (see :func:`find_dataset`).
+
+    Returns
+    -------
+    str
+        A ``/vsizip/`` path that ``gpd.read_file`` can open.
+
+    Examples
+    --------
+    >>> archive_path("data_files/download_data/OSNI_Open_Data_-_Largescale_Boundaries_-_NI_Outline.zip")
+    '/vsizip//.../OSNI_Open_Data_-_Largescale_Boundaries_-_NI_Outline.zip/OSNI_Open_Data_-_Largescale_Boundaries_-_NI_Outline.shp'
+    """
+    zip_filepath = os.path.abspath(zip_filepath).replace(os.sep, "/")
+    return f"/vsizip/{zip_filepath}/{find_dataset(zip_filepath, member)}"
+
+
+def read_layer(filepath, member=None, **kwargs):
+    """
+    Read a vector layer from a file, or from inside a zip archive.
+
+    Parameters
+    ----------
+    filepath : str
+        Path to a vector file, or to a zip archive holding one.
+    member : str, optional
+        The member to read when ``filepath`` is a zip archive (see :func:`find_dataset`).
+    **kwargs
+        Passed on to ``gpd.read_file``.
+
+    Returns
+    -------
+    geopandas.geodataframe.GeoDataFrame
+        The layer.
+
+    Examples
+    --------
+    >>> input_data = read_layer("data_files/download_data/OSNI_Open_Data_-_Largescale_Boundaries_-_NI_Outline.zip")
+    """
+    if filepath.lower().endswith(".zip"):
+        filepath = archive_path(filepath, member)
+    return gpd.read_file(filepath, **kwargs)
@@ -0,0 +1,18 @@
+# Repository : https://github.com/sereneeosman/egm722_serenee
+
+#========================================= Benchmarks ============================================================================================================================
+#================================================================================================================================================================================
+"""
+Benchmarks of every stage of ``Integrated_Data_Analysis.py`` and ``NI_TouristMap.py``.
+
+Each stage (shapefile reads, geometry repair, re-projection, clipping, postcode geocoding, nearest-facility search,
+county join, map serialization and saving) is timed and memory-profiled separately, on the bundled ``data_files``
+at 1x, 10x and 100x scale. The results are saved as JSON in ``benchmarks/results``, named by date and git commit, so
+two runs can be compared. Run from the ``NI_TouristMap`` folder::
+
+    python -m benchmarks
+    python -m benchmarks --compare benchmarks/results/<before>.json benchmarks/results/<after>.json
+"""
+
+from .runner import compare_results, measure, run_benchmarks, save_results, speedups
+from .stages import BENCHMARKS, load_inputs, scale_layer
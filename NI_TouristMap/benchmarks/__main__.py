@@ -0,0 +1,34 @@
+# Repository : https://github.com/sereneeosman/egm722_serenee
+
+"""
+Run the benchmarks from the ``NI_TouristMap`` folder::
+
+    python -m benchmarks
+    python -m benchmarks --scales 1 10 --only nearest sjoin_counties
+    python -m benchmarks --compare benchmarks/results/old.json benchmarks/results/new.json
+"""
+
+import argparse
+
+from .runner import SCALES, compare_results, run_benchmarks, save_results, speedups
+from .stages import BENCHMARKS
+
+parser = argparse.ArgumentParser(prog="python -m benchmarks", description="Time and memory-profile each stage of the "
+                                 "analysis and map scripts.")
+parser.add_argument("--data-folder", default="data_files", help="folder holding download_data")
+parser.add_argument("--scales", nargs="+", type=int, default=list(SCALES), help="data scales (default 1 10 100)")
+parser.add_argument("--only", nargs="+", choices=[b.name for b in BENCHMARKS], help="benchmarks to run")
+parser.add_argument("--repeat", type=int, default=3, help="timed runs per benchmark (default 3)")
+parser.add_argument("--output", default=None, help="result JSON file (default benchmarks/results/<date>_<commit>.json)")
+parser.add_argument("--compare", nargs=2, metavar=("BASELINE", "CURRENT"), help="compare two result files")
+parser.add_argument("--threshold", type=float, default=1.2, help="time ratio flagged as a regression (default 1.2)")
+args = parser.parse_args()
+
+if args.compare:
+    print(compare_results(*args.compare, threshold=args.threshold).round(3).to_string())
+else:
+    report = run_benchmarks(args.data_folder, args.scales, args.only, args.repeat)
+    print("Results saved to", save_results(report, args.output))
+    compared = speedups(report)
+    if len(compared):
+        print(compared.round(3).to_string())
@@ -0,0 +1,231 @@
+# Repository : https://github.com/sereneeosman/egm722_serenee
+
+#========================================= Benchmark Runner ======================================================================================================================
+#================================================================================================================================================================================
+"""
+Run the benchmark stages at several scales, save the results as JSON and compare two result files.
+
+Each benchmark is timed ``repeat`` times (the best time is the headline figure), then run once more with
+``tracemalloc`` to measure its peak memory. ``tracemalloc`` sees the memory allocated through Python (including the
+NumPy and pandas arrays), but not the memory GEOS and GDAL allocate themselves.
+"""
+
+import datetime
+import json
+import os
+import platform
+import subprocess
+import tempfile
+import time
+import tracemalloc
+
+import pandas as pd
+
+from .stages import BENCHMARKS, load_inputs
+
+# Default scales: the bundled data, and 10 and 100 times as many features.
+SCALES = (1, 10, 100)
+
+# Default folder of the result files.
+RESULTS_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+
+
+def measure(func, repeat=3):
+    """
+    Time a function and measure its peak traced memory.
+
+    Parameters
+    ----------
+    func : callable
+        The function to measure, called with no arguments.
+    repeat : int, optional
+        The number of timed runs (default 3).
+
+    Returns
+    -------
+    dict
+        ``seconds`` (best run), ``runs`` (every run, in seconds) and ``peak_mb`` (peak traced memory of one more run).
+    """
+    runs = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        runs.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    try:
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {"seconds": min(runs), "runs": runs, "peak_mb": peak / 1e6}
+
+
+def _git_commit():
+    """The current git commit, or None outside a git checkout."""
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _environment():
+    """The versions of Python and the geospatial libraries, saved with the results."""
+    import numpy, shapely, geopandas, pyproj, folium
+
+    return {"python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "numpy": numpy.__version__,
+            "pandas": pd.__version__,
+            "shapely": shapely.__version__,
+            "geos": shapely.geos_version_string,
+            "geopandas": geopandas.__version__,
+            "pyproj": pyproj.__version__,
+            "folium": folium.__version__}
+
+
+def run_benchmarks(data_folder="data_files", scales=SCALES, names=None, repeat=3, verbose=True):
+    """
+    Run the benchmarks.
+
+    Parameters
+    ----------
+    data_folder : str, optional
+        The folder holding ``download_data`` (default ``data_files``).
+    scales : sequence of int, optional
+        The scales to run the scaled benchmarks at (default 1, 10 and 100).
+    names : collection of str, optional
+        The benchmarks to run (default: all, see :data:`stages.BENCHMARKS`).
+    repeat : int, optional
+        The number of timed runs per benchmark and scale (default 3).
+    verbose : bool, optional
+        True to print each result as it is measured.
+
+    Returns
+    -------
+    dict
+        The results: ``created``, ``commit``, ``environment`` and a ``results`` list with one entry per benchmark and
+        scale (``benchmark``, ``scale``, ``seconds``, ``runs``, ``peak_mb``).
+
+    Examples
+    --------
+    >>> results = run_benchmarks(scales=[1, 10], names=["nearest", "sjoin_counties"])
+    """
+    report = {"created": datetime.datetime.now().isoformat(timespec="seconds"),
+              "commit": _git_commit(),
+              "environment": _environment(),
+              "results": []}
+
+    with tempfile.TemporaryDirectory() as workdir:
+        inputs = load_inputs(data_folder, workdir)
+        for benchmark in BENCHMARKS:
+            if names is not None and benchmark.name not in names:
+                continue
+            for scale in (scales if benchmark.scaled else scales[:1]):
+                if benchmark.max_scale is not None and scale > benchmark.max_scale:
+                    continue
+                result = {"benchmark": benchmark.name, "scale": scale if benchmark.scaled else 1}
+                result.update(measure(benchmark.setup(inputs, scale, workdir), repeat))
+                report["results"].append(result)
+                if verbose:
+                    print(f"{benchmark.name:18s} {result['scale']:>4d}x {result['seconds']:9.3f} s "
+                          f"{result['peak_mb']:9.1f} MB")
+    return report
+
+
+def save_results(report, filepath=None):
+    """
+    Save benchmark results as JSON.
+
+    Parameters
+    ----------
+    report : dict
+        The results of :func:`run_benchmarks`.
+    filepath : str, optional
+        The output file (default: ``results/<date>_<commit>.json`` in the benchmarks folder).
+
+    Returns
+    -------
+    str
+        The path of the saved file.
+    """
+    if filepath is None:
+        stamp = report["created"].replace(":", "").replace("-", "")
+        filepath = os.path.join(RESULTS_FOLDER, f"{stamp}_{report['commit'] or 'nogit'}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(filepath)), exist_ok=True)
+    with open(filepath, "w") as f:
+        json.dump(report, f, indent=2)
+    return filepath
+
+
+def compare_results(baseline, current, threshold=1.2):
+    """
+    Compare two benchmark result files.
+
+    Parameters
+    ----------
+    baseline, current : str or dict
+        Result files (or results) of :func:`run_benchmarks`.
+    threshold : float, optional
+        The time ratio (current / baseline) above which a benchmark is flagged as a regression (default 1.2).
+
+    Returns
+    -------
+    pandas.DataFrame
+        One row per benchmark and scale found in both, with the baseline and current times and peak memory, the time
+        ``ratio`` and a ``regression`` flag.
+
+    Examples
+    --------
+    >>> compare_results("benchmarks/results/old.json", "benchmarks/results/new.json")
+    """
+    tables = []
+    for results in (baseline, current):
+        if isinstance(results, str):
+            with open(results) as f:
+                results = json.load(f)
+        table = pd.DataFrame(results["results"]).set_index(["benchmark", "scale"])
+        tables.append(table[["seconds", "peak_mb"]])
+
+    compared = tables[0].join(tables[1], how="inner", lsuffix="_baseline", rsuffix="_current")
+    compared["ratio"] = compared["seconds_current"] / compared["seconds_baseline"]
+    compared["regression"] = compared["ratio"] > threshold
+    return compared
+
+
+def speedups(results):
+    """
+    Compare each optimised stage with the reference benchmark of the original implementation it replaces.
+
+    Parameters
+    ----------
+    results : str or dict
+        A result file (or the results) of :func:`run_benchmarks`.
+
+    Returns
+    -------
+    pandas.DataFrame
+        One row per optimised benchmark and scale measured together with its reference (see
+        :data:`stages.BENCHMARKS`), with both times and the ``speedup`` (reference time / optimised time).
+
+    Examples
+    --------
+    >>> speedups("benchmarks/results/new.json")
+    """
+    if isinstance(results, str):
+        with open(results) as f:
+            results = json.load(f)
+    table = pd.DataFrame(results["results"]).set_index(["benchmark", "scale"])["seconds"]
+    rows = []
+    for benchmark in BENCHMARKS:
+        if benchmark.reference is None:
+            continue
+        for (name, scale), seconds in table.items():
+            if name == benchmark.name and (benchmark.reference, scale) in table.index:
+                rows.append({"benchmark": name, "reference": benchmark.reference, "scale": scale,
+                             "seconds": seconds, "reference_seconds": table[benchmark.reference, scale]})
+    compared = pd.DataFrame(rows, columns=["benchmark", "reference", "scale", "seconds", "reference_seconds"])
+    compared["speedup"] = compared["reference_seconds"] / compared["seconds"]
+    return compared.set_index(["benchmark", "scale"])
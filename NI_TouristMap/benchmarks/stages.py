@@ -0,0 +1,305 @@
+# Repository : https://github.com/sereneeosman/egm722_serenee
+
+#========================================= Benchmark Stages ======================================================================================================================
+#================================================================================================================================================================================
+"""
+The benchmarked stages of ``Integrated_Data_Analysis.py`` and ``NI_TouristMap.py``, and the scaled inputs they run on.
+
+Each benchmark has a ``setup(inputs, scale, workdir)`` function that prepares the data of one scale and returns the
+function to time (called with no arguments, possibly several times). Point and polygon features (tourist sites, GP
+practices, transport hubs) are scaled by :func:`scale_layer`; the outline and the counties are the same at every
+scale, so the benchmarks using only them (``scaled=False``) run once.
+
+The original implementations of the optimised stages (the ``pd.merge`` with the whole UK postcode table, the
+``iterrows`` nearest-distance loop and the ``gpd.overlay`` clip) are kept as reference benchmarks, so every result
+file shows the speedup of each optimised stage over them (see :func:`runner.speedups`). The ``iterrows`` loop measures
+every site against every facility, so it only runs up to 10x.
+"""
+
+import os
+import shutil
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+import shapely
+import geopandas as gpd
+import folium
+
+from archive_reader import read_layer
+from county_index import assign_counties
+from distance_cache import DistanceCache
+from geometry_repair import repair_geometries
+from mask_clip import clip_to_mask
+from nearest_facility import ITM_CRS, FacilityIndex, assign_nearest, query_points
+from postcode_index import PostcodeIndex, build_postcode_index
+from simplify_tiers import simplify_for_zoom
+
+# A benchmarked stage: ``setup(inputs, scale, workdir)`` returns the function to time. ``max_scale`` is the largest
+# scale it runs at (None: every scale), and ``reference`` the name of the benchmark of the original implementation it
+# replaces, if any.
+Benchmark = namedtuple("Benchmark", ["name", "setup", "scaled", "description", "max_scale", "reference"],
+                       defaults=(None, None))
+
+# The inputs read from the data folder (at 1x scale).
+BenchInputs = namedtuple("BenchInputs", ["outline_zip", "counties_zip", "outline", "counties", "sites", "transport",
+                                         "gp_practices", "postcodes_csv"])
+
+
+def load_inputs(data_folder="data_files", workdir="."):
+    """
+    Read the benchmark inputs from the downloaded files.
+
+    Parameters
+    ----------
+    data_folder : str, optional
+        The folder holding ``download_data`` (default ``data_files``).
+    workdir : str, optional
+        A scratch folder. If ``ukpostcodes.csv`` was not downloaded, a postcode file made from the GP surgeries
+        output (``NI_PostCodes_GP.geojson``) is written there instead.
+
+    Returns
+    -------
+    BenchInputs
+        The inputs.
+    """
+    download = os.path.join(data_folder, "download_data")
+    outline_zip = os.path.join(download, "OSNI_Open_Data_-_Largescale_Boundaries_-_NI_Outline.zip")
+    counties_zip = os.path.join(download, "OSNI_Open_Data_-_Largescale_Boundaries_-_County_Boundaries_.zip")
+
+    postcodes_csv = os.path.join(download, "ukpostcodes.csv")
+    if not os.path.exists(postcodes_csv):
+        # stand-in holding only the GP postcodes: postcode_merge then reads a few hundred rows instead of the whole UK
+        # table, so its speedup over postcode_geocode is only representative with ukpostcodes.csv downloaded
+        post_gp = gpd.read_file(os.path.join(data_folder, "NI_PostCodes_GP.geojson"))
+        postcodes_csv = os.path.join(workdir, "postcodes.csv")
+        post_gp[["postcode", "latitude", "longitude"]].drop_duplicates("postcode").to_csv(postcodes_csv)
+
+    transport = gpd.read_file(os.path.join(download, "translink-stations-ni.geojson"))
+    transport["Station"] = transport["Station"].str.title()
+    return BenchInputs(outline_zip=outline_zip,
+                       counties_zip=counties_zip,
+                       outline=read_layer(outline_zip),
+                       counties=read_layer(counties_zip),
+                       sites=read_layer(os.path.join(download, "historic-parks-and-gardens.zip")),
+                       transport=transport,
+                       gp_practices=pd.read_csv(os.path.join(download, "gp-practice-reference-file---jan-2024.csv")),
+                       postcodes_csv=postcodes_csv)
+
+
+def scale_layer(data, scale, jitter=2000.0, seed=0):
+    """
+    Make a layer ``scale`` times bigger by repeating its rows, each copy moved by a random offset.
+
+    Parameters
+    ----------
+    data : geopandas.geodataframe.GeoDataFrame or pandas.DataFrame
+        The layer. Tables without geometry are only repeated.
+    scale : int
+        The number of copies (1 returns ``data``).
+    jitter : float, optional
+        The largest offset of a copy in metres (default 2 km), so copies don't sit on top of each other.
+    seed : int, optional
+        The random seed, so every run gets the same data.
+
+    Returns
+    -------
+    geopandas.geodataframe.GeoDataFrame or pandas.DataFrame
+        The scaled layer, with a 0..n-1 index.
+    """
+    if scale == 1:
+        return data
+    scaled = pd.concat([data] * scale, ignore_index=True)
+    if not isinstance(data, gpd.GeoDataFrame):
+        return scaled
+
+    rng = np.random.default_rng(seed)
+    offsets = rng.uniform(-jitter, jitter, size=(scale, 2))
+    offsets[0] = 0 # the first copy is the original data
+    offsets = np.repeat(offsets, len(data), axis=0)
+    itm = np.asarray(scaled.geometry.to_crs(ITM_CRS).values, dtype=object)
+
+    # move every geometry by the offset of its copy (shapely.transform gets the coordinates of all geometries at once)
+    _, index = shapely.get_coordinates(itm, return_index=True)
+    moved = gpd.GeoSeries(shapely.transform(itm, lambda xy: xy + offsets[index]), crs=ITM_CRS)
+    return scaled.set_geometry(moved.to_crs(data.crs).values, crs=data.crs)
+
+
+#================================================================== Stages ======================================================================================================
+
+def _read_boundaries(inputs, scale, workdir):
+    return lambda: (read_layer(inputs.outline_zip), read_layer(inputs.counties_zip))
+
+
+def _read_sites(inputs, scale, workdir):
+    filepath = os.path.join(workdir, f"sites_{scale}x.shp")
+    scale_layer(inputs.sites, scale).to_file(filepath)
+    return lambda: read_layer(filepath)
+
+
+def _repair(inputs, scale, workdir):
+    return lambda: repair_geometries(inputs.outline.geometry)
+
+
+def _to_crs(inputs, scale, workdir):
+    sites = scale_layer(inputs.sites, scale)
+    return lambda: sites.to_crs("epsg:4326")
+
+
+def _clip(inputs, scale, workdir):
+    counties = inputs.counties.to_crs("epsg:4326")
+    outline = inputs.outline.to_crs("epsg:4326")
+    return lambda: clip_to_mask(counties, outline)
+
+
+def _overlay_clip(inputs, scale, workdir):
+    # the original section 3: an overlay of the counties with the outline
+    counties = inputs.counties.to_crs("epsg:4326")
+    outline = inputs.outline.to_crs("epsg:4326")
+    return lambda: gpd.overlay(counties, outline, how="intersection", keep_geom_type=True)
+
+
+def _postcode_index(inputs, workdir):
+    """Build the postcode index in the scratch folder (once per run)."""
+    index_folder = os.path.join(workdir, "postcode_index")
+    if not os.path.exists(index_folder):
+        build_postcode_index(inputs.postcodes_csv, index_folder, prefix="BT")
+    return index_folder
+
+
+def _postcode_geocode(inputs, scale, workdir):
+    index_folder = _postcode_index(inputs, workdir)
+    gp_practices = scale_layer(inputs.gp_practices, scale)
+    return lambda: PostcodeIndex(index_folder).geocode(gp_practices, "Postcode")
+
+
+def _postcode_merge(inputs, scale, workdir):
+    # the original section 4.i: read the whole postcode table and merge the GP practices with it on every run
+    gp_practices = scale_layer(inputs.gp_practices, scale)
+
+    def run():
+        uk_postcodes = pd.read_csv(inputs.postcodes_csv)
+        merge_data = pd.merge(uk_postcodes, gp_practices, left_on="postcode", right_on="Postcode", how="inner")
+        return merge_data[merge_data["postcode"].str.startswith("BT")]
+    return run
+
+
+def _gp_points(inputs, workdir):
+    """Geocode the GP practices (1x) for the distance benchmarks."""
+    gp = PostcodeIndex(_postcode_index(inputs, workdir)).geocode(inputs.gp_practices, "Postcode")
+    return gpd.GeoDataFrame(gp, geometry=gpd.points_from_xy(gp.longitude, gp.latitude), crs="epsg:4326")
+
+
+def _nearest(inputs, scale, workdir, measure="centroid"):
+    sites = scale_layer(inputs.sites.to_crs("epsg:4326")[["SITE", "geometry"]], scale)
+    gp = scale_layer(_gp_points(inputs, workdir), scale, seed=1)
+    transport = scale_layer(inputs.transport, scale, seed=2)
+
+    def run():
+        facility_layers = {("Near_T_Hub", "Trans_Dist"): FacilityIndex(transport, "Station"),
+                           ("Near_GP", "GP_Dist"): FacilityIndex(gp, "PracticeName")}
+        return assign_nearest(sites, facility_layers, measure=measure)
+    return run
+
+
+def _nearest_loop(inputs, scale, workdir):
+    # the original section 4.ii: one distance to every facility per site, in an iterrows loop
+    sites = scale_layer(inputs.sites.to_crs("epsg:4326")[["SITE", "geometry"]], scale)
+    gp = scale_layer(_gp_points(inputs, workdir), scale, seed=1).to_crs(ITM_CRS).reset_index(drop=True)
+    transport = scale_layer(inputs.transport, scale, seed=2).to_crs(ITM_CRS).reset_index(drop=True)
+
+    def run():
+        tourist = sites.copy()
+        for ind, row in tourist.to_crs(ITM_CRS).iterrows():
+            pt = row["geometry"].centroid
+            distance_trans = transport.distance(pt)
+            distance_postgp = gp.distance(pt)
+            tourist.loc[ind, "Near_T_Hub"] = transport.loc[distance_trans.argmin()].Station
+            tourist.loc[ind, "Near_GP"] = gp.loc[distance_postgp.argmin()].PracticeName
+            tourist.loc[ind, "Trans_Dist"] = distance_trans.min() / 1000
+            tourist.loc[ind, "GP_Dist"] = distance_postgp.min() / 1000
+        return tourist
+    return run
+
+
+def _nearest_geometry(inputs, scale, workdir):
+    return _nearest(inputs, scale, workdir, measure="geometry")
+
+
+def _nearest_refresh(inputs, scale, workdir):
+    sites = scale_layer(inputs.sites.to_crs("epsg:4326")[["SITE", "geometry"]], scale)
+    gp = scale_layer(_gp_points(inputs, workdir), scale, seed=1)
+    points, ids = query_points(sites), sites["SITE"]
+
+    # the cache as left by the last run, then a GP file with 1% of the practices moved
+    warm, folder = os.path.join(workdir, f"distance_cache_{scale}x"), os.path.join(workdir, "distance_cache")
+    DistanceCache(warm).nearest("sites-gp", FacilityIndex(gp, "PracticeName"), points, ids)
+    moved = np.random.default_rng(3).choice(len(gp), max(1, len(gp) // 100), replace=False)
+    gp = gp.copy()
+    gp.loc[gp.index[moved], "geometry"] = gp.geometry.iloc[moved].translate(0.01, 0.01).values
+
+    def run():
+        shutil.copytree(warm, folder, dirs_exist_ok=True)
+        return DistanceCache(folder).nearest("sites-gp", FacilityIndex(gp, "PracticeName"), points, ids)
+    return run
+
+
+def _sjoin_counties(inputs, scale, workdir):
+    sites = scale_layer(inputs.sites.to_crs("epsg:4326")[["SITE", "geometry"]], scale)
+    counties = inputs.counties.to_crs("epsg:4326")[["CountyName", "geometry"]]
+    return lambda: gpd.sjoin(sites, counties, how="inner")
+
+
+def _county_index(inputs, scale, workdir):
+    sites = scale_layer(inputs.sites.to_crs("epsg:4326")[["SITE", "geometry"]], scale)
+    counties = inputs.counties.to_crs("epsg:4326")[["CountyName", "geometry"]]
+    return lambda: assign_counties(sites, counties)
+
+
+def _map_sites(inputs, scale):
+    """The tourist sites as shown on the map: simplified for zoom 9, with a county name."""
+    sites = inputs.sites.to_crs("epsg:4326")[["SITE", "geometry"]]
+    sites["CountyName"] = assign_counties(sites, inputs.counties)
+    return scale_layer(simplify_for_zoom(sites, 9, cache_folder=None), scale)
+
+
+def _explore(inputs, scale, workdir):
+    sites = _map_sites(inputs, scale)
+
+    def run():
+        m = folium.Map()
+        sites.explore("CountyName", cmap="gist_rainbow", m=m, popup=True, legend=False)
+        return m
+    return run
+
+
+def _save(inputs, scale, workdir):
+    m = folium.Map()
+    _map_sites(inputs, scale).explore("CountyName", cmap="gist_rainbow", m=m, popup=True, legend=False)
+    filepath = os.path.join(workdir, f"map_{scale}x.html")
+    return lambda: m.save(filepath)
+
+
+# Every benchmark, in the order of the two scripts.
+BENCHMARKS = [
+    Benchmark("read_boundaries", _read_boundaries, False, "read the NI outline and counties zipped shapefiles"),
+    Benchmark("read_sites", _read_sites, True, "read the tourist sites shapefile"),
+    Benchmark("repair", _repair, False, "repair the NI outline geometries (section 1)"),
+    Benchmark("to_crs", _to_crs, True, "re-project the tourist sites to EPSG:4326 (section 2)"),
+    Benchmark("overlay_clip", _overlay_clip, False, "clip the counties to the NI outline with gpd.overlay (original section 3)"),
+    Benchmark("clip", _clip, False, "clip the counties to the NI outline (section 3)", reference="overlay_clip"),
+    Benchmark("postcode_merge", _postcode_merge, True, "merge the GP practices with the UK postcode table (original section 4.i)"),
+    Benchmark("postcode_geocode", _postcode_geocode, True, "geocode the GP practices by postcode (section 4.i)",
+              reference="postcode_merge"),
+    Benchmark("nearest_loop", _nearest_loop, True, "nearest transport hub and GP surgery of each site, iterrows loop "
+              "(original section 4.ii)", max_scale=10),
+    Benchmark("nearest", _nearest, True, "nearest transport hub and GP surgery of each site (section 4.ii)",
+              reference="nearest_loop"),
+    Benchmark("nearest_geometry", _nearest_geometry, True, "nearest facilities measured from the site polygons (section 4.ii)"),
+    Benchmark("nearest_refresh", _nearest_refresh, True, "nearest GP surgery of each site after 1% of the practices moved (distance_cache.py)"),
+    Benchmark("sjoin_counties", _sjoin_counties, True, "attach the county name to each site (spatial join)"),
+    Benchmark("county_index", _county_index, True, "attach one county name to each site (county_index.py, section 4.ii)",
+              reference="sjoin_counties"),
+    Benchmark("explore", _explore, True, "add the tourist sites to a Folium map (GeoJSON serialization)"),
+    Benchmark("save", _save, True, "render and save the map HTML"),
+]
@@ -0,0 +1,167 @@
+# Repository : https://github.com/sereneeosman/egm722_serenee
+
+#========================================= Columnar Output Formats ===============================================================================================================
+#================================================================================================================================================================================
+"""
+Write and read the ``data_files`` outputs as shapefile/GeoJSON/CSV ("native") or as GeoParquet/Feather.
+
+GeoParquet and Feather store the geometries as WKB in a columnar file, so reading them skips the shapefile/GeoJSON
+parsing, and only the requested columns are read from disk. Both formats need ``pyarrow``.
+
+The output format is chosen by the file extension: :func:`output_path` swaps the native extension of an output for
+``.parquet`` or ``.feather``.
+
+Examples
+--------
+>>> path = output_path("data_files/NI_Tourist_Sites.shp", "parquet") # 'data_files/NI_Tourist_Sites.parquet'
+>>> write_output(tourist_prj, path)
+>>> tourist = read_output(path, columns=["SITE"])
+"""
+
+import os
+
+import pandas as pd
+import geopandas as gpd
+
+from archive_reader import read_layer
+
+# Output formats and their file extension (None keeps the native extension).
+OUTPUT_FORMATS = {"native": None, "parquet": ".parquet", "feather": ".feather"}
+
+
+def output_path(filepath, output_format="native"):
+    """
+    Get the path of an output in the given format.
+
+    Parameters
+    ----------
+    filepath : str
+        The native path of the output (e.g. ``data_files/NI_Counties.shp``).
+    output_format : str, optional
+        ``"native"`` (default), ``"parquet"`` or ``"feather"``.
+
+    Returns
+    -------
+    str
+        The path with the extension of ``output_format``.
+
+    Examples
+    --------
+    >>> output_path("data_files/NI_PostCodes_GP.geojson", "feather")
+    'data_files/NI_PostCodes_GP.feather'
+    """
+    if output_format not in OUTPUT_FORMATS:
+        raise ValueError(f"output_format must be one of {sorted(OUTPUT_FORMATS)}, not {output_format!r}")
+    extension = OUTPUT_FORMATS[output_format]
+    return filepath if extension is None else os.path.splitext(filepath)[0] + extension
+
+
+def write_output(data, filepath, **kwargs):
+    """
+    Write a GeoDataFrame or DataFrame in the format given by the file extension.
+
+    Parameters
+    ----------
+    data : geopandas.geodataframe.GeoDataFrame or pandas.DataFrame
+        The data to write.
+    filepath : str
+        ``.parquet`` and ``.feather`` are written with pyarrow, ``.csv`` with ``to_csv``, anything else with
+        ``to_file`` (e.g. ``.shp``, ``.geojson``).
+    **kwargs
+        Passed on to the writer (e.g. ``driver="GeoJSON"``).
+
+    Examples
+    --------
+    >>> write_output(clipped_counties, "data_files/NI_Counties.parquet")
+    """
+    extension = os.path.splitext(filepath)[1].lower()
+    if extension == ".parquet":
+        data.to_parquet(filepath, index=False, **kwargs)
+    elif extension == ".feather":
+        data.reset_index(drop=True).to_feather(filepath, **kwargs)
+    elif extension == ".csv":
+        data.to_csv(filepath, **kwargs)
+    else:
+        data.to_file(filepath, **kwargs)
+
+
+def _is_spatial(filepath, extension):
+    """Check the schema metadata of a Parquet/Feather file for GeoParquet ("geo") metadata."""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    if extension == ".parquet":
+        metadata = pq.read_schema(filepath).metadata
+    else:
+        with pa.memory_map(filepath) as source:
+            metadata = pa.ipc.open_file(source).schema.metadata
+    return bool(metadata) and b"geo" in metadata
+
+
+def output_columns(filepath):
+    """
+    List the attribute columns of an output without reading its rows.
+
+    Parameters
+    ----------
+    filepath : str
+        The file; the format is given by its extension.
+
+    Returns
+    -------
+    list of str
+        The column names (without the geometry column of spatial files).
+
+    Examples
+    --------
+    >>> "CountyName" in output_columns("data_files/NI_Tourist_trans_GP_Dist.csv")
+    """
+    extension = os.path.splitext(filepath)[1].lower()
+    if extension == ".parquet":
+        import pyarrow.parquet as pq
+
+        names = pq.read_schema(filepath).names
+    elif extension == ".feather":
+        import pyarrow as pa
+
+        with pa.memory_map(filepath) as source:
+            names = pa.ipc.open_file(source).schema.names
+    elif extension == ".csv":
+        names = pd.read_csv(filepath, nrows=0).columns
+    else:
+        names = read_layer(filepath, rows=1).columns
+    return [name for name in names if name != "geometry"]
+
+
+def read_output(filepath, columns=None):
+    """
+    Read an output written by :func:`write_output`, optionally only some of its columns.
+
+    Parameters
+    ----------
+    filepath : str
+        The file to read; the format is given by its extension.
+    columns : list of str, optional
+        The attribute columns to read. The geometry column of spatial files is always read.
+
+    Returns
+    -------
+    geopandas.geodataframe.GeoDataFrame or pandas.DataFrame
+        The data (a DataFrame for tabular files, such as the distance CSV).
+
+    Examples
+    --------
+    >>> counties = read_output("data_files/NI_Counties.parquet", columns=["CountyName"])
+    """
+    extension = os.path.splitext(filepath)[1].lower()
+    if extension in (".parquet", ".feather"):
+        spatial = _is_spatial(filepath, extension)
+        if columns is not None and spatial:
+            columns = list(columns) + ["geometry"]
+        if extension == ".parquet":
+            return gpd.read_parquet(filepath, columns=columns) if spatial else pd.read_parquet(filepath, columns=columns)
+        return gpd.read_feather(filepath, columns=columns) if spatial else pd.read_feather(filepath, columns=columns)
+
+    if extension == ".csv":
+        return pd.read_csv(filepath, usecols=columns)
+    return read_layer(filepath, columns=columns)
@@ -0,0 +1,165 @@
+# Repository : https://github.com/sereneeosman/egm722_serenee
+
+#========================================= County Assignment Index ===============================================================================================================
+#================================================================================================================================================================================
+"""
+Assign exactly one county to every feature, once, instead of a spatial join on the full polygons.
+
+``gpd.sjoin(visit_geo, counties, how="inner")`` tests every tourist site polygon against the county polygons each
+time the map is built, and returns one row per (site, county) pair: a site straddling a county line comes out
+twice. :class:`CountyIndex` reduces each feature to a representative point (a point guaranteed to lie inside the
+feature, ``shapely.point_on_surface``) and finds the county containing it: the county polygons are prepared once,
+and each one is tested only against the points inside its bounding box (an ``STRtree`` over the points). The result
+is one county per feature, and the same county on every run:
+
+* a point on the border of two counties goes to the first county by name;
+* a feature whose point is outside every county, but which overlaps some (e.g. a site across the shoreline of the
+  clipped counties), goes to the nearest of the counties it overlaps;
+* a feature overlapping no county gets no county (None), as the inner spatial join dropped it; the map leaves these
+  features out, as before.
+
+The analysis writes the county as a ``CountyName`` column (see ``analysis_pipeline.py``), so the map does not
+repeat the join.
+
+Examples
+--------
+>>> county_index = CountyIndex(counties)
+>>> tourist["CountyName"] = county_index.assign(tourist.geometry.values)
+>>> tourist["CountyName"] = assign_counties(tourist, counties) # the same, re-projecting to the counties' CRS
+"""
+
+import numpy as np
+import shapely
+
+
+class CountyIndex:
+    """
+    Spatial index over the county polygons, answering "which county is this feature in?".
+
+    Parameters
+    ----------
+    counties : geopandas.geodataframe.GeoDataFrame
+        The county polygons.
+    name_column : str, optional
+        The column holding the county name (default ``"CountyName"``).
+
+    Attributes
+    ----------
+    names : numpy.ndarray
+        The county names, sorted; tree positions refer to this order.
+    geometries : numpy.ndarray
+        The (prepared) county polygons, in the order of :attr:`names`.
+    crs : pyproj.CRS
+        The CRS of the counties; query geometries must be in it.
+    tree : shapely.STRtree
+        A spatial index over the county polygons, for the features whose point is outside every county.
+
+    Examples
+    --------
+    >>> CountyIndex(counties).assign(coastalpt.geometry.values)
+    """
+
+    def __init__(self, counties, name_column="CountyName"):
+        counties = counties.sort_values(name_column, kind="stable")
+        self.crs = counties.crs
+        self.names = counties[name_column].to_numpy()
+        self.geometries = np.asarray(counties.geometry.values, dtype=object)
+        shapely.prepare(self.geometries)
+        self.tree = shapely.STRtree(self.geometries)
+
+    def __len__(self):
+        return len(self.names)
+
+    def positions(self, geometries):
+        """
+        Find the county of each geometry, as a position in :attr:`names`.
+
+        Parameters
+        ----------
+        geometries : array-like of shapely geometries
+            The features, in the CRS of the counties.
+
+        Returns
+        -------
+        numpy.ndarray
+            The county position of each feature (-1 for missing or empty geometries, and for features overlapping
+            no county).
+        """
+        geometries = np.asarray(geometries, dtype=object)
+        index = np.full(len(geometries), -1, dtype=np.intp)
+        valid = np.flatnonzero(~(shapely.is_missing(geometries) | shapely.is_empty(geometries)))
+        if not len(valid) or not len(self):
+            return index
+        points = shapely.point_on_surface(geometries[valid])
+
+        # the (prepared) counties are the query geometries, so each point test uses the prepared polygon;
+        # the counties are sorted by name, so the lowest position is the first county by name
+        county_pos, point_pos = shapely.STRtree(points).query(self.geometries, predicate="intersects")
+        order = np.lexsort((county_pos, point_pos))
+        county_pos, point_pos = county_pos[order], point_pos[order]
+        first = np.unique(point_pos, return_index=True)[1]
+        index[valid[point_pos[first]]] = county_pos[first]
+
+        # points outside every county: the nearest of the counties the feature overlaps (none if it overlaps none)
+        outside = np.flatnonzero(index[valid] < 0)
+        if len(outside):
+            query_pos, tree_pos = self.tree.query(geometries[valid[outside]], predicate="intersects")
+            distance = shapely.distance(points[outside[query_pos]], self.geometries[tree_pos])
+            order = np.lexsort((tree_pos, distance, query_pos))
+            query_pos, tree_pos = query_pos[order], tree_pos[order]
+            first = np.unique(query_pos, return_index=True)[1]
+            index[valid[outside[query_pos[first]]]] = tree_pos[first]
+        return index
+
+    def assign(self, geometries):
+        """
+        Find the county name of each geometry.
+
+        Parameters
+        ----------
+        geometries : array-like of shapely geometries
+            The features, in the CRS of the counties.
+
+        Returns
+        -------
+        numpy.ndarray
+            An object array of county names (None for missing or empty geometries, and for features overlapping no
+            county).
+
+        Examples
+        --------
+        >>> tourist["CountyName"] = county_index.assign(tourist.geometry.values)
+        """
+        index = self.positions(geometries)
+        names = self.names[np.where(index < 0, 0, index)].astype(object) if len(self) else np.full(len(index), None)
+        names[index < 0] = None
+        return names
+
+
+def assign_counties(features, counties, name_column="CountyName"):
+    """
+    Find the county name of each feature of a layer (see :class:`CountyIndex`).
+
+    Parameters
+    ----------
+    features : geopandas.geodataframe.GeoDataFrame
+        The features (re-projected to the CRS of the counties if needed).
+    counties : geopandas.geodataframe.GeoDataFrame or CountyIndex
+        The county polygons, or a ready index.
+    name_column : str, optional
+        The column holding the county name (default ``"CountyName"``).
+
+    Returns
+    -------
+    numpy.ndarray
+        One county name per feature, in the order of ``features`` (None for a feature overlapping no county).
+
+    Examples
+    --------
+    >>> output["CountyName"] = assign_counties(tourist, counties)
+    """
+    county_index = counties if isinstance(counties, CountyIndex) else CountyIndex(counties, name_column)
+    geometries = features.geometry
+    if county_index.crs is not None and features.crs is not None and not features.crs.equals(county_index.crs):
+        geometries = geometries.to_crs(county_index.crs)
+    return county_index.assign(geometries.values)
@@ -0,0 +1,344 @@
+# Repository : https://github.com/sereneeosman/egm722_serenee
+
+#========================================= Distance Cache ========================================================================================================================
+#================================================================================================================================================================================
+"""
+On-disk cache of nearest-facility results, refreshed incrementally.
+
+The stations and the historic parks rarely change, and the GP file is updated once a month, yet each analysis run
+measures every site against every facility layer again. A :class:`DistanceCache` keeps the result of each search
+(the nearest, or the ``k`` nearest, facilities of every site and their distances) in a folder of ``.npy`` arrays,
+read back memory-mapped. Sites are keyed by a 64-bit hash of their ID and their geometry, facilities by a hash of
+their geometry (and key, for the ``k`` nearest), so the next run only measures what changed:
+
+* a new or moved site is searched in full;
+* a site whose cached facility was removed or moved is searched in full;
+* every other site keeps its cached result, and is only compared with the added (or moved) facilities, through a
+  spatial index over those facilities alone.
+
+A refresh of the GP file therefore costs one hash per site and practice, plus a search over the changed practices,
+instead of a full search. The refreshed results are the same as a full search, the only exception being an exact tie
+between two unchanged facilities after they swapped places in the file: the cached one is kept.
+
+Only straight-line distances (:class:`nearest_facility.FacilityIndex`) are cached; other indexes (e.g. road distances,
+see ``road_network.py``) are searched in full.
+
+Examples
+--------
+>>> cache = DistanceCache("data_files/distance_cache", id_columns={"tourist": "SITE"})
+>>> idx, dist = cache.nearest("tourist-gp", gp_index, query_points(tourist), ids=tourist["SITE"])
+>>> tourist = assign_nearest("tourist", facility_layers, registry, cache=cache) # the same, for each facility layer
+"""
+
+import json
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+import shapely
+from scipy.spatial import cKDTree
+
+from nearest_facility import FacilityIndex
+
+# Format of the cache files; a cache written in another format is discarded.
+CACHE_VERSION = 1
+
+# The arrays of a cache entry: the site keys (sorted), the hashes of the facilities found for each site, their
+# distances and whether another facility was as near (one row per site), and the hashes of the facilities the
+# results were measured against (sorted).
+CACHE_ARRAYS = ("sites", "found", "distance", "tied", "facilities")
+
+
+def geometry_hashes(geometries, ids=None):
+    """
+    Hash each geometry (its WKB), together with its ID if given.
+
+    Parameters
+    ----------
+    geometries : array-like of shapely geometries
+        The geometries.
+    ids : array-like, optional
+        One ID per geometry (e.g. the site name or the practice number).
+
+    Returns
+    -------
+    numpy.ndarray
+        One ``uint64`` hash per geometry.
+
+    Examples
+    --------
+    >>> geometry_hashes(post_gp.geometry.values, post_gp["PracNo"])
+    """
+    hashes = pd.util.hash_array(shapely.to_wkb(np.asarray(geometries, dtype=object)), categorize=False)
+    if ids is not None:
+        # combine the two hashes (the multiplication wraps around in uint64)
+        hashes ^= pd.util.hash_array(np.asarray(ids, dtype=object), categorize=False) * np.uint64(0x9E3779B97F4A7C15)
+    return hashes
+
+
+def _lookup(sorted_hashes, hashes):
+    """Find each hash in a sorted array: its position there, or -1 if absent."""
+    if not len(sorted_hashes):
+        return np.full(np.shape(hashes), -1, dtype=np.intp)
+    pos = np.minimum(np.searchsorted(sorted_hashes, hashes), len(sorted_hashes) - 1)
+    return np.where(sorted_hashes[pos] == hashes, pos, -1)
+
+
+def _no_results(n, k):
+    """Empty results for ``n`` queries: positions -1, distances NaN, not tied."""
+    return np.full((n, k), -1, dtype=np.intp), np.full((n, k), np.nan), np.zeros(n, dtype=bool)
+
+
+def _merge(pos, dist, candidate_pos, candidate_dist, k):
+    """
+    Keep the ``k`` nearest of two sets of results per row, ties going to the lowest position.
+
+    Also returns whether the ``k``-th kept result of each row is tied with the first one left out.
+    """
+    pos, dist = np.hstack([pos, candidate_pos]), np.hstack([dist, candidate_dist])
+    missing = np.isnan(dist)
+    order = np.lexsort((np.where(missing, np.iinfo(np.intp).max, pos), np.where(missing, np.inf, dist)), axis=-1)
+    pos, dist = np.take_along_axis(pos, order, axis=1), np.take_along_axis(dist, order, axis=1)
+    tied = dist[:, k - 1] == dist[:, k] if dist.shape[1] > k else np.zeros(len(dist), dtype=bool)
+    return pos[:, :k], dist[:, :k], tied
+
+
+class DistanceCache:
+    """
+    Folder of cached nearest-facility results, one entry per (query layer, facility layer) search.
+
+    Parameters
+    ----------
+    folder : str
+        The folder the cache entries are written to (created on first use).
+    id_columns : dict, optional
+        ``{layer name: ID column}``, the column identifying the features of each query layer used by
+        :func:`nearest_facility.assign_nearest` (e.g. ``{"tourist": "SITE"}``). Features of other layers are
+        identified by their geometry alone.
+
+    Examples
+    --------
+    >>> cache = DistanceCache("data_files/distance_cache")
+    >>> idx, dist = cache.nearest("coastline-gp", gp_index, query_points(coastline_tmp))
+    """
+
+    def __init__(self, folder, id_columns=None):
+        self.folder = folder
+        self.id_columns = dict(id_columns or {})
+
+    def _path(self, name, filename):
+        return os.path.join(self.folder, name, filename)
+
+    def _load(self, name, meta):
+        """Open the arrays of a cache entry (memory-mapped), or None if there is none in this format."""
+        try:
+            with open(self._path(name, "meta.json")) as f:
+                if json.load(f) != meta:
+                    return None
+            return {array: np.load(self._path(name, f"{array}.npy"), mmap_mode="r") for array in CACHE_ARRAYS}
+        except (OSError, ValueError):
+            return None
+
+    def _save(self, name, meta, arrays):
+        """
+        Write a cache entry: its arrays and ``meta.json`` go to a new folder, which then replaces the entry folder.
+
+        An interrupted run leaves either the old entry or the new one, never a mix of the arrays of the two (which
+        have the same ``meta.json``); between the two renames there is no entry, and the next run searches in full.
+        """
+        entry = os.path.join(self.folder, name)
+        staging, previous = f"{entry}.new-{os.getpid()}", f"{entry}.old-{os.getpid()}"
+        shutil.rmtree(staging, ignore_errors=True)
+        os.makedirs(staging)
+        for array, values in arrays.items():
+            np.save(os.path.join(staging, f"{array}.npy"), values)
+        with open(os.path.join(staging, "meta.json"), "w") as f:
+            json.dump(meta, f)
+
+        # a folder can only be renamed over an empty one: move the old entry aside first
+        if os.path.exists(entry):
+            os.replace(entry, previous)
+        os.replace(staging, entry)
+        shutil.rmtree(previous, ignore_errors=True)
+
+    def ids(self, name, layer):
+        """The IDs of the features of a named query layer (None if it has no ID column)."""
+        column = self.id_columns.get(name)
+        return layer[column].to_numpy() if column else None
+
+    def _refresh(self, name, meta, geometries, ids, units, k, search, search_added):
+        """
+        Get the cached results of a search, searching again only for what changed, and update the cache.
+
+        ``units`` are the hashes of the facilities (or locations) in the index order, which is the tie-breaking
+        order. ``search(query)`` searches the given query geometries in full, ``search_added(query, added, bound)``
+        among the ``added`` facility positions only, up to the ``bound`` distance of each query; both
+        return ``(position, distance)`` arrays of shape ``(len(query), k)`` and whether each result was decided by a
+        tie (another facility as near). A result decided by a tie depends on the order of the facilities, so it is
+        searched again in full whenever the facilities change.
+        """
+        geometries = np.asarray(geometries, dtype=object)
+        valid = np.flatnonzero(~(shapely.is_missing(geometries) | shapely.is_empty(geometries)))
+        sites = geometry_hashes(geometries[valid], None if ids is None else np.asarray(ids, dtype=object)[valid])
+        pos, dist, tied = _no_results(len(valid), k)
+
+        cached = self._load(name, meta)
+        reuse = np.zeros(len(valid), dtype=bool)
+        added = np.arange(len(units))
+        if cached is not None:
+            unit_order = np.argsort(units, kind="stable")
+            row = _lookup(cached["sites"], sites)
+            hit = np.flatnonzero(row >= 0)
+            found = cached["found"][row[hit]]
+            cached_dist = np.array(cached["distance"][row[hit]])
+            cached_tied = np.array(cached["tied"][row[hit]])
+
+            # the cached facilities, as positions in the current index (-1 if removed or moved)
+            cached_pos = _lookup(units[unit_order], found)
+            cached_pos = np.where(cached_pos >= 0, unit_order[np.maximum(cached_pos, 0)], -1)
+            stale = ((cached_pos < 0) & ~np.isnan(cached_dist)).any(axis=1)
+            added = np.flatnonzero(_lookup(cached["facilities"], units) < 0)
+            unchanged = (not len(added) and not stale.any() and len(hit) == len(valid)
+                         and len(cached["facilities"]) == len(np.unique(units))
+                         and len(cached["sites"]) == len(np.unique(sites)))
+            del cached # release the memory-mapped files before they are replaced
+
+            if unchanged:
+                return valid, cached_pos, cached_dist
+            keep = ~stale & ~cached_tied
+            reuse[hit[keep]] = True
+            pos[reuse], dist[reuse] = cached_pos[keep], cached_dist[keep]
+            rows = np.flatnonzero(reuse)
+            if len(added) and len(rows):
+                bound = np.where(np.isnan(dist[rows, -1]), np.inf, dist[rows, -1])
+                candidate_pos, candidate_dist, candidate_tied = search_added(geometries[valid[rows]], added, bound)
+                pos[rows], dist[rows], boundary_tied = _merge(pos[rows], dist[rows], candidate_pos, candidate_dist, k)
+                reuse[rows[boundary_tied | candidate_tied]] = False
+
+        rows = np.flatnonzero(~reuse)
+        if len(rows):
+            pos[rows], dist[rows], tied[rows] = search(geometries[valid[rows]])
+
+        keep = np.unique(sites, return_index=True)[1] # sorted by key, one row per key
+        found = np.where(pos >= 0, units[np.maximum(pos, 0)], 0).astype(np.uint64)
+        self._save(name, meta, {"sites": sites[keep], "found": found[keep], "distance": dist[keep],
+                                "tied": tied[keep], "facilities": np.unique(units)})
+        return valid, pos, dist
+
+    def nearest(self, name, index, geometries, ids=None):
+        """
+        Find the nearest facility of every query geometry, as :meth:`nearest_facility.FacilityIndex.nearest` does.
+
+        Parameters
+        ----------
+        name : str
+            The name of the cache entry (one per query layer and facility layer, e.g. ``"tourist-gp"``).
+        index : nearest_facility.FacilityIndex
+            The facility index.
+        geometries : array-like of shapely geometries
+            The query geometries, already in the index CRS.
+        ids : array-like, optional
+            The ID of each query feature; a site is searched again if its ID or its geometry changed.
+
+        Returns
+        -------
+        tuple of numpy.ndarray
+            ``(index, distance)``, as :meth:`nearest_facility.FacilityIndex.nearest`.
+
+        Examples
+        --------
+        >>> idx, dist = cache.nearest("tourist-gp", gp_index, query_points(tourist), ids=tourist["SITE"])
+        """
+        if type(index) is not FacilityIndex: # e.g. road distances: not cached
+            return index.nearest(geometries)
+
+        # results are kept per location (distinct facility geometry): a renamed practice needs no new search, and
+        # the practice reported at a location is always the first one listed there in the current file
+        locations = index.tree.geometries
+
+        def search(query):
+            query_pos, tree_pos, dist, first = index._nearest_matches(query)
+            pos, out, tied = _no_results(len(query), 1)
+            pos[query_pos[first], 0], out[query_pos[first], 0] = tree_pos[first], dist[first]
+            tied[query_pos[first]] = np.diff(np.append(first, len(query_pos))) > 1
+            return pos, out, tied
+
+        def search_added(query, added, bound):
+            # only the added locations closer than (or as close as) the cached one can replace it
+            tree = shapely.STRtree(locations[added])
+            query_pos, tree_pos = tree.query(query, predicate="dwithin", distance=bound)
+            dist = shapely.distance(query[query_pos], tree.geometries[tree_pos])
+            order = np.lexsort((added[tree_pos], dist, query_pos))
+            query_pos, tree_pos, dist = query_pos[order], tree_pos[order], dist[order]
+            first = np.unique(query_pos, return_index=True)[1]
+            pos, out, tied = _no_results(len(query), 1)
+            pos[query_pos[first], 0], out[query_pos[first], 0] = added[tree_pos[first]], dist[first]
+            # tied: the next match of the same query is as near
+            second = np.minimum(first + 1, len(dist) - 1)
+            tied[query_pos[first]] = (second > first) & (query_pos[second] == query_pos[first]) & (dist[second] == dist[first])
+            return pos, out, tied
+
+        meta = {"version": CACHE_VERSION, "search": "nearest", "k": 1, "crs": str(index.crs)}
+        units = geometry_hashes(locations)
+        valid, pos, dist = self._refresh(name, meta, geometries, ids, units, 1, search, search_added)
+
+        out_index = np.full(len(geometries), -1, dtype=np.intp)
+        out_dist = np.full(len(geometries), np.nan)
+        out_index[valid] = np.where(pos[:, 0] >= 0, index._first[np.maximum(pos[:, 0], 0)], -1)
+        out_dist[valid] = dist[:, 0]
+        return out_index, out_dist
+
+    def k_nearest(self, name, index, geometries, k, ids=None):
+        """
+        Find the ``k`` nearest facilities of every query geometry, as :meth:`nearest_facility.FacilityIndex.k_nearest`
+        does.
+
+        Parameters
+        ----------
+        name : str
+            The name of the cache entry (e.g. ``"tourist-rail-3"``).
+        index : nearest_facility.FacilityIndex
+            The facility index.
+        geometries : array-like of shapely geometries
+            The query geometries, already in the index CRS.
+        k : int
+            The number of facilities to return per query.
+        ids : array-like, optional
+            The ID of each query feature.
+
+        Returns
+        -------
+        tuple of numpy.ndarray
+            ``(index, distance)``, two ``(n_queries, k)`` arrays as :meth:`nearest_facility.FacilityIndex.k_nearest`.
+
+        Examples
+        --------
+        >>> idx, dist = cache.k_nearest("tourist-rail-3", rail_index, query_points(tourist), k=3)
+        """
+        if type(index) is not FacilityIndex:
+            return index.k_nearest(geometries, k)
+
+        def search(query):
+            # the order of facilities at the same distance is left to the KD-tree, as in k_nearest
+            return *index.k_nearest(query, k), np.zeros(len(query), dtype=bool)
+
+        def search_added(query, added, bound):
+            # the k nearest of the added facilities, measured like k_nearest (centroid to facility point)
+            coords = shapely.get_coordinates(shapely.centroid(query))
+            n = min(k, len(added))
+            dist, idx = cKDTree(index.kdtree.data[added]).query(coords, k=n)
+            dist, idx = dist.reshape(-1, n), idx.reshape(-1, n)
+            found = idx < len(added) # cKDTree pads missing neighbours with n and inf
+            return (np.where(found, added[np.minimum(idx, len(added) - 1)], -1), np.where(found, dist, np.nan),
+                    np.zeros(len(query), dtype=bool))
+
+        # facilities are told apart by their key as well, as co-located facilities are each one of the k nearest
+        units = geometry_hashes(index.facilities.geometry.values, index.keys)
+        meta = {"version": CACHE_VERSION, "search": "k_nearest", "k": int(k), "crs": str(index.crs)}
+        valid, pos, dist = self._refresh(name, meta, geometries, ids, units, k, search, search_added)
+
+        out_index = np.full((len(geometries), k), -1, dtype=np.intp)
+        out_dist = np.full((len(geometries), k), np.nan)
+        out_index[valid], out_dist[valid] = pos, dist
+        return out_index, out_dist
@@ -0,0 +1,133 @@
+# Repository : https://github.com/sereneeosman/egm722_serenee
+
+#========================================= Geometry Repair =======================================================================================================================
+#================================================================================================================================================================================
+"""
+Repair only the invalid geometries of a layer, optionally spreading the invalid parts of large multipolygons over
+processes.
+
+Section 1 of ``Integrated_Data_Analysis.py`` used to run ``buffer(0)`` over the whole NI outline, a single
+multipolygon of ~500,000 vertices of which one ring self-intersects. Here the geometries (and the parts of large
+multipolygons) are checked first, and only the invalid ones are repaired, with ``shapely.make_valid`` (keeping the
+polygons only) or ``buffer(0)`` as a fallback. The repaired parts are put back together, and merged with
+``union_all`` only if they now overlap.
+
+Examples
+--------
+>>> fixed, report = repair_geometries(input_data.geometry)
+>>> print(f"{report.repaired} of {report.checked} geometries repaired ({report.parts} parts)")
+"""
+
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import shapely
+import geopandas as gpd
+
+# Repair methods: make_valid keeps all the area of self-intersecting rings, buffer(0) can drop some of it
+# (e.g. one lobe of a bow-tie).
+REPAIR_METHODS = ("make_valid", "buffer")
+
+# Summary of a repair: the number of geometries checked, the number repaired, and the number of parts repaired
+# (a geometry repaired whole counts as one part).
+RepairReport = namedtuple("RepairReport", ["checked", "repaired", "parts"])
+
+
+def _repair(geometries, method="make_valid"):
+    """
+    Repair an array of invalid geometries.
+
+    Polygonal geometries stay polygonal: collapsed rings are dropped, and ``buffer(0)`` is used when
+    ``make_valid`` does not give a valid polygonal result.
+    """
+    geometries = np.asarray(geometries, dtype=object)
+    if method == "buffer":
+        return shapely.buffer(geometries, 0)
+
+    repaired = shapely.make_valid(geometries, method="structure", keep_collapsed=False)
+    polygonal = np.isin(shapely.get_type_id(geometries), (3, 6)) # Polygon, MultiPolygon
+    failed = ~shapely.is_valid(repaired) | (polygonal & ~np.isin(shapely.get_type_id(repaired), (3, 6)))
+    repaired[failed] = shapely.buffer(geometries[failed], 0)
+    return repaired
+
+
+def _reassemble(parts):
+    """Put the parts of a multipolygon back together, dissolving them if they overlap after the repair."""
+    polygons = shapely.get_parts(parts)
+    polygons = polygons[~shapely.is_empty(polygons)]
+    multipolygon = shapely.multipolygons(polygons)
+    return multipolygon if shapely.is_valid(multipolygon) else shapely.union_all(polygons)
+
+
+def repair_geometries(geometries, method="make_valid", workers=1, min_parts=16):
+    """
+    Repair the invalid geometries of a layer, leaving the valid ones untouched.
+
+    Parameters
+    ----------
+    geometries : geopandas.geoseries.GeoSeries
+        The geometries to check (e.g. ``input_data.geometry``).
+    method : str, optional
+        ``"make_valid"`` (default) or ``"buffer"`` (``buffer(0)``, as the original analysis did).
+    workers : int, optional
+        The number of worker processes repairing the invalid parts (default 1: in this process). More than one
+        starts a process pool, so the calling script needs an ``if __name__ == "__main__":`` guard on Windows and
+        macOS.
+    min_parts : int, optional
+        Multipolygons with at least this many parts are checked and repaired part by part.
+
+    Returns
+    -------
+    tuple
+        ``(repaired, report)`` : a GeoSeries with the same index and CRS as ``geometries``, and a
+        :data:`RepairReport`.
+
+    Examples
+    --------
+    >>> fixed, report = repair_geometries(input_data.geometry)
+    >>> fixed_data = fixed.to_crs("epsg:4326")
+    """
+    if method not in REPAIR_METHODS:
+        raise ValueError(f"method must be one of {REPAIR_METHODS}, not {method!r}")
+
+    values = np.asarray(geometries.values, dtype=object)
+    present = ~shapely.is_missing(values)
+    invalid = np.flatnonzero(present & ~shapely.is_valid(values))
+
+    # one repair job per invalid geometry, or per invalid part of a large multipolygon
+    jobs, owners, split = [], [], {}
+    for i in invalid:
+        if shapely.get_type_id(values[i]) == 6 and shapely.get_num_geometries(values[i]) >= min_parts:
+            parts = shapely.get_parts(values[i])
+            split[i] = parts
+            for p in np.flatnonzero(~shapely.is_valid(parts)):
+                jobs.append(parts[p])
+                owners.append((i, p))
+        else:
+            jobs.append(values[i])
+            owners.append((i, None))
+
+    if workers > 1 and len(jobs) > 1:
+        # chunks of similar vertex counts, so the largest parts don't all end up in the same process
+        order = np.argsort(-shapely.get_num_coordinates(np.asarray(jobs, dtype=object)))
+        chunks = [order[w::workers] for w in range(min(workers, len(jobs)))]
+        repaired = np.empty(len(jobs), dtype=object)
+        with ProcessPoolExecutor(max_workers=len(chunks)) as pool:
+            results = pool.map(_repair, [[jobs[j] for j in chunk] for chunk in chunks], [method] * len(chunks))
+            for chunk, result in zip(chunks, results):
+                repaired[chunk] = result
+    else:
+        repaired = _repair(jobs, method) if jobs else np.empty(0, dtype=object)
+
+    values = values.copy()
+    for (i, p), geometry in zip(owners, repaired):
+        if p is None:
+            values[i] = geometry
+        else:
+            split[i][p] = geometry
+    for i, parts in split.items():
+        values[i] = _reassemble(parts)
+
+    report = RepairReport(checked=int(present.sum()), repaired=len(invalid), parts=len(jobs))
+    return gpd.GeoSeries(values, index=geometries.index, crs=geometries.crs), report
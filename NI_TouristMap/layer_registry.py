@@ -0,0 +1,271 @@
+# Repository : https://github.com/sereneeosman/egm722_serenee
+
+#========================================= Layer Registry ========================================================================================================================
+#================================================================================================================================================================================
+"""
+Per-run registry of layers, keeping each layer's geometries in every CRS it is used in.
+
+The analysis measures distances in Irish Transverse Mercator (EPSG:2157) and writes and maps the layers in WGS84
+(EPSG:4326). Without a registry, each stage re-projects the whole table it needs: the distance and coastline stages
+each re-project the transport hubs and the GP surgeries, and the query layers are re-projected for every nearest-
+facility search. A :class:`LayerRegistry` re-projects a layer to a CRS the first time it is asked for, keeps the
+result, and hands the same arrays to every later stage. The query points (polygon centroids in EPSG:2157) and their
+coordinates are cached the same way.
+
+Re-projection goes through one ``pyproj.Transformer`` per CRS pair (:func:`transformer`), created once per process.
+
+Examples
+--------
+>>> registry = LayerRegistry()
+>>> registry.add("tourist", tourist)
+>>> registry.get("tourist", ITM_CRS) # re-projected once, then cached
+>>> registry.points("tourist") # centroids in EPSG:2157, as measured by assign_nearest
+"""
+
+import functools
+import os
+
+import numpy as np
+import shapely
+import geopandas as gpd
+from pyproj import CRS, Transformer
+
+from columnar_io import read_output
+from nearest_facility import ITM_CRS
+
+# WGS84 latitude/longitude, the CRS of the outputs and the maps.
+WGS84_CRS = "epsg:4326"
+
+
+@functools.lru_cache(maxsize=None)
+def _crs(crs):
+    """Parse a CRS once (``"epsg:2157"`` and ``pyproj.CRS`` objects alike)."""
+    return CRS.from_user_input(crs)
+
+
+@functools.lru_cache(maxsize=None)
+def transformer(from_crs, to_crs):
+    """
+    Get the (cached) transformer between two CRS, with x/y (longitude/latitude) axis order.
+
+    Parameters
+    ----------
+    from_crs, to_crs : str
+        The source and target CRS (anything ``pyproj.CRS`` accepts, e.g. ``"epsg:2157"``).
+
+    Returns
+    -------
+    pyproj.Transformer
+        The transformer, shared by every call with the same CRS pair.
+    """
+    return Transformer.from_crs(_crs(from_crs), _crs(to_crs), always_xy=True)
+
+
+def transform_coordinates(coords, from_crs, to_crs):
+    """
+    Re-project an ``(n, 2)`` coordinate array.
+
+    Parameters
+    ----------
+    coords : numpy.ndarray
+        The x/y coordinates.
+    from_crs, to_crs : str
+        The source and target CRS.
+
+    Returns
+    -------
+    numpy.ndarray
+        The re-projected coordinates (``coords`` itself when the two CRS are the same).
+    """
+    if _crs(from_crs) == _crs(to_crs) or not len(coords):
+        return coords
+    x, y = transformer(_crs(from_crs), _crs(to_crs)).transform(coords[:, 0], coords[:, 1])
+    return np.column_stack([x, y])
+
+
+def reproject(data, to_crs):
+    """
+    Re-project a GeoDataFrame with the cached transformer (all coordinates in one call).
+
+    Parameters
+    ----------
+    data : geopandas.geodataframe.GeoDataFrame
+        The layer, with its CRS set.
+    to_crs : str
+        The target CRS.
+
+    Returns
+    -------
+    geopandas.geodataframe.GeoDataFrame
+        The re-projected layer, sharing its attribute columns with ``data``.
+    """
+    geometries = shapely.transform(np.asarray(data.geometry.values, dtype=object),
+                                   lambda coords: transform_coordinates(coords, data.crs, to_crs))
+    return data.set_geometry(gpd.GeoSeries(geometries, index=data.index, crs=to_crs))
+
+
+class LayerRegistry:
+    """
+    Layers of one run, with their geometries re-projected lazily and cached per CRS.
+
+    The cached frames share their attribute columns with the registered layer; treat them as read-only (copy before
+    adding columns, as :func:`nearest_facility.assign_nearest` does).
+
+    Examples
+    --------
+    >>> registry = LayerRegistry()
+    >>> registry.read("transport", "data_files/download_data/translink-stations-ni.geojson")
+    >>> FacilityIndex(registry.get("transport", ITM_CRS), "Station") # no further re-projection
+    """
+
+    def __init__(self):
+        self._layers = {}
+        self._frames = {}
+        self._points = {}
+        self._sources = {}
+
+    def __contains__(self, name):
+        return name in self._layers
+
+    def __iter__(self):
+        return iter(self._layers)
+
+    def add(self, name, data):
+        """
+        Register a layer (replacing any layer of the same name and its cached projections).
+
+        Parameters
+        ----------
+        name : str
+            The layer name.
+        data : geopandas.geodataframe.GeoDataFrame
+            The layer, with its CRS set.
+
+        Returns
+        -------
+        geopandas.geodataframe.GeoDataFrame
+            ``data``.
+        """
+        if data.crs is None:
+            raise ValueError(f"the {name} layer has no CRS")
+        self.discard(name)
+        self._layers[name] = data
+        self._frames[(name, _crs(data.crs))] = data
+        return data
+
+    def discard(self, name):
+        """Forget a layer and its cached projections."""
+        self._layers.pop(name, None)
+        self._sources.pop(name, None)
+        for cache in (self._frames, self._points):
+            for key in [key for key in cache if key[0] == name]:
+                del cache[key]
+
+    def read(self, name, filepath, columns=None, prepare=None):
+        """
+        Read and register a layer, unless the same file (same size and modification time) is already registered.
+
+        Parameters
+        ----------
+        name : str
+            The layer name.
+        filepath : str
+            The file to read (any format :func:`columnar_io.read_output` reads).
+        columns : list of str, optional
+            The attribute columns to read.
+        prepare : callable, optional
+            Applied to the layer after reading (e.g. to tidy a name column).
+
+        Returns
+        -------
+        geopandas.geodataframe.GeoDataFrame
+            The layer, in the CRS of the file.
+        """
+        st = os.stat(filepath)
+        source = (os.path.abspath(filepath), st.st_size, st.st_mtime_ns, tuple(columns or ()))
+        if self._sources.get(name) == source:
+            return self._layers[name]
+
+        data = read_output(filepath, columns=columns)
+        if prepare is not None:
+            data = prepare(data)
+        self.add(name, data)
+        self._sources[name] = source
+        return data
+
+    def get(self, name, crs=None):
+        """
+        Get a layer in a CRS, re-projecting it on first use.
+
+        Parameters
+        ----------
+        name : str
+            The layer name.
+        crs : str, optional
+            The CRS (default: the CRS the layer was registered in).
+
+        Returns
+        -------
+        geopandas.geodataframe.GeoDataFrame
+            The layer in ``crs``.
+        """
+        data = self._layers[name]
+        if crs is None:
+            return data
+        key = (name, _crs(crs))
+        if key not in self._frames:
+            self._frames[key] = reproject(data, crs)
+        return self._frames[key]
+
+    def geometry(self, name, crs=None):
+        """The geometries of a layer in a CRS, as an array of shapely geometries (see :meth:`get`)."""
+        return self.get(name, crs).geometry.values
+
+    def points(self, name, crs=ITM_CRS):
+        """
+        Get the point each feature is measured from (its centroid), in a CRS.
+
+        The centroids are taken in ``crs``, as :func:`nearest_facility.query_points` does, so distances match. To
+        measure from the whole geometries (``measure="geometry"``), :meth:`geometry` is used instead.
+
+        Parameters
+        ----------
+        name : str
+            The layer name.
+        crs : str, optional
+            The metric CRS (default EPSG:2157).
+
+        Returns
+        -------
+        numpy.ndarray
+            The points, as shapely geometries.
+        """
+        key = (name, _crs(crs))
+        if key not in self._points:
+            self._points[key] = np.asarray(self.get(name, crs).geometry.centroid.values, dtype=object)
+        return self._points[key]
+
+    def coordinates(self, name, crs=ITM_CRS, to_crs=None):
+        """
+        Get the x/y coordinates of the points of :meth:`points`.
+
+        Parameters
+        ----------
+        name : str
+            The layer name.
+        crs : str, optional
+            The CRS the centroids are taken in (default EPSG:2157).
+        to_crs : str, optional
+            Re-project the centroid coordinates to this CRS (e.g. EPSG:4326 for marker positions), with the cached
+            transformer. Only the points are re-projected, not the whole layer.
+
+        Returns
+        -------
+        numpy.ndarray
+            An ``(n, 2)`` array (NaN for missing or empty geometries).
+        """
+        points = self.points(name, crs)
+        coords = np.full((len(points), 2), np.nan)
+        valid = ~(shapely.is_missing(points) | shapely.is_empty(points))
+        coords[valid] = shapely.get_coordinates(points[valid])
+        return coords if to_crs is None else transform_coordinates(coords, crs, to_crs)
@@ -0,0 +1,104 @@
+# Repository : https://github.com/sereneeosman/egm722_serenee
+
+#========================================= Map Data Loader =======================================================================================================================
+#================================================================================================================================================================================
+"""
+Read the layers of the tourist map concurrently.
+
+``NI_TouristMap.py`` reads up to six independent files (outline, counties, distance CSV, tourist sites, coastal spots
+and, for the clustered map, GP surgeries). Reading and parsing them is mostly done outside the Python interpreter lock
+(GDAL, pyarrow, the pandas CSV parser), so :func:`load_map_layers` reads them in a thread pool, and times each read.
+
+Examples
+--------
+>>> layers = load_map_layers("data_files", data_format="parquet")
+>>> layers.counties.head()
+>>> print_timings(layers.timings)
+"""
+
+import os
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+from columnar_io import output_columns, output_path, read_output
+
+# The map layers: native file name in the data folder, and the columns the map uses.
+MAP_LAYERS = {
+    "outline": ("NI_Outline.shp", []),
+    "counties": ("NI_Counties.shp", ["CountyName"]),
+    "distances": ("NI_Tourist_trans_GP_Dist.csv", ["Tourist Sites", "Near_T_Hub", "Trans_Dist", "Near_GP",
+                                                   "GP_Dist", "PostCode"]),
+    "tourist": ("NI_Tourist_Sites.shp", ["SITE"]),
+    "coastal": ("NI_Coastal_spots.geojson", ["Name", "Website", "Near_T_Hub", "Trans_Dist", "Near_GP", "GP_Dist",
+                                             "Postcode"]),
+    "gp": ("NI_PostCodes_GP.geojson", ["PracticeName", "Address1", "Address2", "Address3", "postcode"]),
+}
+
+# Columns read when the file has them: the county of each site is written by the analysis (see county_index.py);
+# distance files from older runs don't have it, and the map assigns it itself.
+OPTIONAL_COLUMNS = {"distances": ["CountyName"]}
+
+# The loaded map layers, plus the read time of each layer in seconds (``timings``, a dict keyed by layer name).
+MapLayers = namedtuple("MapLayers", list(MAP_LAYERS) + ["timings"])
+
+
+def _timed_read(filepath, columns, optional=()):
+    """Read one layer (with the ``optional`` columns it has), returning it with the time the read took."""
+    start = time.perf_counter()
+    if optional:
+        available = output_columns(filepath)
+        columns = columns + [column for column in optional if column in available]
+    data = read_output(filepath, columns=columns)
+    return data, time.perf_counter() - start
+
+
+def load_map_layers(data_folder="data_files", data_format="native", workers=None, skip=()):
+    """
+    Read the map layers concurrently.
+
+    Parameters
+    ----------
+    data_folder : str, optional
+        The folder holding the analysis outputs (default ``data_files``).
+    data_format : str, optional
+        The format of the outputs: ``"native"`` (default), ``"parquet"`` or ``"feather"`` (see :mod:`columnar_io`).
+    workers : int, optional
+        The number of reader threads (default: one per layer).
+    skip : collection of str, optional
+        The layers not used by the map, which are not read (e.g. ``("gp",)``).
+
+    Returns
+    -------
+    MapLayers
+        The ``outline``, ``counties``, ``distances``, ``tourist``, ``coastal`` and ``gp`` layers (None if skipped),
+        and their read ``timings``.
+
+    Examples
+    --------
+    >>> layers = load_map_layers()
+    >>> m = layers.counties.explore("CountyName", cmap="Set2")
+    >>> layers = load_map_layers(skip=("gp",))
+    """
+    read = {name: layer for name, layer in MAP_LAYERS.items() if name not in skip}
+    with ThreadPoolExecutor(max_workers=workers or len(read)) as pool:
+        futures = {name: pool.submit(_timed_read, output_path(os.path.join(data_folder, filename), data_format),
+                                     columns, OPTIONAL_COLUMNS.get(name, ()))
+                   for name, (filename, columns) in read.items()}
+        results = {name: future.result() for name, future in futures.items()}
+
+    return MapLayers(timings={name: seconds for name, (_, seconds) in results.items()},
+                     **{name: results[name][0] if name in results else None for name in MAP_LAYERS})
+
+
+def print_timings(timings):
+    """
+    Print the read time of each layer.
+
+    Parameters
+    ----------
+    timings : dict
+        The ``timings`` of a :data:`MapLayers` bundle.
+    """
+    for name, seconds in timings.items():
+        print(f"{name:10s} {seconds:6.2f} s")
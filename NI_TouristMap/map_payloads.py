@@ -0,0 +1,295 @@
+# Repository : https://github.com/sereneeosman/egm722_serenee
+
+#========================================= External Map Payloads =================================================================================================================
+#================================================================================================================================================================================
+"""
+Save a Folium map with its GeoJSON layers as separate, precompressed data files.
+
+``m.save("NI_tourist_MAP.html")`` writes the GeoJSON of every layer (counties, outline, tourist sites, coastal spots)
+inline, into the HTML page: nothing is drawn until the whole document has been downloaded and parsed, and a change
+to any layer invalidates the cached page. :func:`save_external` writes the page without the layer data:
+
+* each GeoJSON layer is written to its own file in a data folder next to the page (``NI_tourist_MAP_data``), named by
+  the hash of its content (e.g. ``counties.3f2a1b9c04de.geojson``), so it can be cached for good, independently of the
+  page: an unchanged layer keeps its URL when the map is saved again;
+* a gzip (``.gz``) and a brotli (``.br``) copy of each file are written alongside, for a web server to send as they
+  are (e.g. nginx ``gzip_static`` / ``brotli_static``); the brotli copies are written when the ``brotli`` package is
+  installed (``brotli-python`` in ``environment.yml``);
+* the page fetches the files asynchronously: the base map is drawn straight away, and the layers are added as they
+  arrive, in the order of the page (so the sites are still drawn over the counties). A layer that is not on the map
+  when the page has loaded, such as a zoom tier of ``simplify_tiers.add_zoom_tiers`` for other zoom levels, is only
+  fetched when it is first shown.
+
+The page has to be opened over HTTP (browsers do not fetch files from a ``file://`` page). :func:`serve_map` is a
+small local server sending the precompressed files::
+
+    python map_payloads.py NI_tourist_MAP.html --port 8766
+
+Only GeoJSON layers (``folium.GeoJson``, as added by ``GeoDataFrame.explore``) are moved out of the page; clustered
+points (see ``point_clusters.py``) are already written as a compact array and stay in it.
+
+Examples
+--------
+>>> save_external(m, "NI_tourist_MAP.html")
+>>> save_external(m, "NI_tourist_MAP.html", encodings=("gzip",)) # gzip copies only
+"""
+
+import argparse
+import gzip
+import hashlib
+import json
+import os
+import re
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import folium
+
+# Precompressed copies written next to each file: Content-Encoding name -> file suffix.
+PAYLOAD_ENCODINGS = {"br": ".br", "gzip": ".gz"}
+
+# Content types of the files sent by serve_map.
+CONTENT_TYPES = {".html": "text/html; charset=utf-8", ".geojson": "application/geo+json", ".json": "application/json",
+                 ".js": "text/javascript", ".css": "text/css"}
+
+# Layer files written by save_external: <name>.<content hash>.geojson and their compressed copies.
+_PAYLOAD_FILE = re.compile(r".+\.[0-9a-f]{12}\.geojson(\.gz|\.br)?")
+
+# Names folium gives to unnamed elements, e.g. "macro_element_32f90519813a5e6f05c6e8e82f4de1e2" (new ones every run).
+_GENERATED_NAME = re.compile(r"[a-z_]+_[0-9a-f]{32}")
+
+# The synchronous request written by folium for a GeoJson layer that is not embedded.
+_AJAX = re.compile(r"\$\.ajax\((?P<url>\"[^\"]*\"), \{dataType: 'json', async: false\}\)\s*\.done\((?P<layer>\w+)_add\);")
+
+# Its asynchronous replacement: once the page script has run, the layers on the map are fetched at once, and added in
+# the order of the page; the others when they are first added to the map.
+# (a layer that cannot be loaded is reported in the console, and the others are still added)
+_FETCH = """var {layer}_data = null;
+            function {layer}_load() {{
+                if ({layer}_data) return;
+                {layer}_data = fetch({url})
+                    .then(function (response) {{
+                        if (!response.ok) throw new Error(response.status + " " + response.statusText);
+                        return response.json();
+                    }})
+                    .catch(function (error) {{ console.error("Could not load " + {url}, error); return null; }});
+                window.payloadsLoaded = (window.payloadsLoaded || Promise.resolve())
+                    .then(function () {{ return {layer}_data; }})
+                    .then(function (data) {{ if (data) {layer}_add(data); }});
+            }}
+            setTimeout(function () {{
+                if ({layer}._map) {layer}_load(); else {layer}.once("add", {layer}_load);
+            }}, 0);"""
+
+
+def compress(data, encoding):
+    """
+    Compress bytes with one of the :data:`PAYLOAD_ENCODINGS`, at the highest level.
+
+    Parameters
+    ----------
+    data : bytes
+        The data.
+    encoding : str
+        ``"gzip"`` or ``"br"`` (brotli, needs the ``brotli`` package).
+
+    Returns
+    -------
+    bytes
+        The compressed data (the same bytes for the same input: the gzip header carries no time stamp).
+    """
+    if encoding == "gzip":
+        return gzip.compress(data, compresslevel=9, mtime=0)
+    if encoding == "br":
+        try:
+            import brotli
+        except ImportError:
+            raise ImportError("brotli copies of the map data need the brotli package: pip install brotli "
+                              "(or save with encodings=(\"gzip\",))")
+        return brotli.compress(data, quality=11)
+    raise ValueError(f"encoding must be one of {list(PAYLOAD_ENCODINGS)}, not {encoding!r}")
+
+
+def available_encodings():
+    """
+    Get the :data:`PAYLOAD_ENCODINGS` that can be written here: gzip, and brotli when the ``brotli`` package imports.
+
+    Returns
+    -------
+    tuple of str
+        ``("gzip", "br")`` or ``("gzip",)``.
+    """
+    try:
+        import brotli # noqa: F401
+    except ImportError:
+        return ("gzip",)
+    return ("gzip", "br")
+
+
+def _write_file(filepath, data, encodings):
+    """Write a file and its precompressed copies; returns the paths written."""
+    written = [filepath]
+    with open(filepath, "wb") as f:
+        f.write(data)
+    for encoding in encodings:
+        written.append(filepath + PAYLOAD_ENCODINGS[encoding])
+        with open(written[-1], "wb") as f:
+            f.write(compress(data, encoding))
+    return written
+
+
+def geojson_layers(m):
+    """
+    Find the GeoJSON layers of a Folium map, in the order of the page.
+
+    Parameters
+    ----------
+    m : folium.Map
+        The map.
+
+    Returns
+    -------
+    list of folium.GeoJson
+        The GeoJSON layers (including those added by ``GeoDataFrame.explore``).
+    """
+    layers = []
+    for child in m._children.values():
+        if isinstance(child, folium.GeoJson):
+            layers.append(child)
+        layers.extend(geojson_layers(child))
+    return layers
+
+
+def _payload_name(layer, position):
+    """The file name stem of a layer: its name if it was given one, else its position in the page."""
+    if layer.layer_name and not _GENERATED_NAME.fullmatch(layer.layer_name):
+        stem = re.sub(r"[^A-Za-z0-9_-]+", "_", layer.layer_name).strip("_")
+        if stem:
+            return stem
+    return f"layer{position}"
+
+
+def save_external(m, filepath, data_folder=None, encodings=None):
+    """
+    Save a Folium map, writing the data of its GeoJSON layers to separate files fetched by the page.
+
+    Parameters
+    ----------
+    m : folium.Map
+        The map. It is left as it was: it can still be saved with ``m.save``.
+    filepath : str
+        The HTML file.
+    data_folder : str, optional
+        The folder of the layer files (default: ``<page name>_data`` next to the page). Layer files of earlier
+        saves that are not used by the page any more are removed from it.
+    encodings : tuple of str, optional
+        The precompressed copies to write, among ``"gzip"`` and ``"br"`` (default: both, or gzip only when the
+        ``brotli`` package is not installed, see :func:`available_encodings`).
+
+    Returns
+    -------
+    dict
+        The size in bytes of every file written (the page, the layer files and their copies), by path.
+
+    Examples
+    --------
+    >>> sizes = save_external(m, "NI_tourist_MAP.html")
+    """
+    encodings = available_encodings() if encodings is None else encodings
+    for encoding in encodings:
+        compress(b"", encoding) # fail before writing anything if an encoding is unavailable
+
+    filepath = os.path.abspath(filepath)
+    data_folder = os.path.abspath(data_folder or os.path.splitext(filepath)[0] + "_data")
+    os.makedirs(data_folder, exist_ok=True)
+
+    layers = geojson_layers(m)
+    written = []
+    saved_state = [(layer.embed, layer.embed_link) for layer in layers]
+    try:
+        for position, layer in enumerate(layers):
+            data = json.dumps(layer.data, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+            digest = hashlib.sha256(data).hexdigest()[:12]
+            payload = os.path.join(data_folder, f"{_payload_name(layer, position)}.{digest}.geojson")
+            written += _write_file(payload, data, encodings)
+            layer.embed = False
+            layer.embed_link = os.path.relpath(payload, os.path.dirname(filepath)).replace(os.sep, "/")
+
+        html, replaced = _AJAX.subn(lambda match: _FETCH.format(url=match["url"], layer=match["layer"]),
+                                    m.get_root().render())
+    finally:
+        for layer, (embed, embed_link) in zip(layers, saved_state):
+            layer.embed, layer.embed_link = embed, embed_link
+    if replaced != len(layers):
+        raise RuntimeError(f"found {replaced} of the {len(layers)} GeoJSON layer requests in the page; "
+                           f"this version of folium ({folium.__version__}) writes them differently")
+
+    written += _write_file(filepath, html.encode("utf-8"), encodings)
+
+    # layer files of earlier saves
+    for filename in os.listdir(data_folder):
+        if _PAYLOAD_FILE.fullmatch(filename) and os.path.join(data_folder, filename) not in written:
+            os.remove(os.path.join(data_folder, filename))
+    return {path: os.path.getsize(path) for path in written}
+
+
+#================================================================= Map Server ===================================================================================================
+
+def serve_map(filepath, host="127.0.0.1", port=8766):
+    """
+    Serve a map saved by :func:`save_external` at ``http://host:port/`` (blocks until interrupted).
+
+    Each file is sent from its brotli or gzip copy when the browser accepts it. The layer files, named by their
+    content, are sent as cacheable for a year; the page is revalidated on every visit.
+
+    Parameters
+    ----------
+    filepath : str
+        The HTML file; the files of its folder are served.
+    host : str, optional
+        The address to listen on (default: localhost only).
+    port : int, optional
+        The port to listen on (default 8766).
+    """
+    root = os.path.dirname(os.path.abspath(filepath))
+    index = os.path.basename(filepath)
+
+    class MapHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            path = self.path.split("?")[0].lstrip("/") or index
+            local = os.path.abspath(os.path.join(root, *path.split("/")))
+            if os.path.commonpath([root, local]) != root or not os.path.isfile(local):
+                self.send_error(404)
+                return
+
+            accepted = {value.split(";")[0].strip() for value in self.headers.get("Accept-Encoding", "").split(",")}
+            encoding = next((name for name, suffix in PAYLOAD_ENCODINGS.items()
+                             if name in accepted and os.path.isfile(local + suffix)), None)
+            with open(local + PAYLOAD_ENCODINGS[encoding] if encoding else local, "rb") as f:
+                body = f.read()
+
+            self.send_response(200)
+            self.send_header("Content-Type", CONTENT_TYPES.get(os.path.splitext(local)[1], "application/octet-stream"))
+            if encoding:
+                self.send_header("Content-Encoding", encoding)
+            self.send_header("Content-Length", str(len(body)))
+            self.send_header("Vary", "Accept-Encoding")
+            immutable = local.endswith(".geojson")
+            self.send_header("Cache-Control", "public, max-age=31536000, immutable" if immutable else "no-cache")
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    with ThreadingHTTPServer((host, port), MapHandler) as server:
+        print(f"Serving {os.path.abspath(filepath)} at http://{host}:{server.server_port}/")
+        server.serve_forever()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve a map saved with external data files for local testing.")
+    parser.add_argument("html", help="path to the map HTML file")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8766)
+    args = parser.parse_args()
+    serve_map(args.html, args.host, args.port)
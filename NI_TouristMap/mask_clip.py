@@ -0,0 +1,116 @@
+# Repository : https://github.com/sereneeosman/egm722_serenee
+
+#========================================= Clip to Mask ==========================================================================================================================
+#================================================================================================================================================================================
+"""
+Clip a layer to a mask polygon (e.g. the counties to the NI outline), intersecting only the features that cross it.
+
+``gpd.overlay(..., how="intersection")`` builds a full overlay of both layers, although the mask here is a single
+outline. :func:`clip_to_mask` merges and prepares the mask once, then sorts the features:
+
+* features whose bounding box misses the mask's bounding box, or that don't intersect the mask, are dropped;
+* features fully inside the mask are copied through unchanged;
+* only the features crossing the mask boundary are intersected with it, optionally in worker processes.
+
+Examples
+--------
+>>> clipped_counties = clip_to_mask(prj_counties, clip_data)
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import shapely
+import geopandas as gpd
+
+# Geometry type ids kept for each input type id when ``keep_geom_type`` is True:
+# points, lines and polygons (single or multi) keep their dimension.
+_SAME_DIMENSION = {0: (0, 4), 4: (0, 4), 1: (1, 2, 5), 2: (1, 2, 5), 5: (1, 2, 5), 3: (3, 6), 6: (3, 6)}
+
+
+def _intersect(geometries, mask, keep_geom_type=True):
+    """Intersect geometries with the mask, keeping only the parts with the dimension of the input."""
+    geometries = np.asarray(geometries, dtype=object)
+    clipped = shapely.intersection(geometries, mask)
+    if not keep_geom_type:
+        return clipped
+
+    for i, (source, result) in enumerate(zip(shapely.get_type_id(geometries), shapely.get_type_id(clipped))):
+        keep = _SAME_DIMENSION.get(int(source))
+        if keep is None or result in keep:
+            continue
+        parts = shapely.get_parts(clipped[i])
+        parts = parts[np.isin(shapely.get_type_id(parts), keep)]
+        if not len(parts):
+            clipped[i] = None
+        elif keep[0] == 0:
+            clipped[i] = shapely.multipoints(parts)
+        elif keep[0] == 1:
+            clipped[i] = shapely.multilinestrings(shapely.get_parts(parts))
+        else:
+            clipped[i] = shapely.multipolygons(shapely.get_parts(parts))
+    return clipped
+
+
+def clip_to_mask(data, mask, keep_geom_type=True, workers=1):
+    """
+    Clip a layer to a mask, only running the intersection on the features crossing the mask boundary.
+
+    Parameters
+    ----------
+    data : geopandas.geodataframe.GeoDataFrame
+        The layer to clip (e.g. the counties).
+    mask : geopandas.geodataframe.GeoDataFrame, geopandas.geoseries.GeoSeries or shapely geometry
+        The mask (e.g. the NI outline). Its geometries are merged (when there are several), and re-projected to
+        the CRS of ``data``.
+    keep_geom_type : bool, optional
+        True (default) to keep only the parts of each result with the same dimension as the input feature, as
+        ``gpd.overlay(..., keep_geom_type=True)`` does (e.g. no lines where a county touches the mask edge).
+    workers : int, optional
+        The number of worker processes intersecting the crossing features (default 1: in this process).
+
+    Returns
+    -------
+    geopandas.geodataframe.GeoDataFrame
+        The features of ``data`` that overlap the mask, with their attributes and index, clipped to the mask.
+
+    Examples
+    --------
+    >>> clipped_counties = clip_to_mask(prj_counties, clip_data)
+    """
+    if isinstance(mask, (gpd.GeoDataFrame, gpd.GeoSeries)):
+        if mask.crs is not None and data.crs is not None:
+            mask = mask.to_crs(data.crs)
+        geometries = mask.geometry.values
+        mask = geometries[0] if len(geometries) == 1 else shapely.union_all(geometries)
+    mask = shapely.from_wkb(shapely.to_wkb(mask)) # a copy, so the caller's geometry isn't left prepared
+    shapely.prepare(mask)
+
+    values = np.asarray(data.geometry.values, dtype=object)
+    clipped = np.full(len(values), None, dtype=object)
+
+    # bounding box rejection, then the prepared mask sorts the rest into inside / crossing / outside
+    minx, miny, maxx, maxy = shapely.bounds(mask)
+    bounds = shapely.bounds(values)
+    near = np.flatnonzero(~shapely.is_missing(values) & (bounds[:, 0] <= maxx) & (bounds[:, 2] >= minx)
+                          & (bounds[:, 1] <= maxy) & (bounds[:, 3] >= miny))
+    inside = shapely.contains_properly(mask, values[near])
+    clipped[near[inside]] = values[near[inside]]
+    rest = near[~inside]
+    crossing = rest[shapely.intersects(mask, values[rest])]
+
+    # the prepared index only speeds up the predicates above; GEOS intersects faster without it
+    shapely.destroy_prepared(mask)
+
+    if workers > 1 and len(crossing) > 1:
+        chunks = np.array_split(crossing, min(workers, len(crossing)))
+        with ProcessPoolExecutor(max_workers=len(chunks)) as pool:
+            results = pool.map(_intersect, [values[chunk] for chunk in chunks], [mask] * len(chunks),
+                               [keep_geom_type] * len(chunks))
+            for chunk, result in zip(chunks, results):
+                clipped[chunk] = result
+    elif len(crossing):
+        clipped[crossing] = _intersect(values[crossing], mask, keep_geom_type)
+
+    keep = ~(shapely.is_missing(clipped) | shapely.is_empty(clipped))
+    return data[keep].set_geometry(clipped[keep], crs=data.crs)
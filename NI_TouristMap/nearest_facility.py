@@ -0,0 +1,555 @@
+# Repository : https://github.com/sereneeosman/egm722_serenee
+
+#========================================= Nearest Facility Search ===============================================================================================================
+#================================================================================================================================================================================
+"""
+Batched nearest-facility search for tourist sites and other query layers.
+
+Section 4.ii of ``Integrated_Data_Analysis.py`` used to walk every tourist site with ``iterrows()`` and measure the
+distance to *every* transport hub and GP surgery, which costs O(sites x facilities). This module builds a spatial
+index (Shapely ``STRtree``) over the facility points once, in the Irish Transverse Mercator projection (EPSG:2157),
+and answers the nearest-facility question for all query geometries in a single call.
+
+Facilities sharing a location (e.g. the several practices of one health centre) are indexed once: the tree holds
+one entry per distinct geometry, which carries the list of the facilities found there (:meth:`FacilityIndex.colocated`).
+
+Examples
+--------
+>>> transport_index = FacilityIndex(transport, "Station")
+>>> gp_index = FacilityIndex(post_gp, "PracticeName")
+>>> facility_layers = {("Near_T_Hub", "Trans_Dist"): transport_index, ("Near_GP", "GP_Dist"): gp_index}
+>>> tourist, coastline = assign_nearest([tourist, coastline_tmp], facility_layers)
+"""
+
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+import shapely
+from scipy.spatial import cKDTree
+
+# Irish Transverse Mercator, the metric CRS used for every distance calculation.
+ITM_CRS = "epsg:2157"
+
+# How a query feature is measured from: its centroid, or its whole geometry (the true minimum distance from a polygon,
+# 0 for a facility inside it).
+MEASURE_MODES = ("centroid", "geometry")
+
+# Flat, array-backed result of a radius search: one entry per (query, facility) pair,
+# sorted by query position and then by distance.
+RadiusMatches = namedtuple("RadiusMatches", ["query", "index", "distance"])
+
+
+def query_points(features, crs=ITM_CRS, measure="centroid"):
+    """
+    Get the geometry used to measure distance from each feature.
+
+    With ``measure="centroid"``, polygons are represented by their centroid and points are kept as they are. With
+    ``measure="geometry"``, the whole geometries are used, so the distance of a polygon is measured from its nearest
+    edge (e.g. the estate wall of a large park, rather than its middle).
+
+    Parameters
+    ----------
+    features : geopandas.geodataframe.GeoDataFrame
+        The query features (e.g. tourist site polygons or coastal spot points).
+    crs : str, optional
+        The metric CRS to measure distances in (default EPSG:2157).
+    measure : str, optional
+        ``"centroid"`` (default) or ``"geometry"``, see :data:`MEASURE_MODES`.
+
+    Returns
+    -------
+    numpy.ndarray
+        An array of shapely geometries in ``crs``.
+
+    Examples
+    --------
+    >>> pts = query_points(tourist)
+    >>> polygons = query_points(tourist, measure="geometry")
+    """
+    if measure not in MEASURE_MODES:
+        raise ValueError(f"measure must be one of {MEASURE_MODES}, not {measure!r}")
+    geometries = features.geometry.to_crs(crs)
+    return geometries.values if measure == "geometry" else geometries.centroid.values
+
+
+class FacilityIndex:
+    """
+    Spatial index over a layer of facilities (transport hubs, GP surgeries, ...).
+
+    Facilities with identical geometries (co-located practices) share one tree entry, a *location*. A query finds the
+    nearest location, and returns its first facility (the lowest position, as a search over every facility would);
+    :meth:`colocated` and :meth:`take_colocated` give all the facilities of that location, in position order.
+
+    Parameters
+    ----------
+    facilities : geopandas.geodataframe.GeoDataFrame
+        The facility layer. It is re-projected to ``crs`` once, when the index is built.
+    name_column : str
+        The column holding the facility name returned by the queries.
+    crs : str, optional
+        The metric CRS to measure distances in (default EPSG:2157).
+    key_column : str, optional
+        A column holding a unique key of each facility (e.g. ``"PracNo"``), to join results back to the facility
+        rows without matching on names. By default the key is the tree position.
+
+    Attributes
+    ----------
+    facilities : geopandas.geodataframe.GeoDataFrame
+        The re-projected facility layer, with a 0..n-1 index matching the tree positions.
+    names : numpy.ndarray
+        The facility names, in tree order.
+    keys : pandas.Index
+        The unique facility keys, in tree order.
+    location : numpy.ndarray
+        The location of each facility (-1 for missing or empty geometries). Locations are numbered in the order of
+        their first facility.
+    tree : shapely.STRtree
+        The spatial index over the distinct facility locations.
+    kdtree : scipy.spatial.cKDTree
+        A KD-tree over the facility coordinates, used by :meth:`k_nearest` (built on first use).
+
+    Examples
+    --------
+    >>> gp_index = FacilityIndex(post_gp, "PracticeName", key_column="PracNo")
+    >>> idx, dist = gp_index.nearest(query_points(tourist))
+    """
+
+    def __init__(self, facilities, name_column, crs=ITM_CRS, key_column=None):
+        self.crs = crs
+        self.name_column = name_column
+        self.key_column = key_column
+        self.facilities = facilities.to_crs(crs).reset_index(drop=True)
+        self.names = self.facilities[name_column].to_numpy()
+        self.keys = pd.Index(self.facilities[key_column] if key_column else self.facilities.index)
+        if not self.keys.is_unique:
+            raise ValueError(f"the {key_column} column holds duplicate keys")
+        self._index_locations(np.asarray(self.facilities.geometry.values, dtype=object))
+        self._kdtree = None
+
+    def _index_locations(self, geometries):
+        """Group the facilities by identical geometry and build the tree over one geometry per group."""
+        wkb = shapely.to_wkb(geometries)
+        wkb[shapely.is_empty(geometries)] = None
+        # factorize numbers the locations in order of first appearance (-1 for missing geometries)
+        self.location = pd.factorize(wkb, use_na_sentinel=True)[0].astype(np.intp)
+
+        members = np.argsort(self.location, kind="stable")
+        members = members[self.location[members] >= 0]
+        n_locations = int(self.location.max()) + 1 if len(self.location) else 0
+        self._members = members # facility positions grouped by location, each group in position order
+        self._offsets = np.searchsorted(self.location[members], np.arange(n_locations + 1))
+        self._first = members[self._offsets[:-1]]
+        self.tree = shapely.STRtree(geometries[self._first])
+
+    def __len__(self):
+        return len(self.facilities)
+
+    def nearest(self, geometries):
+        """
+        Find the nearest facility for every query geometry in one batched call.
+
+        Parameters
+        ----------
+        geometries : array-like of shapely geometries
+            The query geometries, already in the index CRS. Distances are measured from the whole geometry (0 for a
+            facility inside a polygon), so pass centroids to measure from the centroid.
+
+        Returns
+        -------
+        tuple of numpy.ndarray
+            ``(index, distance)`` : the position of the nearest facility (-1 for empty/missing geometries)
+            and the distance to it in CRS units (NaN for empty/missing geometries).
+
+        Examples
+        --------
+        >>> idx, dist = gp_index.nearest(query_points(tourist))
+        >>> idx, dist = gp_index.nearest(query_points(tourist, measure="geometry")) # from the nearest edge
+        """
+        geometries = np.asarray(geometries, dtype=object)
+        index = np.full(len(geometries), -1, dtype=np.intp)
+        distance = np.full(len(geometries), np.nan)
+
+        query_pos, tree_pos, dist, first = self._nearest_matches(geometries)
+        index[query_pos[first]] = self._first[tree_pos[first]]
+        distance[query_pos[first]] = dist[first]
+        return index, distance
+
+    def _nearest_matches(self, geometries):
+        """
+        Find every location tied at the minimum distance of each query geometry.
+
+        Returns ``(query_pos, tree_pos, distance, first)``: the matching pairs sorted by query and location, and the
+        position of the first (nearest) match of each query in them.
+        """
+        # all_matches=True returns every facility tied at the minimum distance; keep the lowest position
+        # so that ties are broken the same way as ``argmin()`` on the full distance series.
+        # (locations are numbered by their first facility, so the lowest location holds the lowest position)
+        (query_pos, tree_pos), dist = self.tree.query_nearest(geometries, return_distance=True, all_matches=True)
+        order = np.lexsort((tree_pos, query_pos))
+        query_pos, tree_pos, dist = query_pos[order], tree_pos[order], dist[order]
+        _, first = np.unique(query_pos, return_index=True)
+        return query_pos, tree_pos, dist, first
+
+    def colocated(self, index):
+        """
+        Find every facility sharing the location of each given facility.
+
+        Parameters
+        ----------
+        index : numpy.ndarray
+            Facility positions, as returned by :meth:`nearest` (-1 for none).
+
+        Returns
+        -------
+        list of numpy.ndarray
+            The positions of the facilities at the same location, in position order (empty for -1).
+
+        Examples
+        --------
+        >>> idx, dist = gp_index.nearest(query_points(tourist))
+        >>> gp_index.colocated(idx)[0] # every practice at the nearest health centre of the first site
+        """
+        index = np.asarray(index)
+        location = np.where(index < 0, -1, self.location[np.where(index < 0, 0, index)])
+        empty = np.empty(0, dtype=np.intp)
+        return [self._members[self._offsets[loc]:self._offsets[loc + 1]] if loc >= 0 else empty for loc in location]
+
+    def take_colocated(self, index, column=None):
+        """
+        Look up a column of every facility sharing the location of each given facility.
+
+        Parameters
+        ----------
+        index : numpy.ndarray
+            Facility positions, as returned by :meth:`nearest` (-1 for none).
+        column : str, optional
+            The facility column (default: the name column).
+
+        Returns
+        -------
+        numpy.ndarray
+            An object array of tuples of values, one tuple per position (an empty tuple for -1).
+
+        Examples
+        --------
+        >>> gp_index.take_colocated(idx) # (('Dr. QUINN & PARTNERS', 'Dr. THOMASIUS & PARTNER', ...), ...)
+        """
+        values = self.names if column is None else self.facilities[column].to_numpy()
+        out = np.empty(len(index), dtype=object)
+        out[:] = [tuple(values[members].tolist()) for members in self.colocated(index)]
+        return out
+
+    @property
+    def kdtree(self):
+        """The KD-tree over the facility coordinates, built on first use."""
+        if self._kdtree is None:
+            coords = shapely.get_coordinates(shapely.centroid(self.facilities.geometry.values))
+            self._kdtree = cKDTree(coords)
+        return self._kdtree
+
+    def k_nearest(self, geometries, k):
+        """
+        Find the ``k`` nearest facilities for every query geometry.
+
+        Distances are measured from the centroid of each query geometry to the facility points.
+
+        Parameters
+        ----------
+        geometries : array-like of shapely geometries
+            The query geometries, already in the index CRS.
+        k : int
+            The number of facilities to return per query.
+
+        Returns
+        -------
+        tuple of numpy.ndarray
+            ``(index, distance)`` : two ``(n_queries, k)`` arrays, ordered from nearest to farthest. Missing
+            neighbours (fewer than ``k`` facilities, or empty query geometries) have index -1 and distance NaN.
+
+        Examples
+        --------
+        >>> idx, dist = rail_index.k_nearest(query_points(tourist), k=3)
+        """
+        geometries = np.asarray(geometries, dtype=object)
+        valid = ~(shapely.is_missing(geometries) | shapely.is_empty(geometries))
+        coords = shapely.get_coordinates(shapely.centroid(geometries[valid]))
+
+        index = np.full((valid.size, k), -1, dtype=np.intp)
+        distance = np.full((valid.size, k), np.nan)
+        if len(coords) and len(self):
+            dist, idx = self.kdtree.query(coords, k=k)
+            dist, idx = dist.reshape(-1, k), idx.reshape(-1, k)
+            found = idx < len(self) # cKDTree pads missing neighbours with n and inf
+
+            index[valid] = np.where(found, idx, -1)
+            distance[valid] = np.where(found, dist, np.nan)
+        return index, distance
+
+    def within(self, geometries, radius):
+        """
+        Find every facility within ``radius`` of each query geometry.
+
+        Parameters
+        ----------
+        geometries : array-like of shapely geometries
+            The query geometries, already in the index CRS.
+        radius : float
+            The search radius in CRS units (metres for EPSG:2157).
+
+        Returns
+        -------
+        RadiusMatches
+            Flat ``query``, ``index`` and ``distance`` arrays with one entry per matching pair, sorted by query
+            position and then by distance.
+
+        Examples
+        --------
+        >>> matches = gp_index.within(query_points(tourist), 5000) # all GPs within 5 km
+        >>> gp_index.take_names(matches.index[matches.query == 0])
+        """
+        geometries = np.asarray(geometries, dtype=object)
+        query_pos, tree_pos = self.tree.query(geometries, predicate="dwithin", distance=radius)
+        dist = shapely.distance(geometries[query_pos], self.tree.geometries[tree_pos])
+
+        # expand each matching location to its facilities (the distance is measured once per location)
+        counts = np.diff(self._offsets)[tree_pos]
+        starts = np.repeat(self._offsets[tree_pos] - np.cumsum(counts) + counts, counts)
+        facility_pos = self._members[starts + np.arange(counts.sum())]
+        query_pos, dist = np.repeat(query_pos, counts), np.repeat(dist, counts)
+
+        order = np.lexsort((facility_pos, dist, query_pos))
+        return RadiusMatches(query_pos[order], facility_pos[order], dist[order])
+
+    def take(self, index, column):
+        """
+        Look up a facility column by tree position, returning ``None`` for -1.
+
+        Parameters
+        ----------
+        index : numpy.ndarray
+            Facility positions as returned by :meth:`nearest` or :meth:`positions`.
+        column : str
+            The facility column (e.g. ``"postcode"``).
+
+        Returns
+        -------
+        numpy.ndarray
+            An object array of the column values, with the same shape as ``index``.
+
+        Examples
+        --------
+        >>> tourist_out["postcode"] = gp_index.take(gp_index.positions(tourist["Near_GP_No"]), "postcode")
+        """
+        values = self.facilities[column].to_numpy()[np.where(index < 0, 0, index)].astype(object)
+        values[index < 0] = None
+        return values
+
+    def take_names(self, index):
+        """
+        Look up facility names by tree position, returning ``None`` for -1.
+
+        Parameters
+        ----------
+        index : numpy.ndarray
+            Facility positions as returned by :meth:`nearest`.
+
+        Returns
+        -------
+        numpy.ndarray
+            An object array of facility names, with the same shape as ``index``.
+        """
+        names = self.names[np.where(index < 0, 0, index)].astype(object)
+        names[index < 0] = None
+        return names
+
+    def take_keys(self, index):
+        """
+        Look up facility keys by tree position, returning ``None`` for -1.
+
+        Parameters
+        ----------
+        index : numpy.ndarray
+            Facility positions as returned by :meth:`nearest`.
+
+        Returns
+        -------
+        numpy.ndarray
+            An object array of facility keys, with the same shape as ``index``.
+        """
+        keys = self.keys.to_numpy()[np.where(index < 0, 0, index)].astype(object)
+        keys[index < 0] = None
+        return keys
+
+    def positions(self, keys):
+        """
+        Find the tree position of each facility key (a hash lookup), -1 for unknown or missing keys.
+
+        Parameters
+        ----------
+        keys : array-like
+            Facility keys, e.g. the key column written by :func:`assign_nearest`.
+
+        Returns
+        -------
+        numpy.ndarray
+            The facility positions.
+        """
+        return self.keys.get_indexer(pd.Index(keys))
+
+
+def build_facility_indexes(facility_layers, crs=ITM_CRS, registry=None):
+    """
+    Build (or reuse) one :class:`FacilityIndex` per facility layer.
+
+    Parameters
+    ----------
+    facility_layers : dict
+        Maps the output columns (see :func:`assign_nearest`) to either a ready :class:`FacilityIndex` or a
+        ``(GeoDataFrame, name_column)`` or ``(GeoDataFrame, name_column, key_column)`` tuple to index. With a
+        ``registry``, the GeoDataFrame can be given as the name of a registered layer.
+    crs : str, optional
+        The metric CRS to measure distances in (default EPSG:2157).
+    registry : layer_registry.LayerRegistry, optional
+        The registry of the named layers; their cached ``crs`` projection is indexed.
+
+    Returns
+    -------
+    dict
+        The same keys, mapped to :class:`FacilityIndex` objects.
+
+    Examples
+    --------
+    >>> indexes = build_facility_indexes({("Near_GP", "GP_Dist"): (post_gp, "PracticeName")})
+    """
+    indexes = {}
+    for columns, layer in facility_layers.items():
+        if isinstance(layer, FacilityIndex):
+            indexes[columns] = layer
+        else:
+            facilities, name_column, *key_column = layer
+            if isinstance(facilities, str):
+                facilities = registry.get(facilities, crs)
+            indexes[columns] = FacilityIndex(facilities, name_column, crs=crs, key_column=key_column[0] if key_column else None)
+    return indexes
+
+
+def assign_nearest(features, facility_layers, registry=None, measure="centroid", cache=None):
+    """
+    Add the nearest facility name and distance columns to one or more query layers.
+
+    Each facility index is built once and reused for every query layer, so adding another query layer (e.g.
+    accommodation points) costs one batched lookup per facility layer. Polygons are measured from their centroid
+    (default) or from their nearest edge (``measure="geometry"``), points from themselves. Distances are written in
+    km, rounded to 2 decimal places.
+
+    Parameters
+    ----------
+    features : geopandas.geodataframe.GeoDataFrame, str, list or dict
+        A single query layer, a list of query layers, or a dict of named query layers. With a ``registry``, a
+        query layer can be given as the name of a registered layer.
+    facility_layers : dict
+        Maps the output columns ``(near_column, dist_column)`` to a :class:`FacilityIndex` or a
+        ``(GeoDataFrame, name_column)`` tuple, e.g. ``{("Near_GP", "GP_Dist"): gp_index}``. A third column,
+        ``(near_column, dist_column, key_column)``, also receives the key of the nearest facility (see
+        :class:`FacilityIndex`), to join facility attributes back without matching on names. A fourth column,
+        ``(near_column, dist_column, key_column, colocated_column)``, receives the names of every facility at the
+        nearest location, as a tuple (``key_column`` may be None).
+    registry : layer_registry.LayerRegistry, optional
+        The registry of the named layers. Their query points are taken from (and kept in) the registry, so a layer
+        queried again in the same run is not re-projected.
+    measure : str, optional
+        ``"centroid"`` (default) or ``"geometry"``: measure from the centroid or the whole geometry of each query
+        feature (see :func:`query_points`). Both are one batched nearest query on the spatial index.
+    cache : distance_cache.DistanceCache, optional
+        An on-disk cache of earlier results: the named layers are then only searched for the sites and facilities
+        that changed since the last run (one cache entry per query layer, facility layer and ``measure``).
+
+    Returns
+    -------
+    geopandas.geodataframe.GeoDataFrame, list or dict
+        Copies of the query layers with the new columns, in the same container as ``features``.
+
+    Examples
+    --------
+    >>> facility_layers = {("Near_T_Hub", "Trans_Dist"): transport_index, ("Near_GP", "GP_Dist"): gp_index}
+    >>> tourist, coastline = assign_nearest([tourist, coastline_tmp], facility_layers)
+    >>> tourist = assign_nearest("tourist", facility_layers, registry)
+    """
+    if measure not in MEASURE_MODES:
+        raise ValueError(f"measure must be one of {MEASURE_MODES}, not {measure!r}")
+    indexes = build_facility_indexes(facility_layers, registry=registry)
+
+    if isinstance(features, dict):
+        layers = list(features.values())
+    elif isinstance(features, (list, tuple)):
+        layers = list(features)
+    else:
+        layers = [features]
+
+    results = []
+    for layer in layers:
+        name = layer if isinstance(layer, str) else None
+        out = registry.get(name).copy() if name is not None else layer.copy()
+        pts = {} # query points per CRS, so each layer is re-projected once
+
+        for (near_column, dist_column, *extra_columns), index in indexes.items():
+            if index.crs not in pts:
+                if name is None:
+                    pts[index.crs] = query_points(layer, index.crs, measure)
+                elif measure == "geometry":
+                    pts[index.crs] = registry.geometry(name, index.crs)
+                else:
+                    pts[index.crs] = registry.points(name, index.crs)
+            if cache is not None and name is not None:
+                entry = f"{name}-{near_column}-{measure}"
+                idx, dist = cache.nearest(entry, index, pts[index.crs], cache.ids(name, out))
+            else:
+                idx, dist = index.nearest(pts[index.crs])
+
+            out[near_column] = index.take_names(idx)
+            out[dist_column] = np.round(dist / 1000, 2) # distance in km
+            key_column, colocated_column = (list(extra_columns) + [None, None])[:2]
+            if key_column:
+                out[key_column] = index.take_keys(idx)
+            if colocated_column:
+                out[colocated_column] = index.take_colocated(idx)
+        results.append(out)
+
+    if isinstance(features, dict):
+        return dict(zip(features.keys(), results))
+    if isinstance(features, (list, tuple)):
+        return results
+    return results[0]
+
+
+def indexes_by_type(facilities, name_column, type_column, crs=ITM_CRS):
+    """
+    Build one :class:`FacilityIndex` per facility type.
+
+    Used to keep rail and bus stations apart, via the ``Type`` field of ``translink-stations-ni.geojson``
+    (``"R"`` rail, ``"B"`` bus, ``"I"`` interchange).
+
+    Parameters
+    ----------
+    facilities : geopandas.geodataframe.GeoDataFrame
+        The facility layer.
+    name_column : str
+        The column holding the facility name.
+    type_column : str
+        The column to split the facilities on.
+    crs : str, optional
+        The metric CRS to measure distances in (default EPSG:2157).
+
+    Returns
+    -------
+    dict
+        Maps each value of ``type_column`` to a :class:`FacilityIndex`.
+
+    Examples
+    --------
+    >>> stations = indexes_by_type(transport, "Station", "Type")
+    >>> idx, dist = stations["R"].k_nearest(query_points(tourist), k=3) # 3 nearest rail stations
+    """
+    return {value: FacilityIndex(group, name_column, crs=crs)
+            for value, group in facilities.groupby(type_column, sort=True)}
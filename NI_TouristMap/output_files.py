@@ -0,0 +1,44 @@
+# Repository : https://github.com/sereneeosman/egm722_serenee
+
+#========================================= Output Files ==========================================================================================================================
+#================================================================================================================================================================================
+"""
+The files making up an input or output path of the analysis.
+
+A path in ``data_files`` is not always one file: a shapefile is stored in several files next to each other, and the
+postcode index is a folder. :func:`content_files` lists the files behind a path, for the content hashes of
+:mod:`pipeline` and the bytes read and written in :mod:`run_report`.
+
+Examples
+--------
+>>> content_files("data_files/NI_Counties.shp")
+['data_files/NI_Counties.shp', 'data_files/NI_Counties.shx', 'data_files/NI_Counties.dbf', ...]
+"""
+
+import glob
+import os
+
+# Shapefiles are stored in several files; they are hashed and counted together.
+SHAPEFILE_PARTS = (".shp", ".shx", ".dbf", ".prj", ".cpg")
+
+
+def content_files(path):
+    """
+    List the files whose content makes up a path.
+
+    Parameters
+    ----------
+    path : str
+        A file, a shapefile (its parts are listed with it) or a folder (its files are listed, recursively).
+
+    Returns
+    -------
+    list of str
+        The existing files, in a stable order (empty if the path does not exist).
+    """
+    if os.path.isdir(path):
+        return sorted(f for f in glob.glob(os.path.join(path, "**", "*"), recursive=True) if os.path.isfile(f))
+    stem, ext = os.path.splitext(path)
+    if ext.lower() == ".shp":
+        return [stem + part for part in SHAPEFILE_PARTS if os.path.exists(stem + part)]
+    return [path] if os.path.exists(path) else []
@@ -0,0 +1,207 @@
+# Repository : https://github.com/sereneeosman/egm722_serenee
+
+#========================================= Incremental Pipeline Runner ===========================================================================================================
+#================================================================================================================================================================================
+"""
+Stage-based runner that only reruns the stages whose inputs or parameters changed.
+
+Each :class:`Stage` names its input files, output files and parameters. After a stage runs, the content hash (SHA-256)
+of each input file and the parameters are recorded in a JSON state file. On the next run, a stage is skipped when its
+input hashes and parameters are unchanged and its outputs still exist. Since the outputs of one stage are the inputs
+of the next, a stage that reruns but writes identical files does not trigger the stages after it.
+
+Examples
+--------
+>>> pipeline = Pipeline([Stage("fix_outline", fix_outline, inputs={...}, outputs={...})], "data_files/.pipeline_state.json")
+>>> pipeline.run()
+"""
+
+import hashlib
+import json
+import os
+
+import run_report
+from output_files import content_files
+
+
+def file_hash(path, known=None, blocksize=1 << 20):
+    """
+    Compute the SHA-256 content hash of a file, a shapefile (all of its parts) or a folder.
+
+    Parameters
+    ----------
+    path : str
+        The path to hash.
+    known : dict, optional
+        Previously recorded ``{"size": ..., "mtime": ..., "sha256": ...}`` for ``path``. When the size and
+        modification time of every part are unchanged, the recorded hash is reused without reading the file.
+    blocksize : int, optional
+        The number of bytes read at a time.
+
+    Returns
+    -------
+    dict or None
+        ``{"size": ..., "mtime": ..., "sha256": ...}``, or None if ``path`` does not exist.
+
+    Examples
+    --------
+    >>> file_hash("data_files/download_data/gp-practice-reference-file---jan-2024.csv")["sha256"]
+    """
+    files = content_files(path)
+    if not files:
+        return None
+
+    stats = [os.stat(f) for f in files]
+    size = sum(st.st_size for st in stats)
+    mtime = max(st.st_mtime_ns for st in stats)
+    if known and known.get("size") == size and known.get("mtime") == mtime:
+        return known
+
+    digest = hashlib.sha256()
+    for f in files:
+        digest.update(os.path.relpath(f, os.path.dirname(path)).encode())
+        with open(f, "rb") as fh:
+            for block in iter(lambda: fh.read(blocksize), b""):
+                digest.update(block)
+    return {"size": size, "mtime": mtime, "sha256": digest.hexdigest()}
+
+
+class Stage:
+    """
+    One step of the pipeline.
+
+    Parameters
+    ----------
+    name : str
+        The name of the stage, used as its key in the state file.
+    func : callable
+        Called as ``func(inputs, outputs, **params)`` with the two path dictionaries.
+    inputs : dict
+        Maps an input name to a file path.
+    outputs : dict
+        Maps an output name to a file path.
+    params : dict, optional
+        JSON-serialisable parameters; changing them reruns the stage.
+    keep_outputs : callable, optional
+        Called as ``keep_outputs(inputs, outputs, **params)`` when an input file is missing: True if the outputs can
+        still be used without it (e.g. an index of a source file deleted once the index was built), so the stage is
+        not rerun as long as the inputs that exist are unchanged. By default a missing input reruns the stage.
+
+    Examples
+    --------
+    >>> Stage("geocode_gp", geocode_gp, inputs={"gp": "gp.csv"}, outputs={"gp_geo": "NI_PostCodes_GP.geojson"})
+    """
+
+    def __init__(self, name, func, inputs, outputs, params=None, keep_outputs=None):
+        self.name = name
+        self.func = func
+        self.inputs = dict(inputs)
+        self.outputs = dict(outputs)
+        self.params = dict(params or {})
+        self.keep_outputs = keep_outputs
+
+    def __repr__(self):
+        return f"Stage({self.name!r})"
+
+
+class Pipeline:
+    """
+    Ordered list of stages with a JSON state file recording what each stage last ran on.
+
+    Parameters
+    ----------
+    stages : list of Stage
+        The stages, in the order they must run.
+    state_filepath : str
+        Path to the JSON file holding the recorded input hashes and parameters of each stage.
+
+    Examples
+    --------
+    >>> pipeline = Pipeline(stages, "data_files/.pipeline_state.json")
+    >>> pipeline.run() # {"fix_outline": "skipped", ..., "geocode_gp": "ran", ...}
+    """
+
+    def __init__(self, stages, state_filepath):
+        self.stages = list(stages)
+        self.state_filepath = state_filepath
+        self.state = self._load_state()
+
+    def _load_state(self):
+        if os.path.exists(self.state_filepath):
+            with open(self.state_filepath) as fh:
+                return json.load(fh)
+        return {}
+
+    def _save_state(self):
+        tmp = self.state_filepath + ".tmp"
+        with open(tmp, "w") as fh:
+            json.dump(self.state, fh, indent=2, sort_keys=True)
+        os.replace(tmp, self.state_filepath)
+
+    def _input_hashes(self, stage):
+        known = self.state.get(stage.name, {}).get("inputs", {})
+        return {path: file_hash(path, known.get(path)) for path in stage.inputs.values()}
+
+    def is_stale(self, stage):
+        """
+        Check whether a stage has to run.
+
+        Parameters
+        ----------
+        stage : Stage
+            The stage to check.
+
+        Returns
+        -------
+        bool
+            True if an input or parameter changed since the last run, or if an output is missing. A missing input
+            file is a change, unless the stage's ``keep_outputs`` check accepts its outputs without it.
+        """
+        recorded = self.state.get(stage.name)
+        # compare the parameters the way they are stored (JSON turns tuples into lists)
+        if recorded is None or recorded.get("params") != json.loads(json.dumps(stage.params)):
+            return True
+        if any(not content_files(path) for path in stage.outputs.values()):
+            return True
+        current = self._input_hashes(stage)
+        if (stage.keep_outputs is not None and None in current.values()
+                and stage.keep_outputs(stage.inputs, stage.outputs, **stage.params)):
+            current = {path: known for path, known in current.items() if known is not None}
+        previous = recorded.get("inputs", {})
+        return any(current[path] is None or previous.get(path) is None or
+                   current[path]["sha256"] != previous[path]["sha256"] for path in current)
+
+    def run(self, force=False):
+        """
+        Run every stale stage, in order, and record its inputs.
+
+        Each stage that runs is timed as a stage of the current run report, if one was started (see
+        :func:`run_report.start_run`).
+
+        Parameters
+        ----------
+        force : bool or collection of str, optional
+            True to rerun every stage, or the names of the stages to rerun regardless of their inputs.
+
+        Returns
+        -------
+        dict
+            Maps each stage name to ``"ran"`` or ``"skipped"``.
+        """
+        status = {}
+        for stage in self.stages:
+            forced = force is True or (force and stage.name in force)
+            if not forced and not self.is_stale(stage):
+                status[stage.name] = "skipped"
+                continue
+
+            with run_report.stage(stage.name, stage.inputs.values(), stage.outputs.values()):
+                stage.func(stage.inputs, stage.outputs, **stage.params)
+
+            # inputs are hashed after the run, so the record matches what the stage actually read
+            self.state[stage.name] = {"inputs": self._input_hashes(stage),
+                                      "outputs": sorted(stage.outputs.values()),
+                                      "params": stage.params}
+            self._save_state()
+            status[stage.name] = "ran"
+        return status
@@ -0,0 +1,113 @@
+# Repository : https://github.com/sereneeosman/egm722_serenee
+
+#========================================= Clustered Point Layers ================================================================================================================
+#================================================================================================================================================================================
+"""
+Show large point layers (coastal spots, GP surgeries, ...) as client-side marker clusters.
+
+``GeoDataFrame.explore(marker_type="marker")`` writes one Leaflet marker, icon and popup HTML per point into the
+map. :func:`add_clustered_points` writes the points once, as a single array of ``[lat, lon, value, ...]`` rows
+(``folium.plugins.FastMarkerCluster``). The browser builds the markers from it, groups them into clusters, so only
+the visible clusters and markers are drawn, and only builds the popup HTML of a marker when it is opened.
+
+Examples
+--------
+>>> add_clustered_points(m, coastalpt, ["Name", "Website", "Near_GP", "GP_Dist"], name="Coastal spots")
+>>> add_clustered_points(m, post_gp, ["PracticeName", "postcode"], name="GP surgeries", color="blue", icon="user-md")
+"""
+
+import json
+
+import numpy as np
+from folium.plugins import FastMarkerCluster
+
+# Marker callback: builds the marker of one data row, and its popup table only when the popup opens.
+_CALLBACK = """function (row) {
+    var fields = %(fields)s;
+    var escape = function (value) {
+        return String(value).replace(/&/g, "&amp;").replace(/</g, "&lt;").replace(/>/g, "&gt;");
+    };
+    var marker = L.marker(new L.LatLng(row[0], row[1]),
+                          {icon: L.AwesomeMarkers.icon(%(icon)s), title: row[2] === null ? "" : String(row[2])});
+    marker.bindPopup(function () {
+        var html = "<table>";
+        for (var i = 0; i < fields.length; i++) {
+            if (row[i + 2] !== null) {
+                html += "<tr><th>" + escape(fields[i]) + "</th><td>" + escape(row[i + 2]) + "</td></tr>";
+            }
+        }
+        return html + "</table>";
+    });
+    return marker;
+}"""
+
+
+def point_rows(points, columns, precision=6):
+    """
+    Convert a point layer to compact ``[lat, lon, value, ...]`` rows.
+
+    Parameters
+    ----------
+    points : geopandas.geodataframe.GeoDataFrame
+        The points (re-projected to EPSG:4326 if needed). Other geometry types are represented by their centroid.
+    columns : list of str
+        The attribute columns to add to each row (missing values become ``None``, text is stripped of padding).
+    precision : int, optional
+        The number of decimal places kept in the coordinates (default 6, ~0.1 m).
+
+    Returns
+    -------
+    list of list
+        One row per point.
+    """
+    if points.crs is not None and not points.crs.equals("epsg:4326"):
+        points = points.to_crs("epsg:4326")
+    geometries = points.geometry
+    if not (geometries.geom_type == "Point").all():
+        geometries = geometries.centroid
+    coords = np.round(np.column_stack([geometries.y, geometries.x]), precision)
+
+    values = points[list(columns)].astype(object)
+    values = values.where(values.notna(), None).to_numpy().tolist()
+    values = [[value.strip() if isinstance(value, str) else value for value in row] for row in values]
+    return [[lat, lon, *row] for (lat, lon), row in zip(coords.tolist(), values)]
+
+
+def add_clustered_points(m, points, columns, name=None, color="red", icon="star", prefix="fa", **kwargs):
+    """
+    Add a point layer to a Folium map as client-side marker clusters, with a popup of attributes per marker.
+
+    Parameters
+    ----------
+    m : folium.Map
+        The map.
+    points : geopandas.geodataframe.GeoDataFrame
+        The points to show.
+    columns : list of str
+        The attribute columns shown in the popups; the first one is also the marker tooltip.
+    name : str, optional
+        The name of the layer in the layer control.
+    color : str, optional
+        The marker colour (a ``folium.Icon`` colour, default red).
+    icon : str, optional
+        The marker icon name (default ``"star"``).
+    prefix : str, optional
+        The icon library: ``"fa"`` (FontAwesome, default) or ``"glyphicon"``.
+    **kwargs
+        Passed on to Leaflet.markercluster (e.g. ``disableClusteringAtZoom=14``).
+
+    Returns
+    -------
+    folium.plugins.FastMarkerCluster
+        The cluster layer.
+
+    Examples
+    --------
+    >>> add_clustered_points(m, coastalpt, ["Name", "Website"], name="Coastal spots")
+    """
+    callback = _CALLBACK % {"fields": json.dumps([str(column) for column in columns]),
+                            "icon": json.dumps({"icon": icon, "prefix": prefix, "markerColor": color})}
+    kwargs.setdefault("chunkedLoading", True) # add the markers in batches, without blocking the page
+    layer = FastMarkerCluster(point_rows(points, columns), callback=callback, name=name, **kwargs)
+    layer.add_to(m)
+    return layer
@@ -0,0 +1,235 @@
+# Repository : https://github.com/sereneeosman/egm722_serenee
+
+#========================================= Postcode Lookup Index =================================================================================================================
+#================================================================================================================================================================================
+"""
+Prebuilt postcode -> (latitude, longitude) index for geocoding the GP practices.
+
+Instead of merging the GP file against the whole UK postcode table on every run, the postcodes are read once
+(see :mod:`postcode_reader`), normalised, sorted and saved as two NumPy ``.npy`` files in an index folder: the
+sorted keys and their coordinates (float64 by default, the precision of the merged table). Both are opened memory-mapped and the
+keys are searched with a binary search, so geocoding a few hundred GP rows only touches a few pages of the files.
+
+The size and modification time of the source file are recorded in the index folder, so :func:`is_index_current`
+tells when a new ``ukpostcodes.csv`` has been downloaded and the index has to be built again. Once the index is
+built, the 1.8M-row source file is not needed any more: an index whose source file has been deleted is kept.
+
+Examples
+--------
+>>> if not is_index_current("data_files/download_data/ukpostcodes.csv", "data_files/postcode_index"):
+...     build_postcode_index("data_files/download_data/ukpostcodes.csv", "data_files/postcode_index")
+>>> index = PostcodeIndex("data_files/postcode_index")
+>>> gp_geo = index.geocode(gp_practices, "Postcode")
+"""
+
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from postcode_reader import read_ni_postcodes
+
+# Normalised keys are stored as fixed-width bytes: "BT49 0NA" is 8 characters, the longest UK format.
+KEY_DTYPE = "S8"
+
+# File names inside an index folder.
+KEYS_FILE = "postcodes.npy"
+COORDS_FILE = "coords.npy"
+SOURCE_FILE = "source.json"
+
+
+def normalise_postcodes(postcodes):
+    """
+    Normalise postcodes to upper case with a single space before the inward code.
+
+    ``"bt49 0na"``, ``"BT490NA"`` and ``" BT49  0NA "`` all become ``"BT49 0NA"``.
+
+    Parameters
+    ----------
+    postcodes : array-like of str
+        The postcodes to normalise.
+
+    Returns
+    -------
+    pandas.Series
+        The normalised postcodes (missing values stay missing).
+
+    Examples
+    --------
+    >>> normalise_postcodes(["bt49 0na", "BT490NA"]).tolist()
+    ['BT49 0NA', 'BT49 0NA']
+    """
+    compact = pd.Series(postcodes, dtype="string").str.upper().str.replace(r"\s+", "", regex=True)
+    # the inward code is always the last 3 characters (digit + 2 letters)
+    spaced = compact.str[:-3] + " " + compact.str[-3:]
+    return spaced.where(compact.str.len() > 3, compact)
+
+
+def _source_info(csv_filepath, prefix):
+    """The size and modification time of the source file, and the prefix, recorded with an index."""
+    stat = os.stat(csv_filepath)
+    return {"size": stat.st_size, "mtime": stat.st_mtime, "prefix": prefix}
+
+
+def is_index_current(csv_filepath, index_folder, prefix=""):
+    """
+    Check whether an index folder was built from the current version of a UK postcode CSV file.
+
+    Parameters
+    ----------
+    csv_filepath : str
+        Path to the UK postal code CSV file (``ukpostcodes.csv``).
+    index_folder : str
+        Path to the index folder.
+    prefix : str, optional
+        The prefix the index should be built with.
+
+    Returns
+    -------
+    bool
+        True if the index exists and was built with ``prefix`` from a file of the same size and modification time,
+        or if the source file has been deleted (the index cannot be built again; an index of an older version, which
+        did not record its source, is then assumed to have the right prefix). False if it has to be built (again),
+        including for indexes of older versions.
+    """
+    complete = all(os.path.exists(os.path.join(index_folder, name)) for name in (KEYS_FILE, COORDS_FILE))
+    try:
+        with open(os.path.join(index_folder, SOURCE_FILE)) as f:
+            recorded = json.load(f)
+    except (OSError, ValueError):
+        recorded = None
+    if not os.path.exists(csv_filepath):
+        return complete and (recorded is None or recorded.get("prefix") == prefix)
+    return complete and recorded == _source_info(csv_filepath, prefix)
+
+
+def build_postcode_index(csv_filepath, index_folder, prefix="", dtype="float64"):
+    """
+    Build the postcode index from a UK postcode CSV file and save it to an index folder.
+
+    Parameters
+    ----------
+    csv_filepath : str
+        Path to the UK postal code CSV file (``ukpostcodes.csv``).
+    index_folder : str
+        Path to the output index folder (created if needed).
+    prefix : str, optional
+        Only index postcodes starting with this prefix (default ``""``, the whole UK).
+    dtype : str, optional
+        The type of the stored coordinates: ``"float64"`` (default) or ``"float32"``, which halves the size of the
+        coordinates file but moves the points by up to ~0.4 m.
+
+    Returns
+    -------
+    int
+        The number of postcodes in the index.
+
+    Examples
+    --------
+    >>> build_postcode_index("data_files/download_data/ukpostcodes.csv", "data_files/postcode_index", prefix="BT")
+    """
+    postcodes = read_ni_postcodes(csv_filepath, prefix=prefix, dtypes={"latitude": dtype, "longitude": dtype})
+    # missing postcodes are dropped before the keys are made (as strings they would become a "nan" key)
+    postcodes = postcodes[postcodes["postcode"].notna().to_numpy()]
+    keys = normalise_postcodes(postcodes["postcode"].astype(str)).to_numpy(dtype=str).astype(KEY_DTYPE)
+    coords = np.column_stack([postcodes["latitude"].to_numpy(), postcodes["longitude"].to_numpy()]).astype(dtype)
+
+    # sort on the key (stable, so the first row wins for duplicates) and drop duplicate postcodes
+    order = np.argsort(keys, kind="stable")
+    keys, coords = keys[order], coords[order]
+    keep = np.ones(len(keys), dtype=bool)
+    keep[1:] = keys[1:] != keys[:-1]
+
+    os.makedirs(index_folder, exist_ok=True)
+    np.save(os.path.join(index_folder, KEYS_FILE), keys[keep])
+    np.save(os.path.join(index_folder, COORDS_FILE), coords[keep])
+    with open(os.path.join(index_folder, SOURCE_FILE), "w") as f:
+        json.dump(_source_info(csv_filepath, prefix), f)
+    return int(keep.sum())
+
+
+class PostcodeIndex:
+    """
+    Memory-mapped, sorted postcode index searched with a binary search.
+
+    Parameters
+    ----------
+    index_folder : str
+        Path to an index folder written by :func:`build_postcode_index`.
+
+    Attributes
+    ----------
+    keys : numpy.ndarray
+        The memory-mapped, sorted, normalised postcodes.
+    coords : numpy.ndarray
+        The memory-mapped ``(latitude, longitude)`` pairs, in key order.
+
+    Examples
+    --------
+    >>> index = PostcodeIndex("data_files/postcode_index")
+    >>> lat, lon, found = index.lookup(["BT49 0NA", "bt4 1ns"])
+    """
+
+    def __init__(self, index_folder):
+        self.keys = np.load(os.path.join(index_folder, KEYS_FILE), mmap_mode="r")
+        self.coords = np.load(os.path.join(index_folder, COORDS_FILE), mmap_mode="r")
+
+    def __len__(self):
+        return len(self.keys)
+
+    def lookup(self, postcodes):
+        """
+        Look up the coordinates of a batch of postcodes.
+
+        Parameters
+        ----------
+        postcodes : array-like of str
+            The postcodes to look up; they are normalised first, so spacing and case don't matter.
+
+        Returns
+        -------
+        tuple of numpy.ndarray
+            ``(latitude, longitude, found)`` : float64 coordinates (NaN when not found) and a boolean mask.
+        """
+        keys = normalise_postcodes(postcodes).fillna("").to_numpy(dtype=str).astype(KEY_DTYPE)
+        if not len(self):
+            missing = np.full(len(keys), np.nan)
+            return missing, missing.copy(), np.zeros(len(keys), dtype=bool)
+
+        pos = np.minimum(np.searchsorted(self.keys, keys), len(self) - 1)
+        found = self.keys[pos] == keys
+
+        coords = self.coords[pos]
+        latitude = np.where(found, coords[:, 0], np.nan).astype(np.float64)
+        longitude = np.where(found, coords[:, 1], np.nan).astype(np.float64)
+        return latitude, longitude, found
+
+    def geocode(self, data, postcode_column="Postcode"):
+        """
+        Attach ``postcode``, ``latitude`` and ``longitude`` columns to a table, keeping only matched rows.
+
+        This replaces the inner ``pd.merge`` with the UK postcode table.
+
+        Parameters
+        ----------
+        data : pandas.DataFrame
+            The table to geocode (e.g. the GP practice reference file).
+        postcode_column : str, optional
+            The column holding the postcodes (default ``"Postcode"``).
+
+        Returns
+        -------
+        pandas.DataFrame
+            The matched rows, with the normalised ``postcode`` and its coordinates as the first columns.
+
+        Examples
+        --------
+        >>> ni_postcodes_tmp = index.geocode(gp_practices, "Postcode")
+        """
+        latitude, longitude, found = self.lookup(data[postcode_column])
+        coords = pd.DataFrame({"postcode": normalise_postcodes(data[postcode_column]).to_numpy(),
+                               "latitude": latitude,
+                               "longitude": longitude},
+                              index=data.index)
+        return pd.concat([coords, data], axis=1)[found]
@@ -0,0 +1,134 @@
+# Repository : https://github.com/sereneeosman/egm722_serenee
+
+#========================================= Streaming Postcode Reader =============================================================================================================
+#================================================================================================================================================================================
+"""
+Streaming reader for the UK postcode file, keeping Northern Ireland (BT) postcodes only.
+
+``ukpostcodes.csv`` holds ~1.8M rows for the whole UK, but the analysis only needs the BT postcodes. Reading it with
+a plain ``pd.read_csv`` holds the full UK table in memory (and the merged copy afterwards). :func:`read_ni_postcodes`
+reads the file in chunks, keeps only the needed columns with compact dtypes and filters each chunk on the postcode
+prefix, so only Northern Ireland rows are ever kept.
+
+Run this module as a script to compare memory and time against the full read::
+
+    python postcode_reader.py data_files/download_data/ukpostcodes.csv
+"""
+
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+# Columns of ukpostcodes.csv used by the analysis and their compact dtypes.
+POSTCODE_DTYPES = {"postcode": "string", "latitude": np.float32, "longitude": np.float32}
+
+
+def read_ni_postcodes(filepath, prefix="BT", chunksize=200_000, columns=("postcode", "latitude", "longitude"),
+                      dtypes=None):
+    """
+    Read the postcodes starting with ``prefix`` from a UK postcode CSV file, one chunk at a time.
+
+    Parameters
+    ----------
+    filepath : str
+        Path to the UK postal code CSV file (``ukpostcodes.csv``).
+    prefix : str, optional
+        The postcode area to keep (default ``"BT"``, Northern Ireland).
+    chunksize : int, optional
+        The number of rows parsed per chunk (default 200,000).
+    columns : sequence of str, optional
+        The columns to read; all other columns are skipped by the parser.
+    dtypes : dict, optional
+        Column dtypes replacing those of :data:`POSTCODE_DTYPES` (e.g. ``{"latitude": "float64"}``).
+
+    Returns
+    -------
+    pandas.DataFrame
+        The matching rows, with a categorical ``postcode`` column and (by default) float32 ``latitude``/``longitude``.
+
+    Examples
+    --------
+    >>> ni_postcodes = read_ni_postcodes("data_files/download_data/ukpostcodes.csv")
+    """
+    dtypes = {col: dtype for col, dtype in {**POSTCODE_DTYPES, **(dtypes or {})}.items() if col in columns}
+    reader = pd.read_csv(filepath, usecols=list(columns), dtype=dtypes, chunksize=chunksize)
+
+    # filter every chunk before keeping it, so only the prefix rows are ever held in memory
+    chunks = [chunk[chunk["postcode"].str.startswith(prefix).fillna(False)] for chunk in reader]
+    if not chunks:
+        return pd.DataFrame({col: pd.Series(dtype=dtypes.get(col, object)) for col in columns})
+
+    postcodes = pd.concat(chunks, ignore_index=True)
+    postcodes["postcode"] = postcodes["postcode"].astype("category")
+    return postcodes
+
+
+def read_all_postcodes(filepath, prefix="BT"):
+    """
+    Read the postcodes starting with ``prefix`` the original way: full read, then filter.
+
+    Kept as the reference path for :func:`compare_readers`.
+
+    Parameters
+    ----------
+    filepath : str
+        Path to the UK postal code CSV file (``ukpostcodes.csv``).
+    prefix : str, optional
+        The postcode area to keep (default ``"BT"``).
+
+    Returns
+    -------
+    pandas.DataFrame
+        The matching rows, with the file's default dtypes.
+    """
+    uk_postcodes = pd.read_csv(filepath)
+    return uk_postcodes[uk_postcodes["postcode"].str.startswith(prefix)]
+
+
+def _measure(func, *args, **kwargs):
+    """Run ``func`` and return its result, wall time (s) and peak traced memory (bytes)."""
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, elapsed, peak
+
+
+def compare_readers(filepath, prefix="BT"):
+    """
+    Compare peak memory and time of the streaming reader against the full read.
+
+    Parameters
+    ----------
+    filepath : str
+        Path to the UK postal code CSV file (``ukpostcodes.csv``).
+    prefix : str, optional
+        The postcode area to keep (default ``"BT"``).
+
+    Returns
+    -------
+    pandas.DataFrame
+        One row per reader with ``rows``, ``seconds``, ``peak_mb`` and ``result_mb`` columns.
+
+    Examples
+    --------
+    >>> compare_readers("data_files/download_data/ukpostcodes.csv")
+    """
+    rows = []
+    for name, func in [("full read", read_all_postcodes), ("streaming", read_ni_postcodes)]:
+        result, elapsed, peak = _measure(func, filepath, prefix=prefix)
+        rows.append({"reader": name,
+                     "rows": len(result),
+                     "seconds": round(elapsed, 3),
+                     "peak_mb": round(peak / 1e6, 1),
+                     "result_mb": round(result.memory_usage(deep=True).sum() / 1e6, 2)})
+    return pd.DataFrame(rows).set_index("reader")
+
+
+if __name__ == "__main__":
+    print(compare_readers(sys.argv[1] if len(sys.argv) > 1 else "data_files/download_data/ukpostcodes.csv"))
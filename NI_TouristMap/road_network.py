@@ -0,0 +1,386 @@
+# Repository : https://github.com/sereneeosman/egm722_serenee
+
+#========================================= Road Network Distance =================================================================================================================
+#================================================================================================================================================================================
+"""
+Travel distance along a road network, as an alternative to the straight-line ``Trans_Dist`` and ``GP_Dist``.
+
+Straight lines badly understate travel on the north coast and around Lough Neagh. This module loads a road graph
+extract from disk (an OSM ``.osm.pbf`` file, or a GraphML file such as one saved by OSMnx) into a compact CSR
+(compressed sparse row) graph, in the Irish Transverse Mercator projection (EPSG:2157).
+
+The nearest facility of every site is then found with one multi-source Dijkstra per facility layer, instead of one
+route per site: each facility location is snapped to its nearest road node and all of them are used as sources at
+once, so the search labels every node of the network with its nearest facility and the distance to it. A site is
+then answered in O(1): snap it to its nearest node and read the label. The distance of a site is the snap distance of
+the site, plus the road distance, plus the snap distance of the facility.
+
+The network is treated as undirected by default (one-way streets are ignored), since a visitor may travel either way
+between a site and a facility.
+
+Examples
+--------
+>>> graph = read_road_graph("data_files/download_data/northern-ireland-latest.osm.pbf")
+>>> gp_index = NetworkFacilityIndex(post_gp, "PracticeName", graph, key_column="PracNo")
+>>> tourist = assign_nearest(tourist, {("Near_GP", "GP_Dist", "Near_GP_No"): gp_index}) # road distances in km
+"""
+
+import functools
+import os
+import xml.etree.ElementTree as ET
+
+import numpy as np
+import shapely
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import dijkstra
+from scipy.spatial import cKDTree
+
+from layer_registry import transform_coordinates
+from nearest_facility import ITM_CRS, FacilityIndex
+
+# OSM highway types kept from a PBF extract: the roads a car, bus or taxi can use to reach a site.
+ROAD_TYPES = frozenset(["motorway", "motorway_link", "trunk", "trunk_link", "primary", "primary_link", "secondary",
+                        "secondary_link", "tertiary", "tertiary_link", "unclassified", "residential", "living_street",
+                        "service", "road"])
+
+# Weight given to zero-length edges: scipy's sparse graphs treat explicit zeros as missing edges.
+_ZERO_LENGTH = 1e-6
+
+
+def _shortest_edges(source, target, length, n):
+    """Build the CSR matrix of the edges, keeping the shortest of parallel edges (csr_matrix would add them up)."""
+    length = np.maximum(length, _ZERO_LENGTH)
+    order = np.lexsort((length, target, source))
+    source, target, length = source[order], target[order], length[order]
+    keep = np.ones(len(source), dtype=bool)
+    keep[1:] = (source[1:] != source[:-1]) | (target[1:] != target[:-1])
+    return csr_matrix((length[keep], (source[keep], target[keep])), shape=(n, n))
+
+
+class RoadGraph:
+    """
+    Road network as a CSR sparse matrix of edge lengths, with the node coordinates in EPSG:2157.
+
+    Parameters
+    ----------
+    coords : numpy.ndarray
+        ``(n, 2)`` node coordinates, in EPSG:2157.
+    source, target : numpy.ndarray
+        The node positions at the two ends of each edge.
+    length : numpy.ndarray, optional
+        The length of each edge in metres (default: the straight line between its two nodes).
+    directed : bool, optional
+        False (default) to travel every edge both ways.
+
+    Attributes
+    ----------
+    coords : numpy.ndarray
+        The node coordinates.
+    matrix : scipy.sparse.csr_matrix
+        ``matrix[i, j]`` is the length of the (shortest) edge from node ``i`` to node ``j`` (both ways for an
+        undirected graph).
+    directed : bool
+        Whether edges are one-way.
+    """
+
+    def __init__(self, coords, source, target, length=None, directed=False):
+        self.coords = np.asarray(coords, dtype=float)
+        self.directed = directed
+        source, target = np.asarray(source, dtype=np.intp), np.asarray(target, dtype=np.intp)
+        if length is None:
+            length = np.hypot(*(self.coords[source] - self.coords[target]).T)
+        length = np.asarray(length, dtype=float)
+        if not directed:
+            source, target, length = (np.concatenate([source, target]), np.concatenate([target, source]),
+                                      np.concatenate([length, length]))
+        self.matrix = _shortest_edges(source, target, length, len(self.coords))
+        self._tree = None
+
+    def __len__(self):
+        return len(self.coords)
+
+    @property
+    def tree(self):
+        """KD-tree over the node coordinates, built on first use."""
+        if self._tree is None:
+            self._tree = cKDTree(self.coords)
+        return self._tree
+
+    def snap(self, coords):
+        """
+        Snap points to their nearest road node.
+
+        Parameters
+        ----------
+        coords : numpy.ndarray
+            ``(n, 2)`` point coordinates in EPSG:2157 (NaN rows are not snapped).
+
+        Returns
+        -------
+        tuple of numpy.ndarray
+            ``(node, distance)`` : the nearest node (-1 for NaN points) and the straight-line distance to it.
+        """
+        coords = np.asarray(coords, dtype=float).reshape(-1, 2)
+        node = np.full(len(coords), -1, dtype=np.intp)
+        distance = np.full(len(coords), np.nan)
+        valid = np.isfinite(coords).all(axis=1)
+        if valid.any() and len(self):
+            distance[valid], node[valid] = self.tree.query(coords[valid])
+        return node, distance
+
+    def multi_source(self, nodes, offsets=None):
+        """
+        Run one multi-source Dijkstra: label every node with its nearest source and the distance to it.
+
+        On a directed graph, the distances are measured from each node *to* the sources (along the edge directions).
+
+        Parameters
+        ----------
+        nodes : numpy.ndarray
+            The source nodes (e.g. the snapped facilities); -1 entries are skipped.
+        offsets : numpy.ndarray, optional
+            A starting distance per source (e.g. the snap distance of each facility), added to every path from it.
+
+        Returns
+        -------
+        tuple of numpy.ndarray
+            ``(source, distance)`` : for every node, the position in ``nodes`` of its nearest source (-1 if no
+            source can reach it) and the distance from it (inf if unreachable).
+        """
+        nodes = np.asarray(nodes, dtype=np.intp)
+        offsets = np.zeros(len(nodes)) if offsets is None else np.asarray(offsets, dtype=float)
+        used = np.flatnonzero(nodes >= 0)
+        n = len(self)
+        if not len(used):
+            return np.full(n, -1, dtype=np.intp), np.full(n, np.inf)
+
+        # one virtual node per source, with a one-way edge to its road node as long as its offset: the Dijkstra from
+        # all the virtual nodes at once then includes the offsets, and tells which virtual node each node came from.
+        # The virtual edges are 1 m longer (taken off again below), so that a zero offset is not a zero-length edge.
+        virtual = n + np.arange(len(used))
+        matrix = (self.matrix.T if self.directed else self.matrix).tocoo()
+        graph = _shortest_edges(np.concatenate([matrix.row, virtual]), np.concatenate([matrix.col, nodes[used]]),
+                                np.concatenate([matrix.data, offsets[used] + 1.0]), n + len(used))
+
+        distance, _, sources = dijkstra(graph, directed=True, indices=virtual, min_only=True,
+                                        return_predecessors=True)
+        source = np.where(sources[:n] >= n, used[np.maximum(sources[:n] - n, 0)], -1)
+        return source, distance[:n] - 1.0
+
+
+def _graphml_keys(root, namespace):
+    """Map the GraphML attribute names (``x``, ``y``, ``length``, ``crs``) to their key ids."""
+    keys = {}
+    for key in root.iter(f"{namespace}key"):
+        keys[(key.get("for"), key.get("attr.name"))] = key.get("id")
+    return keys
+
+
+def read_graphml(filepath, directed=False):
+    """
+    Read a road graph from a GraphML file (as written by OSMnx or networkx).
+
+    Nodes need ``x`` and ``y`` attributes; the graph ``crs`` attribute gives their CRS (EPSG:4326 if missing).
+    Edges use their ``length`` attribute (metres) when present, the straight line between their nodes otherwise.
+
+    Parameters
+    ----------
+    filepath : str
+        The GraphML file.
+    directed : bool, optional
+        False (default) to travel every edge both ways.
+
+    Returns
+    -------
+    RoadGraph
+        The road graph.
+    """
+    root = ET.parse(filepath).getroot()
+    namespace = root.tag[:root.tag.index("}") + 1] if root.tag.startswith("{") else ""
+    keys = _graphml_keys(root, namespace)
+    x_key, y_key = keys.get(("node", "x")), keys.get(("node", "y"))
+    length_key = keys.get(("edge", "length"))
+    crs_key = keys.get(("graph", "crs"))
+    graph = root.find(f"{namespace}graph")
+
+    crs = "epsg:4326"
+    for data in graph.findall(f"{namespace}data"):
+        if data.get("key") == crs_key:
+            crs = data.text
+
+    positions, coords = {}, []
+    for node in graph.iter(f"{namespace}node"):
+        values = {data.get("key"): data.text for data in node.findall(f"{namespace}data")}
+        positions[node.get("id")] = len(coords)
+        coords.append((float(values[x_key]), float(values[y_key])))
+
+    source, target, length = [], [], []
+    for edge in graph.iter(f"{namespace}edge"):
+        source.append(positions[edge.get("source")])
+        target.append(positions[edge.get("target")])
+        values = {data.get("key"): data.text for data in edge.findall(f"{namespace}data")}
+        length.append(float(values.get(length_key, "nan")))
+
+    coords = transform_coordinates(np.array(coords, dtype=float).reshape(-1, 2), crs, ITM_CRS)
+    source, target, length = np.array(source, dtype=np.intp), np.array(target, dtype=np.intp), np.array(length)
+    # missing lengths: the straight line between the two nodes
+    missing = ~np.isfinite(length)
+    length[missing] = np.hypot(*(coords[source[missing]] - coords[target[missing]]).T)
+    return RoadGraph(coords, source, target, length, directed=directed)
+
+
+def read_pbf(filepath, road_types=ROAD_TYPES, directed=False):
+    """
+    Read the roads of an OpenStreetMap ``.osm.pbf`` extract (needs the ``osmium`` package).
+
+    Each way tagged with one of ``road_types`` becomes a chain of edges between its consecutive nodes; edge lengths
+    are the straight lines between the nodes, in EPSG:2157.
+
+    Parameters
+    ----------
+    filepath : str
+        The PBF file, e.g. the Geofabrik Northern Ireland extract.
+    road_types : collection of str, optional
+        The ``highway`` tag values kept (default :data:`ROAD_TYPES`).
+    directed : bool, optional
+        False (default) to travel every edge both ways.
+
+    Returns
+    -------
+    RoadGraph
+        The road graph.
+    """
+    try:
+        import osmium
+    except ImportError:
+        raise ImportError("reading .osm.pbf road networks needs the osmium package (conda install -c conda-forge "
+                          "osmium-tool pyosmium), or convert the extract to GraphML") from None
+
+    positions, lonlat, source, target = {}, [], [], []
+
+    class RoadHandler(osmium.SimpleHandler):
+        def way(self, way):
+            if way.tags.get("highway") not in road_types:
+                return
+            previous = None
+            for node in way.nodes:
+                if not node.location.valid():
+                    previous = None
+                    continue
+                if node.ref not in positions:
+                    positions[node.ref] = len(lonlat)
+                    lonlat.append((node.location.lon, node.location.lat))
+                position = positions[node.ref]
+                if previous is not None:
+                    source.append(previous)
+                    target.append(position)
+                previous = position
+
+    RoadHandler().apply_file(filepath, locations=True)
+    coords = transform_coordinates(np.array(lonlat, dtype=float).reshape(-1, 2), "epsg:4326", ITM_CRS)
+    return RoadGraph(coords, source, target, directed=directed)
+
+
+@functools.lru_cache(maxsize=4)
+def _read_cached(filepath, size, mtime, directed):
+    if filepath.lower().endswith(".pbf"):
+        return read_pbf(filepath, directed=directed)
+    return read_graphml(filepath, directed=directed)
+
+
+def read_road_graph(filepath, directed=False):
+    """
+    Read a road graph from a ``.osm.pbf`` or GraphML file, once per process (until the file changes).
+
+    Parameters
+    ----------
+    filepath : str
+        The road network extract.
+    directed : bool, optional
+        False (default) to travel every edge both ways.
+
+    Returns
+    -------
+    RoadGraph
+        The road graph.
+    """
+    st = os.stat(filepath)
+    return _read_cached(os.path.abspath(filepath), st.st_size, st.st_mtime_ns, directed)
+
+
+class NetworkFacilityIndex(FacilityIndex):
+    """
+    :class:`~nearest_facility.FacilityIndex` measuring road distances instead of straight lines.
+
+    One multi-source Dijkstra from every facility location labels each road node with its nearest facility; queries
+    then snap to the nearest node. It can be used wherever a ``FacilityIndex`` is, e.g. in
+    :func:`~nearest_facility.assign_nearest`. :meth:`within` and :meth:`k_nearest` still use straight lines.
+
+    Parameters
+    ----------
+    facilities : geopandas.geodataframe.GeoDataFrame
+        The facility layer.
+    name_column : str
+        The column holding the facility name.
+    graph : RoadGraph
+        The road network.
+    key_column : str, optional
+        A column holding a unique key of each facility.
+    max_snap : float, optional
+        The largest distance (metres) between a site or facility and the road network; farther ones get no
+        nearest facility (default: no limit).
+
+    Attributes
+    ----------
+    node_location : numpy.ndarray
+        The nearest facility location of each road node (-1 if no facility can be reached).
+    node_distance : numpy.ndarray
+        The road distance of each node to that location, including the facility snap distance.
+
+    Examples
+    --------
+    >>> transport_index = NetworkFacilityIndex(transport, "Station", read_road_graph("roads.graphml"))
+    """
+
+    def __init__(self, facilities, name_column, graph, key_column=None, max_snap=None):
+        super().__init__(facilities, name_column, crs=ITM_CRS, key_column=key_column)
+        self.graph = graph
+        self.max_snap = max_snap
+
+        # the sources are the distinct facility locations (co-located practices are one source)
+        location_points = shapely.centroid(self.tree.geometries)
+        node, snap = graph.snap(shapely.get_coordinates(location_points, include_z=False).reshape(-1, 2)
+                                if len(location_points) else np.empty((0, 2)))
+        if max_snap is not None:
+            node[snap > max_snap] = -1
+        self.node_location, self.node_distance = graph.multi_source(node, snap)
+
+    def nearest(self, geometries):
+        """
+        Find the facility nearest by road for every query geometry (measured from its centroid).
+
+        Parameters
+        ----------
+        geometries : array-like of shapely geometries
+            The query geometries, in EPSG:2157. Polygons are always measured from their centroid (the road node
+            nearest to it), whatever ``measure`` is given to :func:`nearest_facility.assign_nearest`.
+
+        Returns
+        -------
+        tuple of numpy.ndarray
+            ``(index, distance)`` : the position of the nearest facility (-1 for empty/missing geometries, or sites
+            that cannot reach a facility) and the road distance to it in metres (NaN for those).
+        """
+        geometries = np.asarray(geometries, dtype=object)
+        coords = np.full((len(geometries), 2), np.nan)
+        valid = ~(shapely.is_missing(geometries) | shapely.is_empty(geometries))
+        coords[valid] = shapely.get_coordinates(shapely.centroid(geometries[valid]))
+
+        node, snap = self.graph.snap(coords)
+        if self.max_snap is not None:
+            node[snap > self.max_snap] = -1
+        location = np.where(node >= 0, self.node_location[np.maximum(node, 0)], -1)
+        distance = np.where(location >= 0, snap + self.node_distance[np.maximum(node, 0)], np.nan)
+
+        index = np.where(location >= 0, self._first[np.maximum(location, 0)], -1)
+        return index, distance
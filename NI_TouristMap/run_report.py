@@ -0,0 +1,444 @@
+# Repository : https://github.com/sereneeosman/egm722_serenee
+
+#========================================= Run Report ============================================================================================================================
+#================================================================================================================================================================================
+"""
+Per-stage timing and memory instrumentation, saved as a JSON run report.
+
+A :class:`RunReport` records, for every stage of a run: the wall time, the CPU time, the peak resident memory (RSS),
+the rows read and written, and the bytes read and written. Stages are timed with the :meth:`RunReport.stage` context
+manager, the :meth:`RunReport.timed` decorator, or, in scripts run top to bottom, :meth:`RunReport.section` (which
+ends the previous section). Each finished stage can also be sent to a metrics sink, see :func:`jsonl_sink` and
+:func:`statsd_sink`.
+
+The module functions :func:`stage`, :func:`timed` and :func:`count_rows` report to the run started with
+:func:`start_run`. Without a run they do nothing, so the modules can be instrumented at almost no cost when the
+instrumentation is off.
+
+Peak RSS is measured with ``resource`` (not available on Windows, where it is left empty). On Linux the peak is reset
+at the start of each stage, so it is the peak of that stage; elsewhere it is the peak of the run so far. The bytes
+read and written are the I/O counters of ``/proc/self/io`` (Linux) and the sizes of the input and output files
+declared by the stage.
+
+Examples
+--------
+>>> report = start_run("analysis_pipeline")
+>>> with stage("clip_counties", inputs=["data_files/NI_Outline.shp"], outputs=["data_files/NI_Counties.shp"]):
+...     count_rows(rows_in=len(prj_counties), rows_out=len(clipped_counties))
+>>> report.finish("data_files/reports")
+"""
+
+import datetime
+import functools
+import json
+import os
+import socket
+import sys
+import time
+
+try:
+    import resource
+except ImportError: # Windows
+    resource = None
+
+from output_files import content_files
+
+# Environment variable turning the instrumentation of the analysis and map scripts on ("1") or off ("0").
+ENABLE_VARIABLE = "NI_RUN_REPORT"
+
+# Default folder of the run reports, in the data folder.
+REPORTS_FOLDER = "reports"
+
+_current = None
+
+
+def _peak_rss_mb():
+    """The peak RSS of the process (or since the last :func:`_reset_peak_rss`), in MB."""
+    if resource is None:
+        return None
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in kilobytes on Linux, in bytes on macOS
+    return maxrss / 1e6 if sys.platform == "darwin" else maxrss / 1e3
+
+
+def _reset_peak_rss():
+    """Reset the peak RSS of the process (Linux only); returns True if it was reset."""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def _stage_peak_rss_mb():
+    """The peak RSS since the last reset, read from /proc/self/status (Linux), in MB."""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1e3
+    except OSError:
+        pass
+    return _peak_rss_mb()
+
+
+def _io_counters():
+    """The bytes read and written by the process so far (``/proc/self/io``), or None."""
+    try:
+        with open("/proc/self/io") as f:
+            counters = dict(line.split(": ") for line in f.read().splitlines())
+        return int(counters["rchar"]), int(counters["wchar"])
+    except (OSError, KeyError, ValueError):
+        return None
+
+
+def _files_size(paths):
+    """The total size in bytes of the files (shapefiles with their parts, folders with their content) in ``paths``."""
+    return sum(os.path.getsize(f) for path in paths for f in content_files(path))
+
+
+class _StageTimer:
+    """Context manager timing one stage of a :class:`RunReport`."""
+
+    def __init__(self, report, name, inputs, outputs):
+        self.report = report
+        self.record = {"stage": name, "rows_in": None, "rows_out": None}
+        self.inputs = list(inputs)
+        self.outputs = list(outputs)
+
+    def __enter__(self):
+        # the peak is only reset by the outermost stage, so a nested stage does not hide the peak of its parent
+        self.reset = self.report._open[0].reset if self.report._open else _reset_peak_rss()
+        self.io = _io_counters()
+        self.cpu = time.process_time()
+        self.wall = time.perf_counter()
+        self.report._open.append(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        record = self.record
+        record["wall_seconds"] = time.perf_counter() - self.wall
+        record["cpu_seconds"] = time.process_time() - self.cpu
+        record["peak_rss_mb"] = _stage_peak_rss_mb() if self.reset else _peak_rss_mb()
+        io = _io_counters()
+        record["bytes_read"] = io[0] - self.io[0] if io and self.io else None
+        record["bytes_written"] = io[1] - self.io[1] if io and self.io else None
+        record["input_bytes"] = _files_size(self.inputs) if self.inputs else None
+        record["output_bytes"] = _files_size(self.outputs) if self.outputs else None
+        record["status"] = "failed" if exc_type is not None else "ok"
+        self.report._open.remove(self)
+        self.report._add(record)
+        return False
+
+    def count_rows(self, rows_in=None, rows_out=None):
+        """Add to the rows read (``rows_in``) and written (``rows_out``) by the stage."""
+        for key, rows in (("rows_in", rows_in), ("rows_out", rows_out)):
+            if rows is not None:
+                self.record[key] = (self.record[key] or 0) + int(rows)
+
+
+class _NullStage:
+    """Stand-in for :class:`_StageTimer` when no run is being recorded."""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+    def count_rows(self, rows_in=None, rows_out=None):
+        pass
+
+
+_NULL_STAGE = _NullStage()
+
+
+class RunReport:
+    """
+    The stages of one run, with their timing, memory, row and byte counts.
+
+    Parameters
+    ----------
+    name : str
+        The name of the run (e.g. the script name), used in the report file name.
+    sink : callable, optional
+        Called with the record (a dict) of each stage as it finishes, e.g. :func:`jsonl_sink` or :func:`statsd_sink`.
+        Errors raised by the sink are printed, not raised, so a metrics server being down does not stop the run.
+    enabled : bool, optional
+        False to record nothing: the stages, sections and :meth:`finish` then do nothing.
+
+    Examples
+    --------
+    >>> report = RunReport("NI_TouristMap")
+    >>> with report.stage("load layers"):
+    ...     layers = load_map_layers("data_files")
+    >>> report.save("data_files/reports")
+    """
+
+    def __init__(self, name, sink=None, enabled=True):
+        self.name = name
+        self.sink = sink
+        self.enabled = enabled
+        self.started = datetime.datetime.now()
+        self.stages = []
+        self._open = []
+        self._section = None
+        self._wall = time.perf_counter()
+        self._cpu = time.process_time()
+
+    def _add(self, record):
+        self.stages.append(record)
+        if self.sink is not None:
+            try:
+                self.sink(dict(record, run=self.name))
+            except Exception as err:
+                print(f"run report: metrics sink failed ({err})")
+
+    def stage(self, name, inputs=(), outputs=()):
+        """
+        Time a stage.
+
+        Parameters
+        ----------
+        name : str
+            The name of the stage.
+        inputs, outputs : sequence of str, optional
+            The files read and written by the stage; their sizes are recorded as ``input_bytes`` and ``output_bytes``.
+
+        Returns
+        -------
+        context manager
+            Its ``count_rows(rows_in, rows_out)`` method records the rows read and written.
+        """
+        if not self.enabled:
+            return _NULL_STAGE
+        return _StageTimer(self, name, inputs, outputs)
+
+    def timed(self, name=None):
+        """Decorator timing each call of a function as a stage (named after the function by default)."""
+        def decorator(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                with self.stage(name or func.__name__):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def section(self, name=None):
+        """
+        End the current section of a script and start the next one.
+
+        Parameters
+        ----------
+        name : str, optional
+            The name of the next section; None only ends the current one.
+        """
+        if self._section is not None:
+            self._section.__exit__(None, None, None)
+            self._section = None
+        if name is not None:
+            self._section = self.stage(name).__enter__()
+
+    def count_rows(self, rows_in=None, rows_out=None):
+        """Add rows to the innermost stage being timed, if any."""
+        if self._open:
+            self._open[-1].count_rows(rows_in, rows_out)
+
+    def to_dict(self):
+        """The report: the run ``name``, ``started``, totals (``wall_seconds``, ``cpu_seconds``, ``peak_rss_mb``) and ``stages``."""
+        return {"run": self.name,
+                "started": self.started.isoformat(timespec="seconds"),
+                "wall_seconds": time.perf_counter() - self._wall,
+                "cpu_seconds": time.process_time() - self._cpu,
+                "peak_rss_mb": max([s["peak_rss_mb"] for s in self.stages if s["peak_rss_mb"] is not None],
+                                   default=_peak_rss_mb()),
+                "stages": self.stages}
+
+    def save(self, folder):
+        """
+        Save the report as JSON, named ``<run name>_<start time>.json``.
+
+        Parameters
+        ----------
+        folder : str
+            The folder to save the report in (created if needed).
+
+        Returns
+        -------
+        str
+            The path of the report.
+        """
+        os.makedirs(folder, exist_ok=True)
+        filepath = os.path.join(folder, f"{self.name}_{self.started:%Y%m%dT%H%M%S}.json")
+        with open(filepath, "w") as f:
+            json.dump(self.to_dict(), f, indent=2)
+        return filepath
+
+    def summary(self):
+        """The stages as a text table (wall time, CPU time, peak RSS and rows)."""
+        lines = [f"{'stage':24s} {'wall s':>9s} {'cpu s':>9s} {'peak MB':>9s} {'rows in':>10s} {'rows out':>10s}"]
+        for s in self.stages:
+            peak = "" if s["peak_rss_mb"] is None else f"{s['peak_rss_mb']:.1f}"
+            lines.append(f"{s['stage']:24s} {s['wall_seconds']:9.3f} {s['cpu_seconds']:9.3f} {peak:>9s} "
+                         f"{'' if s['rows_in'] is None else s['rows_in']:>10} "
+                         f"{'' if s['rows_out'] is None else s['rows_out']:>10}")
+        return "\n".join(lines)
+
+    def finish(self, folder, verbose=True):
+        """
+        End the current section, save the report and stop recording (see :func:`start_run`).
+
+        Parameters
+        ----------
+        folder : str
+            The folder to save the report in.
+        verbose : bool, optional
+            True to print the stage table and the report path.
+
+        Returns
+        -------
+        str or None
+            The path of the report (None if the report is not enabled).
+        """
+        global _current
+        if _current is self:
+            _current = None
+        if not self.enabled:
+            return None
+        self.section(None)
+        filepath = self.save(folder)
+        if verbose:
+            print(self.summary())
+            print("Run report saved to", filepath)
+        return filepath
+
+
+#================================================================== Current run =================================================================================================
+
+def start_run(name, sink=None, enabled=True):
+    """
+    Start recording a run; :func:`stage`, :func:`timed` and :func:`count_rows` report to it until it finishes.
+
+    Parameters
+    ----------
+    name : str
+        The name of the run.
+    sink : callable, optional
+        The metrics sink, see :class:`RunReport`.
+    enabled : bool, optional
+        False to not record anything (see :class:`RunReport`).
+
+    Returns
+    -------
+    RunReport
+        The report.
+    """
+    global _current
+    report = RunReport(name, sink, enabled)
+    _current = report if enabled else None
+    return report
+
+
+def enabled_by_environment(default=False):
+    """Whether the ``NI_RUN_REPORT`` environment variable turns the run report on (``default`` if it is not set)."""
+    value = os.environ.get(ENABLE_VARIABLE)
+    return default if value is None else value.strip().lower() not in ("", "0", "false", "no", "off")
+
+
+def stage(name, inputs=(), outputs=()):
+    """Time a stage of the current run (see :meth:`RunReport.stage`); does nothing without a run."""
+    if _current is None:
+        return _NULL_STAGE
+    return _current.stage(name, inputs, outputs)
+
+
+def timed(name=None):
+    """Decorator timing each call of a function as a stage of the current run, if there is one."""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if _current is None:
+                return func(*args, **kwargs)
+            with _current.stage(name or func.__name__):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def count_rows(rows_in=None, rows_out=None):
+    """Add rows to the stage of the current run being timed; does nothing without a run."""
+    if _current is not None:
+        _current.count_rows(rows_in, rows_out)
+
+
+#================================================================== Sinks =======================================================================================================
+
+def jsonl_sink(filepath):
+    """
+    Metrics sink appending each stage record as a line of JSON to a file.
+
+    Parameters
+    ----------
+    filepath : str
+        The JSON Lines file.
+
+    Returns
+    -------
+    callable
+        The sink.
+    """
+    def sink(record):
+        with open(filepath, "a") as f:
+            f.write(json.dumps(record) + "\n")
+    return sink
+
+
+def statsd_sink(host="127.0.0.1", port=8125, prefix="ni_touristmap"):
+    """
+    Metrics sink sending each stage record as StatsD gauges over UDP (e.g. to a local StatsD or Telegraf agent).
+
+    Parameters
+    ----------
+    host : str, optional
+        The StatsD host (default localhost).
+    port : int, optional
+        The StatsD UDP port (default 8125).
+    prefix : str, optional
+        The prefix of the metric names, ``<prefix>.<run>.<stage>.<metric>``.
+
+    Returns
+    -------
+    callable
+        The sink.
+    """
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+
+    def sink(record):
+        name = ".".join(part.replace(" ", "_").replace(".", "_") for part in (prefix, record["run"], record["stage"]))
+        lines = [f"{name}.{key}:{value}|g" for key, value in record.items()
+                 if isinstance(value, (int, float)) and not isinstance(value, bool)]
+        sock.sendto("\n".join(lines).encode(), (host, port))
+    return sink
+
+
+def metrics_sink(target):
+    """
+    Make a metrics sink from a command-line value: ``udp://host:port`` for StatsD, anything else is a JSON Lines file.
+
+    Parameters
+    ----------
+    target : str or None
+        The sink target.
+
+    Returns
+    -------
+    callable or None
+        The sink (None if ``target`` is None).
+    """
+    if target is None:
+        return None
+    if target.startswith("udp://"):
+        host, _, port = target[len("udp://"):].partition(":")
+        return statsd_sink(host or "127.0.0.1", int(port or 8125))
+    return jsonl_sink(target)
@@ -0,0 +1,322 @@
+# Repository : https://github.com/sereneeosman/egm722_serenee
+
+#========================================= Geometry Simplification Tiers =========================================================================================================
+#================================================================================================================================================================================
+"""
+Simplified copies of the map layers, one tolerance tier per range of zoom levels, cached on disk.
+
+The full-resolution outline, counties and tourist site polygons make the exported map several tens of MB, although
+at regional zoom levels a vertex every few metres is far below one screen pixel. Each tier uses a tolerance of about
+half a pixel at the largest zoom level it serves, so the simplified map looks the same at those zoom levels.
+
+Simplification is done in metres (Irish Transverse Mercator) and keeps the topology: polygon layers that tile the
+country (the outline and the counties) are simplified as a coverage with ``shapely.coverage_simplify`` when it is
+available, so neighbouring counties keep sharing the same edges. Results are cached in ``cache_folder``, keyed by
+a hash of the source geometries and the tolerance; only the :data:`CACHE_FILES` most recently used are kept.
+
+On the map, :func:`add_zoom_tiers` adds one copy of a layer per tier (and the full-resolution layer beyond the last
+tier), each shown only at the zoom levels of its tier, so the map can still be zoomed in to street level.
+
+Examples
+--------
+>>> counties = simplify_for_zoom(counties, zoom=9, coverage=True)
+>>> tourist = simplify_for_zoom(tourist, zoom=9)
+>>> m = add_zoom_tiers(counties, column="CountyName", name="counties", coverage=True, cmap="Set2")
+"""
+
+import hashlib
+import os
+
+import folium
+import numpy as np
+import shapely
+import geopandas as gpd
+from branca.element import MacroElement
+from jinja2 import Template
+
+from nearest_facility import ITM_CRS
+
+# (largest zoom level, tolerance in metres) for each tier; beyond the last tier the full geometry is used.
+# At 54.6N a web map pixel is ~90,600 / 2**zoom metres: ~177 m at zoom 9, ~22 m at zoom 12, ~5.5 m at zoom 14.
+ZOOM_TIERS = ((9, 100.0), (12, 12.0), (14, 3.0))
+
+# Largest zoom level of the web map tiles: the full-resolution geometry is shown up to it.
+MAX_ZOOM = 18
+
+# Default folder of the cached simplified layers.
+CACHE_FOLDER = os.path.join("data_files", "simplified")
+
+# Number of simplified layers kept in the cache folder; the least recently used ones are removed beyond it (every
+# edit of a layer adds a new file per tier).
+CACHE_FILES = 32
+
+
+def tolerance_for_zoom(zoom):
+    """
+    Get the simplification tolerance for a web map zoom level.
+
+    Parameters
+    ----------
+    zoom : int or None
+        The web map zoom level (None for full resolution).
+
+    Returns
+    -------
+    float
+        The tolerance in metres, or 0 for full resolution.
+
+    Examples
+    --------
+    >>> tolerance_for_zoom(9)
+    100.0
+    """
+    if zoom is None:
+        return 0.0
+    for max_zoom, tolerance in ZOOM_TIERS:
+        if zoom <= max_zoom:
+            return tolerance
+    return 0.0
+
+
+def zoom_ranges(max_zoom=MAX_ZOOM):
+    """
+    Get the zoom levels served by each tier, up to a largest zoom level.
+
+    Parameters
+    ----------
+    max_zoom : int, optional
+        The largest zoom level of the map (default 18).
+
+    Returns
+    -------
+    list of tuple
+        ``(min zoom, max zoom, tolerance)`` of each tier from zoom 0, ending with the full-resolution tier (tolerance 0)
+        when ``max_zoom`` is beyond the last tier of :data:`ZOOM_TIERS`.
+
+    Examples
+    --------
+    >>> zoom_ranges()
+    [(0, 9, 100.0), (10, 12, 12.0), (13, 14, 3.0), (15, 18, 0.0)]
+    """
+    ranges, min_zoom = [], 0
+    for tier_zoom, tolerance in ZOOM_TIERS + ((max_zoom, 0.0),):
+        if min_zoom > max_zoom:
+            break
+        ranges.append((min_zoom, min(tier_zoom, max_zoom), tolerance))
+        min_zoom = tier_zoom + 1
+    return ranges
+
+
+def geometry_hash(data):
+    """
+    Hash the geometries (as WKB) and CRS of a layer.
+
+    Parameters
+    ----------
+    data : geopandas.geodataframe.GeoDataFrame or geopandas.geoseries.GeoSeries
+        The layer.
+
+    Returns
+    -------
+    str
+        The SHA-256 hex digest.
+    """
+    digest = hashlib.sha256(str(data.crs).encode())
+    for wkb in shapely.to_wkb(data.geometry.values):
+        digest.update(wkb if wkb is not None else b"\0")
+    return digest.hexdigest()
+
+
+def simplify_geometries(data, tolerance, coverage=False):
+    """
+    Simplify the geometries of a layer, keeping their topology.
+
+    Parameters
+    ----------
+    data : geopandas.geodataframe.GeoDataFrame or geopandas.geoseries.GeoSeries
+        The layer to simplify.
+    tolerance : float
+        The tolerance in metres.
+    coverage : bool, optional
+        True if the polygons tile an area without overlapping (e.g. the counties): the shared edges are then
+        simplified once, so neighbours stay adjacent.
+
+    Returns
+    -------
+    geopandas.geoseries.GeoSeries
+        The simplified geometries, in the CRS and row order of ``data``.
+    """
+    itm = data.geometry.to_crs(ITM_CRS)
+    if coverage and hasattr(shapely, "coverage_simplify"):
+        simplified = shapely.coverage_simplify(itm.values, tolerance)
+    else:
+        simplified = shapely.simplify(itm.values, tolerance, preserve_topology=True)
+    return gpd.GeoSeries(simplified, index=data.index, crs=ITM_CRS).to_crs(data.crs)
+
+
+def _trim_cache(cache_folder, keep=CACHE_FILES):
+    """Remove the least recently used cached layers, keeping ``keep`` of them."""
+    cached = [os.path.join(cache_folder, f) for f in os.listdir(cache_folder) if f.endswith(".parquet")]
+    for filepath in sorted(cached, key=os.path.getmtime, reverse=True)[keep:]:
+        os.remove(filepath)
+
+
+def simplified_layer(data, tolerance, coverage=False, cache_folder=CACHE_FOLDER):
+    """
+    Get a simplified copy of a layer, from the cache when the same geometries were simplified before.
+
+    Parameters
+    ----------
+    data : geopandas.geodataframe.GeoDataFrame
+        The layer to simplify.
+    tolerance : float
+        The tolerance in metres; 0 returns an unchanged copy of ``data``.
+    coverage : bool, optional
+        True if the polygons tile an area without overlapping (see :func:`simplify_geometries`).
+    cache_folder : str or None, optional
+        The folder of the cached simplified geometries; None disables the cache.
+
+    Returns
+    -------
+    geopandas.geodataframe.GeoDataFrame
+        A copy of ``data`` with simplified geometries.
+    """
+    if tolerance <= 0:
+        return data.copy()
+
+    cache_file = None
+    if cache_folder is not None:
+        key = f"{geometry_hash(data)[:16]}_{tolerance:g}m{'_coverage' if coverage else ''}"
+        cache_file = os.path.join(cache_folder, key + ".parquet")
+
+    if cache_file is not None and os.path.exists(cache_file):
+        geometries = gpd.read_parquet(cache_file).geometry
+        geometries.index = data.index
+        os.utime(cache_file) # most recently used
+    else:
+        geometries = simplify_geometries(data, tolerance, coverage)
+        if cache_file is not None:
+            os.makedirs(cache_folder, exist_ok=True)
+            gpd.GeoDataFrame(geometry=geometries.reset_index(drop=True)).to_parquet(cache_file, index=False)
+            _trim_cache(cache_folder)
+
+    return data.set_geometry(np.asarray(geometries.values), crs=data.crs)
+
+
+def simplify_for_zoom(data, zoom, coverage=False, cache_folder=CACHE_FOLDER):
+    """
+    Get the simplification tier of a layer for a web map zoom level.
+
+    Parameters
+    ----------
+    data : geopandas.geodataframe.GeoDataFrame
+        The layer to simplify.
+    zoom : int or None
+        The largest zoom level the layer will be shown at (see :data:`ZOOM_TIERS`); None for full resolution.
+    coverage : bool, optional
+        True if the polygons tile an area without overlapping (see :func:`simplify_geometries`).
+    cache_folder : str or None, optional
+        The folder of the cached simplified geometries; None disables the cache.
+
+    Returns
+    -------
+    geopandas.geodataframe.GeoDataFrame
+        A copy of ``data`` with simplified geometries (unchanged beyond the last tier).
+
+    Examples
+    --------
+    >>> counties = simplify_for_zoom(counties, zoom=9, coverage=True)
+    """
+    return simplified_layer(data, tolerance_for_zoom(zoom), coverage, cache_folder)
+
+
+#================================================================= Folium Layers ================================================================================================
+
+class ZoomRange(MacroElement):
+    """
+    Show a map layer only between two zoom levels (it is removed from the map at the other zoom levels).
+
+    Parameters
+    ----------
+    layer : folium.map.Layer
+        The layer (e.g. a ``folium.GeoJson``), already added to the map.
+    min_zoom, max_zoom : int
+        The zoom levels the layer is shown at, both included.
+    """
+
+    _template = Template("""
+        {% macro script(this, kwargs) %}
+            (function () {
+                var map = {{ this.map.get_name() }}, layer = {{ this.layer.get_name() }};
+                function update() {
+                    var zoom = map.getZoom();
+                    if (zoom >= {{ this.min_zoom }} && zoom <= {{ this.max_zoom }}) {
+                        if (!map.hasLayer(layer)) map.addLayer(layer);
+                    } else if (map.hasLayer(layer)) {
+                        map.removeLayer(layer);
+                    }
+                }
+                map.on("zoomend", update);
+                update();
+            })();
+        {% endmacro %}
+    """)
+
+    def __init__(self, m, layer, min_zoom, max_zoom):
+        super().__init__()
+        self._name = "ZoomRange"
+        self.map = m
+        self.layer = layer
+        self.min_zoom = int(min_zoom)
+        self.max_zoom = int(max_zoom)
+
+
+def add_zoom_tiers(data, m=None, column=None, name=None, coverage=False, max_zoom=MAX_ZOOM, cache_folder=CACHE_FOLDER,
+                   **kwargs):
+    """
+    Add a layer to a Folium map as one simplified copy per zoom tier, each shown only at the zoom levels of its tier.
+
+    The coarsest tier is drawn at regional zoom levels, finer tiers as the map is zoomed in, and the full-resolution
+    geometry beyond the last tier (see :func:`zoom_ranges`).
+
+    Parameters
+    ----------
+    data : geopandas.geodataframe.GeoDataFrame
+        The full-resolution layer.
+    m : folium.Map, optional
+        The map; by default a new map is created (as ``GeoDataFrame.explore`` does), zoomable up to ``max_zoom``.
+    column : str, optional
+        The column to colour the features by (as in ``GeoDataFrame.explore``).
+    name : str, optional
+        The layer name; each tier is named ``"<name> z<min>-<max>"`` (e.g. the file names of :mod:`map_payloads`).
+    coverage : bool, optional
+        True if the polygons tile an area without overlapping (see :func:`simplify_geometries`).
+    max_zoom : int, optional
+        The largest zoom level of the map (default 18).
+    cache_folder : str or None, optional
+        The folder of the cached simplified geometries; None disables the cache.
+    **kwargs
+        Passed to ``GeoDataFrame.explore`` for every tier (the legend is only added once).
+
+    Returns
+    -------
+    folium.Map
+        The map.
+
+    Examples
+    --------
+    >>> m = add_zoom_tiers(counties, column="CountyName", name="counties", coverage=True, cmap="Set2")
+    >>> add_zoom_tiers(visit_all, m, "CountyName", name="tourist sites", cmap="gist_rainbow", legend=False)
+    """
+    for i, (min_zoom, tier_zoom, tolerance) in enumerate(zoom_ranges(max_zoom)):
+        tier = simplified_layer(data, tolerance, coverage, cache_folder)
+        options = dict(kwargs, name=f"{name} z{min_zoom}-{tier_zoom}" if name else None)
+        if i:
+            options["legend"] = False
+        if m is None:
+            m = tier.explore(column, max_zoom=max_zoom, **options)
+        else:
+            tier.explore(column, m=m, **options)
+        layer = [child for child in m._children.values() if isinstance(child, folium.GeoJson)][-1]
+        ZoomRange(m, layer, min_zoom, tier_zoom).add_to(m)
+    return m
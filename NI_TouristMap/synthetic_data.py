@@ -0,0 +1,390 @@
+# Repository : https://github.com/sereneeosman/egm722_serenee
+
+#========================================= Synthetic Data Generator ==============================================================================================================
+#================================================================================================================================================================================
+"""
+Generate large synthetic inputs with the schemas of the downloaded NI data, to benchmark and load-test the analysis.
+
+The generator writes a ``download_data`` folder with the same file names and formats as the real one:
+
+* ``historic-parks-and-gardens.zip`` : tourist site polygons (``SITE``, ``REF_NO``, ... in Irish Grid, zipped
+  shapefile);
+* ``translink-stations-ni.geojson`` : transport hubs (``Station``, ``ID``, ``Type``, ``Easting``, ``Northing``);
+* ``gp-practice-reference-file---jan-2024.csv`` : GP practices with BT postcodes (``PracNo``, ``PracticeName``, ...);
+* ``ukpostcodes.csv`` : the postcodes of the GP practices (and every other generated postcode), with coordinates;
+* ``Places_to_Visit_in_Causeway_Coast_and_Glens.zip`` : coastal spots near the coastline (zipped shapefile);
+* the real NI outline and county boundary archives, copied from the source data folder.
+
+Features are placed inside the NI outline: most of them around the real transport hubs (as a stand-in for towns),
+the rest uniformly. The analysis can then run on it unchanged::
+
+    python synthetic_data.py synthetic_data --sites 1000000 --gps 100000
+    python analysis_pipeline.py --data-folder synthetic_data
+"""
+
+import argparse
+import os
+import posixpath
+import shutil
+import tempfile
+import zipfile
+
+import numpy as np
+import pandas as pd
+import shapely
+import geopandas as gpd
+
+from archive_reader import read_layer
+from nearest_facility import ITM_CRS
+
+# Irish Grid, the CRS of the Historic Parks and Gardens and of the Translink Easting/Northing columns.
+IRISH_GRID_CRS = "epsg:29902"
+
+# Letters used in the inward part of UK postcodes.
+POSTCODE_LETTERS = list("ABDEFGHJLNPQRSTUWXYZ")
+
+# Words the synthetic names are made of.
+_PLACE_PREFIXES = ["BALLY", "CASTLE", "CARRICK", "DRUM", "GLEN", "KIL", "KNOCK", "LIS", "MOUNT", "RATH", "TULLY"]
+_PLACE_SUFFIXES = ["MORE", "BEG", "HILL", "WOOD", "FORD", "VIEW", "DARRAGH", "NAGH", "GARVEY", "ROE"]
+_SITE_TYPES = ["HOUSE", "PARK", "DEMESNE", "GARDENS", "CASTLE", "ABBEY", "LODGE"]
+_SURNAMES = ["ADAIR", "BELL", "CAMPBELL", "DOHERTY", "ELLIOTT", "FERGUSON", "GRAHAM", "HAMILTON", "IRVINE", "KELLY",
+             "MCCANN", "MCKEE", "MORRISON", "NELSON", "O'NEILL", "PATTERSON", "QUINN", "ROBINSON", "STEWART", "WILSON"]
+_COUNCILS = ["ANTRIM & NEWTOWNABBEY", "ARDS & NORTH DOWN", "ARMAGH, BANBRIDGE & CRAIGAVON", "BELFAST",
+             "CAUSEWAY COAST & GLENS", "DERRY & STRABANE", "FERMANAGH & OMAGH", "LISBURN & CASTLEREAGH",
+             "MID & EAST ANTRIM", "MID ULSTER", "NEWRY, MOURNE & DOWN"]
+_LCGS = ["Belfast", "Northern", "Southern", "South Eastern", "Western"]
+_TOWNS = ["Ballycastle", "Ballymoney", "Bushmills", "Coleraine", "Cushendall", "Limavady", "Portrush", "Portstewart"]
+
+
+def _names(rng, n, words, *more_words):
+    """Make ``n`` random names by joining one random word of each list."""
+    parts = [np.asarray(words)[rng.integers(len(words), size=n)]]
+    for extra in more_words:
+        parts.append(np.asarray(extra)[rng.integers(len(extra), size=n)])
+    names = parts[0].astype(object)
+    for part in parts[1:]:
+        names = names + " " + part.astype(object)
+    return names
+
+
+def random_points(n, outline, rng, anchors=None, spread=4000.0, uniform_share=0.3):
+    """
+    Draw random points inside an outline, clustered around anchor points.
+
+    Parameters
+    ----------
+    n : int
+        The number of points.
+    outline : shapely geometry
+        The area to draw the points in, in metres (ITM).
+    rng : numpy.random.Generator
+        The random number generator.
+    anchors : numpy.ndarray, optional
+        ``(m, 2)`` anchor coordinates (e.g. towns); by default all points are drawn uniformly.
+    spread : float, optional
+        The standard deviation of the distance to the anchor, in metres (default 4 km).
+    uniform_share : float, optional
+        The share of points drawn uniformly over the outline instead of around an anchor (default 0.3).
+
+    Returns
+    -------
+    numpy.ndarray
+        ``(n, 2)`` coordinates, all inside ``outline``.
+    """
+    shapely.prepare(outline)
+    minx, miny, maxx, maxy = outline.bounds
+    points = np.empty((0, 2))
+    while len(points) < n:
+        batch = max(2 * (n - len(points)), 1000)
+        xy = rng.uniform((minx, miny), (maxx, maxy), size=(batch, 2))
+        if anchors is not None and len(anchors):
+            clustered = rng.random(batch) >= uniform_share
+            centres = anchors[rng.integers(len(anchors), size=clustered.sum())]
+            xy[clustered] = centres + rng.normal(0, spread, size=(clustered.sum(), 2))
+        points = np.vstack([points, xy[shapely.contains_xy(outline, xy[:, 0], xy[:, 1])]])
+    return points[:n]
+
+
+def _lonlat(points, crs=ITM_CRS):
+    """Convert ``(n, 2)`` coordinates to longitude/latitude."""
+    lonlat = gpd.GeoSeries(gpd.points_from_xy(points[:, 0], points[:, 1]), crs=crs).to_crs("epsg:4326")
+    return lonlat.x.to_numpy(), lonlat.y.to_numpy()
+
+
+def generate_postcodes(n, outline, rng, anchors=None):
+    """
+    Generate unique BT postcodes with coordinates inside the outline.
+
+    Parameters
+    ----------
+    n : int
+        The number of postcodes (at most 376,000: 94 districts x 10 x 20 x 20).
+    outline : shapely geometry
+        The NI outline, in ITM.
+    rng : numpy.random.Generator
+        The random number generator.
+    anchors : numpy.ndarray, optional
+        Anchor coordinates the postcodes cluster around (see :func:`random_points`).
+
+    Returns
+    -------
+    pandas.DataFrame
+        ``postcode``, ``latitude``, ``longitude`` (``ukpostcodes.csv`` columns), and the ITM ``x``/``y``.
+    """
+    capacity = 94 * 10 * len(POSTCODE_LETTERS) ** 2
+    if n > capacity:
+        raise ValueError(f"at most {capacity} BT postcodes can be generated, not {n}")
+    codes = rng.choice(capacity, size=n, replace=False)
+    district, rest = np.divmod(codes, 10 * len(POSTCODE_LETTERS) ** 2)
+    sector, rest = np.divmod(rest, len(POSTCODE_LETTERS) ** 2)
+    first, second = np.divmod(rest, len(POSTCODE_LETTERS))
+    letters = np.asarray(POSTCODE_LETTERS, dtype=object)
+    postcodes = ("BT" + (district + 1).astype(str).astype(object) + " " + sector.astype(str).astype(object)
+                 + letters[first] + letters[second])
+
+    xy = random_points(n, outline, rng, anchors)
+    lon, lat = _lonlat(xy)
+    return pd.DataFrame({"postcode": postcodes, "latitude": lat.round(6), "longitude": lon.round(6),
+                         "x": xy[:, 0], "y": xy[:, 1]})
+
+
+def generate_gp_practices(n, postcodes, rng):
+    """
+    Generate GP practices at random postcodes, with the columns of the GP practice reference file.
+
+    Parameters
+    ----------
+    n : int
+        The number of practices.
+    postcodes : pandas.DataFrame
+        The postcodes to place them at (see :func:`generate_postcodes`).
+    rng : numpy.random.Generator
+        The random number generator.
+
+    Returns
+    -------
+    pandas.DataFrame
+        ``PracNo``, ``PracticeName`` (space-padded, as in the real file), ``Address1``-``3``, ``Postcode``, ``LCG``
+        and ``Registered_Patients``.
+    """
+    at = rng.integers(len(postcodes), size=n)
+    names = "Dr. " + _names(rng, n, _SURNAMES) + " & PARTNERS"
+    return pd.DataFrame({"PracNo": np.arange(1, n + 1),
+                         "PracticeName": [name.ljust(36) for name in names],
+                         "Address1": _names(rng, n, _PLACE_PREFIXES, ["MEDICAL PRACTICE", "SURGERY", "HEALTH CENTRE"]),
+                         "Address2": _names(rng, n, _PLACE_PREFIXES, ["ROAD", "STREET", "AVENUE"]),
+                         "Address3": _names(rng, n, _PLACE_PREFIXES) + _names(rng, n, _PLACE_SUFFIXES),
+                         "Postcode": postcodes["postcode"].to_numpy()[at],
+                         "LCG": np.asarray(_LCGS, dtype=object)[rng.integers(len(_LCGS), size=n)],
+                         "Registered_Patients": rng.integers(1165, 16368, size=n)})
+
+
+def generate_stations(n, outline, rng, anchors=None):
+    """
+    Generate Translink-like transport hubs.
+
+    Parameters
+    ----------
+    n : int
+        The number of stations.
+    outline : shapely geometry
+        The NI outline, in ITM.
+    rng : numpy.random.Generator
+        The random number generator.
+    anchors : numpy.ndarray, optional
+        Anchor coordinates the stations cluster around (see :func:`random_points`).
+
+    Returns
+    -------
+    geopandas.geodataframe.GeoDataFrame
+        ``Station``, ``ID``, ``Type`` (R rail, B bus, I interchange, in the proportions of the real file),
+        ``Type~Def``, ``Easting``, ``Northing`` (Irish Grid), in EPSG:4326.
+    """
+    xy = random_points(n, outline, rng, anchors)
+    types = rng.choice(["R", "B", "I"], size=n, p=[54 / 78, 21 / 78, 3 / 78])
+    kind = np.select([types == "R", types == "B"], ["RAIL HALT", "BUS CENTRE"], "INTERCHANGE").astype(object)
+    stations = gpd.GeoDataFrame({"Station": _names(rng, n, _PLACE_PREFIXES) + _names(rng, n, _PLACE_SUFFIXES)
+                                 + " " + kind + " " + np.arange(1, n + 1).astype(str).astype(object),
+                                 "ID": np.arange(1, n + 1, dtype=np.int32),
+                                 "Type": types,
+                                 "Type~Def": ""},
+                                geometry=gpd.points_from_xy(xy[:, 0], xy[:, 1]), crs=ITM_CRS)
+    irish_grid = stations.geometry.to_crs(IRISH_GRID_CRS)
+    stations["Easting"] = irish_grid.x.round().astype(np.int32)
+    stations["Northing"] = irish_grid.y.round().astype(np.int32)
+    return stations.to_crs("epsg:4326")
+
+
+def generate_tourist_sites(n, outline, rng, anchors=None, vertices=12):
+    """
+    Generate tourist site polygons with the columns of the Historic Parks and Gardens.
+
+    Each site is a random star-shaped polygon (so always valid) around a random point, with a log-normal size
+    (median radius ~300 m, like the real parks).
+
+    Parameters
+    ----------
+    n : int
+        The number of sites.
+    outline : shapely geometry
+        The NI outline, in ITM.
+    rng : numpy.random.Generator
+        The random number generator.
+    anchors : numpy.ndarray, optional
+        Anchor coordinates the sites cluster around (see :func:`random_points`).
+    vertices : int, optional
+        The number of vertices of each polygon (default 12).
+
+    Returns
+    -------
+    geopandas.geodataframe.GeoDataFrame
+        ``REF_NO``, ``SITE`` (unique), ``CRITERIA``, ``COUNCIL``, ``CF_HB``, ``CF_SMR``, ``Grade``, ``Shape_Leng`` and
+        ``Shape_Area``, in Irish Grid.
+    """
+    centres = random_points(n, outline, rng, anchors, uniform_share=0.5)
+    angles = np.sort(rng.uniform(0, 2 * np.pi, size=(n, vertices)), axis=1)
+    radii = rng.lognormal(np.log(300), 0.6, size=(n, 1)) * rng.uniform(0.6, 1.0, size=(n, vertices))
+    rings = np.stack([centres[:, :1] + radii * np.cos(angles), centres[:, 1:] + radii * np.sin(angles)], axis=2)
+    polygons = shapely.polygons(np.concatenate([rings, rings[:, :1]], axis=1))
+
+    numbers = np.arange(1, n + 1).astype(str).astype(object)
+    sites = gpd.GeoDataFrame({"REF_NO": "S-" + numbers,
+                              "SITE": _names(rng, n, _PLACE_PREFIXES) + _names(rng, n, _PLACE_SUFFIXES) + " "
+                                      + _names(rng, n, _SITE_TYPES) + " " + numbers,
+                              "CRITERIA": rng.integers(1, 4, size=n).astype(str),
+                              "COUNCIL": np.asarray(_COUNCILS, dtype=object)[rng.integers(len(_COUNCILS), size=n)],
+                              "CF_HB": "None",
+                              "CF_SMR": "None",
+                              "Grade": rng.choice(["A", "B", "B+", "C"], size=n)},
+                             geometry=polygons, crs=ITM_CRS).to_crs(IRISH_GRID_CRS)
+    sites["Shape_Leng"] = sites.length
+    sites["Shape_Area"] = sites.area
+    return sites
+
+
+def generate_coastal_spots(n, outline, rng, postcodes, distance=3000.0):
+    """
+    Generate places to visit within ``distance`` of the coastline.
+
+    Parameters
+    ----------
+    n : int
+        The number of spots.
+    outline : shapely geometry
+        The NI outline, in ITM.
+    rng : numpy.random.Generator
+        The random number generator.
+    postcodes : pandas.DataFrame
+        The postcodes to give the spots (see :func:`generate_postcodes`).
+    distance : float, optional
+        The largest distance from the coastline, in metres (default 3 km).
+
+    Returns
+    -------
+    geopandas.geodataframe.GeoDataFrame
+        ``OBJECTID``, ``Name``, ``Address``, ``Postcode``, ``Town`` and ``Website``, in ITM.
+    """
+    # keep random points close to the (simplified) coastline; buffering the full coastline takes far longer
+    coastline = shapely.boundary(shapely.simplify(outline, 50.0))
+    shapely.prepare(coastline)
+    xy = np.empty((0, 2))
+    while len(xy) < n:
+        batch = random_points(max(4 * (n - len(xy)), 1000), outline, rng)
+        xy = np.vstack([xy, batch[shapely.dwithin(coastline, shapely.points(batch), distance)]])
+    xy = xy[:n]
+    names = _names(rng, n, _PLACE_PREFIXES) + _names(rng, n, _PLACE_SUFFIXES) + " " + _names(rng, n, _SITE_TYPES)
+    towns = np.asarray(_TOWNS, dtype=object)[rng.integers(len(_TOWNS), size=n)]
+    return gpd.GeoDataFrame({"OBJECTID": np.arange(1, n + 1, dtype=np.int32),
+                             "Name": names + " " + np.arange(1, n + 1).astype(str).astype(object),
+                             "Address": rng.integers(1, 200, size=n).astype(str).astype(object) + " "
+                                        + _names(rng, n, _PLACE_PREFIXES, ["ROAD", "STREET"]) + ", " + towns,
+                             "Postcode": postcodes["postcode"].to_numpy()[rng.integers(len(postcodes), size=n)],
+                             "Town": towns,
+                             "Website": "http://www.example.org/" + np.arange(1, n + 1).astype(str).astype(object)},
+                            geometry=gpd.points_from_xy(xy[:, 0], xy[:, 1]), crs=ITM_CRS)
+
+
+def _write_zipped_shapefile(data, zip_filepath, member):
+    """Write a layer as a shapefile inside a zip archive, at the member path (e.g. ``folder/name.shp``)."""
+    with tempfile.TemporaryDirectory() as workdir:
+        filepath = os.path.join(workdir, os.path.basename(member))
+        data.to_file(filepath)
+        stem = os.path.splitext(os.path.basename(member))[0]
+        with zipfile.ZipFile(zip_filepath, "w", zipfile.ZIP_DEFLATED) as archive:
+            for filename in sorted(os.listdir(workdir)):
+                if os.path.splitext(filename)[0] == stem:
+                    # the member path is a zip path, "/"-separated on every OS (as GDAL's /vsizip/ looks it up)
+                    archive.write(os.path.join(workdir, filename), posixpath.join(posixpath.dirname(member), filename))
+
+
+def write_synthetic_data(data_folder, sites=10_000, gps=1_000, stations=500, coastal=200, postcodes=50_000, seed=0,
+                         source_folder="data_files"):
+    """
+    Write a synthetic ``download_data`` folder with the file names and formats of the real one.
+
+    Parameters
+    ----------
+    data_folder : str
+        The folder to create ``download_data`` in (e.g. ``synthetic_data``).
+    sites, gps, stations, coastal : int, optional
+        The number of tourist sites, GP practices, transport hubs and coastal spots.
+    postcodes : int, optional
+        The number of BT postcodes in ``ukpostcodes.csv`` (the GP practices and coastal spots use some of them).
+    seed : int, optional
+        The random seed: the same seed and counts give the same data.
+    source_folder : str, optional
+        The real data folder, whose NI outline, counties and transport hubs are used (default ``data_files``).
+
+    Returns
+    -------
+    str
+        The path of the written ``download_data`` folder.
+
+    Examples
+    --------
+    >>> write_synthetic_data("synthetic_data", sites=1_000_000, gps=100_000)
+    """
+    rng = np.random.default_rng(seed)
+    source = os.path.join(source_folder, "download_data")
+    download = os.path.join(data_folder, "download_data")
+    os.makedirs(download, exist_ok=True)
+
+    # the real boundaries: outline and counties are copied, the outline (in ITM) bounds every generated feature
+    for filename in ("OSNI_Open_Data_-_Largescale_Boundaries_-_NI_Outline.zip",
+                     "OSNI_Open_Data_-_Largescale_Boundaries_-_County_Boundaries_.zip"):
+        shutil.copyfile(os.path.join(source, filename), os.path.join(download, filename))
+    outline = shapely.make_valid(shapely.union_all(
+        read_layer(os.path.join(source, "OSNI_Open_Data_-_Largescale_Boundaries_-_NI_Outline.zip")).to_crs(ITM_CRS).geometry.values))
+    towns = gpd.read_file(os.path.join(source, "translink-stations-ni.geojson")).to_crs(ITM_CRS)
+    anchors = shapely.get_coordinates(towns.geometry.values)
+
+    postcode_table = generate_postcodes(postcodes, outline, rng, anchors)
+    postcode_table[["postcode", "latitude", "longitude"]].rename_axis("id").to_csv(
+        os.path.join(download, "ukpostcodes.csv"))
+    generate_gp_practices(gps, postcode_table, rng).to_csv(
+        os.path.join(download, "gp-practice-reference-file---jan-2024.csv"), index=False)
+    generate_stations(stations, outline, rng, anchors).to_file(
+        os.path.join(download, "translink-stations-ni.geojson"), driver="GeoJSON")
+    _write_zipped_shapefile(generate_tourist_sites(sites, outline, rng, anchors),
+                            os.path.join(download, "historic-parks-and-gardens.zip"),
+                            "Historic Parks and Gardens/Historic_Parks_and_Gardens20240410.shp")
+    _write_zipped_shapefile(generate_coastal_spots(coastal, outline, rng, postcode_table),
+                            os.path.join(download, "Places_to_Visit_in_Causeway_Coast_and_Glens.zip"),
+                            "Places_to_Visit_in_Causeway_Coast_and_Glens.shp")
+    return download
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Write synthetic NI tourist map inputs for load tests.")
+    parser.add_argument("data_folder", help="folder to write download_data to")
+    parser.add_argument("--sites", type=int, default=10_000, help="tourist site polygons")
+    parser.add_argument("--gps", type=int, default=1_000, help="GP practices")
+    parser.add_argument("--stations", type=int, default=500, help="transport hubs")
+    parser.add_argument("--coastal", type=int, default=200, help="coastal spots")
+    parser.add_argument("--postcodes", type=int, default=50_000, help="BT postcodes")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--source-folder", default="data_files", help="real data folder (outline, counties, stations)")
+    args = parser.parse_args()
+
+    print(write_synthetic_data(args.data_folder, args.sites, args.gps, args.stations, args.coastal, args.postcodes,
+                               args.seed, args.source_folder))
@@ -0,0 +1,30 @@
+# Repository : https://github.com/sereneeosman/egm722_serenee
+
+"""
+Shared fixtures of the tests: a small synthetic data set (see synthetic_data.py), run once through the analysis
+pipeline. Run from the ``NI_TouristMap`` folder::
+
+    python -m pytest tests
+"""
+
+import os
+import sys
+
+import pytest
+
+# the modules are flat files in the NI_TouristMap folder
+PACKAGE_FOLDER = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PACKAGE_FOLDER)
+
+from analysis_pipeline import build_pipeline  # noqa: E402
+from synthetic_data import write_synthetic_data  # noqa: E402
+
+
+@pytest.fixture(scope="session")
+def synthetic_folder(tmp_path_factory):
+    """A data folder holding a small synthetic ``download_data`` and the pipeline outputs (without the cache)."""
+    folder = str(tmp_path_factory.mktemp("synthetic"))
+    write_synthetic_data(folder, sites=300, gps=80, stations=40, coastal=30, postcodes=2000,
+                         source_folder=os.path.join(PACKAGE_FOLDER, "data_files"))
+    build_pipeline(folder, distance_cache=False).run()
+    return folder
@@ -0,0 +1,163 @@
+# Repository : https://github.com/sereneeosman/egm722_serenee
+
+"""Tests of distance_cache.py: a refreshed cache gives the results of a full search, and of a run without the cache."""
+
+import os
+import shutil
+
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+import pytest
+import shapely
+
+from analysis_pipeline import build_pipeline
+from distance_cache import DistanceCache
+from nearest_facility import FacilityIndex, ITM_CRS, MEASURE_MODES, query_points
+
+
+@pytest.fixture(scope="module")
+def layers(synthetic_folder):
+    tourist = gpd.read_file(os.path.join(synthetic_folder, "NI_Tourist_Sites.shp")).to_crs(ITM_CRS)
+    post_gp = gpd.read_file(os.path.join(synthetic_folder, "NI_PostCodes_GP.geojson")).to_crs(ITM_CRS)
+    return tourist, post_gp
+
+
+def change_practices(post_gp, rng, n=5):
+    """Remove, move and add practices, add one at an existing location (listed first) and rename one."""
+    changed = post_gp.drop(post_gp.index[rng.choice(len(post_gp), n, replace=False)]).reset_index(drop=True)
+    moved = rng.choice(len(changed), n, replace=False)
+    changed.loc[moved, "geometry"] = shapely.points(shapely.get_coordinates(changed.geometry.values[moved])
+                                                    + rng.normal(0, 3000, (n, 2)))
+
+    added = changed.iloc[rng.choice(len(changed), n)].copy()
+    added["PracNo"] = post_gp["PracNo"].max() + 1 + np.arange(n)
+    added["geometry"] = shapely.points(shapely.get_coordinates(added.geometry.values) + rng.normal(0, 5000, (n, 2)))
+    colocated = changed.iloc[[7]].assign(PracNo=post_gp["PracNo"].max() + 1 + n, PracticeName="COLOCATED")
+
+    changed = gpd.GeoDataFrame(pd.concat([colocated, changed, added], ignore_index=True), crs=post_gp.crs)
+    changed.loc[3, "PracticeName"] = "RENAMED"
+    return changed
+
+
+def change_sites(tourist, rng, n=5):
+    """Move some sites and remove others."""
+    changed = tourist.copy()
+    moved = changed.index[rng.choice(len(changed), n, replace=False)]
+    changed.loc[moved, "geometry"] = changed.geometry[moved].translate(500, 500).values
+    return changed.drop(changed.index[rng.choice(len(changed), n, replace=False)])
+
+
+@pytest.mark.parametrize("measure", MEASURE_MODES)
+def test_nearest_refresh_matches_full_search(layers, tmp_path, measure):
+    tourist, post_gp = layers
+    rng = np.random.default_rng(1)
+    cache = DistanceCache(str(tmp_path))
+    for step in range(4):
+        index = FacilityIndex(post_gp, "PracticeName", key_column="PracNo")
+        query = query_points(tourist, measure=measure)
+        idx, dist = cache.nearest("tourist-gp", index, query, ids=tourist["SITE"])
+        expected_idx, expected_dist = index.nearest(query)
+        np.testing.assert_array_equal(idx, expected_idx, err_msg=f"step {step}")
+        np.testing.assert_array_equal(dist, expected_dist, err_msg=f"step {step}")
+        post_gp, tourist = change_practices(post_gp, rng), change_sites(tourist, rng)
+
+
+def test_nearest_ties_follow_the_facility_order(tmp_path):
+    cache = DistanceCache(str(tmp_path))
+    query = shapely.points([(0, 0), (0, 50)])
+
+    def layer(*points):
+        return gpd.GeoDataFrame({"name": [f"{x} {y}" for x, y in points]}, geometry=shapely.points(points), crs=ITM_CRS)
+
+    def check(facilities):
+        index = FacilityIndex(facilities, "name")
+        expected = index.nearest(query)
+        result = cache.nearest("ties", index, query)
+        np.testing.assert_array_equal(result[0], expected[0])
+        np.testing.assert_array_equal(result[1], expected[1])
+        return index.take_names(result[0]).tolist()
+
+    assert check(layer((100, 0), (0, 500))) == ["100 0", "100 0"]
+    # a facility added first, as near as the cached one: it is listed first, so it wins the tie
+    assert check(layer((-100, 0), (100, 0), (0, 500))) == ["-100 0", "-100 0"]
+    # the cached result was a tie: removing the first facility gives the other one
+    assert check(layer((100, 0), (0, 500))) == ["100 0", "100 0"]
+    # the same facilities listed the other way round
+    assert check(layer((0, 500), (-100, 0), (100, 0))) == ["-100 0", "-100 0"]
+
+
+def test_k_nearest_refresh_matches_full_search(layers, tmp_path):
+    tourist, post_gp = layers
+    rng = np.random.default_rng(2)
+    cache = DistanceCache(str(tmp_path))
+    for step in range(3):
+        index = FacilityIndex(post_gp, "PracticeName", key_column="PracNo")
+        query = query_points(tourist)
+        idx, dist = cache.k_nearest("tourist-gp-3", index, query, 3, ids=tourist["SITE"])
+        expected_idx, expected_dist = index.k_nearest(query, 3)
+        np.testing.assert_array_equal(dist, expected_dist, err_msg=f"step {step}")
+        # facilities at the same distance may come in another order than the KD-tree gives them
+        rows, columns = np.nonzero(idx != expected_idx)
+        coords = shapely.get_coordinates(query[rows])
+        distances = np.hypot(*(coords[:, None, :] - index.kdtree.data[None, :, :]).transpose(2, 0, 1))
+        assert (np.isclose(distances, dist[rows, columns][:, None], rtol=0, atol=1e-6).sum(axis=1) > 1).all()
+        post_gp, tourist = change_practices(post_gp, rng), change_sites(tourist, rng)
+
+
+def test_pipeline_with_cache_matches_rerun_without(synthetic_folder, tmp_path):
+    rng = np.random.default_rng(3)
+    download = os.path.join(synthetic_folder, "download_data")
+    gp_practices = pd.read_csv(os.path.join(download, "gp-practice-reference-file---jan-2024.csv"))
+    cached, uncached = str(tmp_path / "cached"), str(tmp_path / "uncached")
+    for folder in (cached, uncached):
+        shutil.copytree(download, os.path.join(folder, "download_data"))
+    build_pipeline(cached).run()
+
+    # a new GP file: practices closed, moved to another postcode, and opened
+    new_file = str(tmp_path / "gp-practice-reference-file---feb-2024.csv")
+    changed = gp_practices.drop(gp_practices.index[rng.choice(len(gp_practices), 5, replace=False)])
+    moved = changed.index[rng.choice(len(changed), 5, replace=False)]
+    changed.loc[moved, "Postcode"] = gp_practices["Postcode"].sample(5, random_state=3).to_numpy()
+    opened = gp_practices.sample(5, random_state=4).assign(PracNo=np.arange(10**6, 10**6 + 5))
+    pd.concat([opened, changed]).to_csv(new_file, index=False)
+
+    assert build_pipeline(cached, new_file).run()["distances"] == "ran"
+    build_pipeline(uncached, new_file, distance_cache=False).run()
+    assert os.path.isdir(os.path.join(cached, "distance_cache"))
+    assert not os.path.exists(os.path.join(uncached, "distance_cache"))
+    for filename in ("NI_Tourist_trans_GP_Dist.csv", "NI_Coastal_spots.geojson"):
+        with open(os.path.join(cached, filename), "rb") as a, open(os.path.join(uncached, filename), "rb") as b:
+            assert a.read() == b.read(), filename
+
+
+def test_interrupted_save_keeps_a_whole_entry(layers, tmp_path, monkeypatch):
+    tourist, post_gp = layers
+    cache = DistanceCache(str(tmp_path))
+    index = FacilityIndex(post_gp, "PracticeName", key_column="PracNo")
+    cache.nearest("tourist-gp", index, query_points(tourist), ids=tourist["SITE"])
+
+    # the next save (of fewer sites) fails after its first array
+    sites = tourist.iloc[: len(tourist) // 2]
+    saved = []
+
+    def failing_save(filepath, values):
+        if saved:
+            raise KeyboardInterrupt
+        saved.append(filepath)
+        with open(filepath, "wb") as f:
+            np.lib.format.write_array(f, values)
+
+    monkeypatch.setattr(np, "save", failing_save)
+    with pytest.raises(KeyboardInterrupt):
+        cache.nearest("tourist-gp", index, query_points(sites), ids=sites["SITE"])
+    monkeypatch.undo()
+
+    entry = os.path.join(str(tmp_path), "tourist-gp")
+    assert len(np.load(os.path.join(entry, "sites.npy"))) == len(np.load(os.path.join(entry, "distance.npy")))
+    for data in (sites, tourist):
+        query = query_points(data)
+        idx, dist = cache.nearest("tourist-gp", index, query, ids=data["SITE"])
+        expected_idx, expected_dist = index.nearest(query)
+        np.testing.assert_array_equal(idx, expected_idx)
+        np.testing.assert_array_equal(dist, expected_dist)
@@ -0,0 +1,100 @@
+# Repository : https://github.com/sereneeosman/egm722_serenee
+
+"""Tests of nearest_facility.py against a brute-force search over every (site, facility) pair."""
+
+import os
+
+import geopandas as gpd
+import numpy as np
+import pytest
+import shapely
+
+from nearest_facility import FacilityIndex, ITM_CRS, MEASURE_MODES, query_points
+
+
+def brute_force_distances(query, facilities):
+    """The ``(n_queries, n_facilities)`` matrix of distances."""
+    return shapely.distance(np.asarray(query, dtype=object)[:, None], np.asarray(facilities, dtype=object)[None, :])
+
+
+@pytest.fixture(scope="module")
+def layers(synthetic_folder):
+    tourist = gpd.read_file(os.path.join(synthetic_folder, "NI_Tourist_Sites.shp"))
+    post_gp = gpd.read_file(os.path.join(synthetic_folder, "NI_PostCodes_GP.geojson"))
+    return tourist, post_gp
+
+
+@pytest.mark.parametrize("measure", MEASURE_MODES)
+def test_nearest_matches_brute_force(layers, measure):
+    tourist, post_gp = layers
+    assert post_gp.geometry.duplicated().any(), "the synthetic GP file should hold co-located practices"
+    index = FacilityIndex(post_gp, "PracticeName", key_column="PracNo")
+    query = query_points(tourist, measure=measure)
+
+    distances = brute_force_distances(query, index.facilities.geometry.values)
+    idx, dist = index.nearest(query)
+    # argmin keeps the first of the tied facilities, as the index does
+    np.testing.assert_array_equal(idx, distances.argmin(axis=1))
+    np.testing.assert_array_equal(dist, distances.min(axis=1))
+
+
+def test_nearest_breaks_ties_by_position():
+    # the query point is exactly as far from the facilities at positions 1, 2 and 3; 0 is farther
+    facilities = gpd.GeoDataFrame({"name": ["far", "east", "west", "north"]},
+                                  geometry=shapely.points([(0, 500), (100, 0), (-100, 0), (0, 100)]), crs=ITM_CRS)
+    index = FacilityIndex(facilities, "name")
+    idx, dist = index.nearest(shapely.points([(0, 0), (0, 0)]))
+    np.testing.assert_array_equal(idx, [1, 1])
+    np.testing.assert_array_equal(dist, [100.0, 100.0])
+
+    # listed the other way round, the first one listed still wins
+    index = FacilityIndex(facilities.iloc[::-1], "name")
+    idx, _ = index.nearest(shapely.points([(0, 0)]))
+    assert index.take_names(idx).tolist() == ["north"]
+
+
+def test_colocated_expansion(layers):
+    _, post_gp = layers
+    index = FacilityIndex(post_gp, "PracticeName", key_column="PracNo")
+    wkb = shapely.to_wkb(index.facilities.geometry.values)
+    positions = np.arange(len(index))
+
+    groups = index.colocated(positions)
+    for position, group in zip(positions, groups):
+        # every facility at the same location, in position order, the first of which is what nearest() returns
+        np.testing.assert_array_equal(group, np.flatnonzero(wkb == wkb[position]))
+    assert index.take_colocated(positions, "PracNo")[0] == tuple(post_gp["PracNo"].to_numpy()[groups[0]].tolist())
+
+    # querying at a shared location returns its first practice
+    shared = np.flatnonzero([len(group) > 1 for group in groups])
+    idx, dist = index.nearest(index.facilities.geometry.values[shared])
+    np.testing.assert_array_equal(idx, [groups[i][0] for i in shared])
+    np.testing.assert_array_equal(dist, 0.0)
+
+    assert index.colocated(np.array([-1]))[0].size == 0
+    assert index.take_colocated(np.array([-1]))[0] == ()
+
+
+def test_missing_geometries():
+    facilities = gpd.GeoDataFrame({"name": ["a"]}, geometry=shapely.points([(0, 0)]), crs=ITM_CRS)
+    idx, dist = FacilityIndex(facilities, "name").nearest(np.array([None, shapely.Point(), shapely.Point(3, 4)]))
+    np.testing.assert_array_equal(idx, [-1, -1, 0])
+    np.testing.assert_array_equal(dist, [np.nan, np.nan, 5.0])
+
+
+def test_k_nearest_and_within(layers):
+    tourist, post_gp = layers
+    index = FacilityIndex(post_gp, "PracticeName", key_column="PracNo")
+    query = query_points(tourist)
+    distances = brute_force_distances(query, index.facilities.geometry.values)
+
+    _, dist = index.k_nearest(query, 3)
+    np.testing.assert_allclose(dist, np.sort(distances, axis=1)[:, :3])
+
+    radius = 5000.0
+    matches = index.within(query, radius)
+    expected_query, expected_index = np.nonzero(distances <= radius)
+    order = np.lexsort((expected_index, distances[expected_query, expected_index], expected_query))
+    np.testing.assert_array_equal(matches.query, expected_query[order])
+    np.testing.assert_array_equal(matches.index, expected_index[order])
+    np.testing.assert_array_equal(matches.distance, distances[expected_query, expected_index][order])
@@ -0,0 +1,92 @@
+# Repository : https://github.com/sereneeosman/egm722_serenee
+
+"""Tests of postcode_index.py against a plain lookup in the postcode CSV file."""
+
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from analysis_pipeline import build_pipeline
+from postcode_index import PostcodeIndex, build_postcode_index, is_index_current, normalise_postcodes
+
+
+@pytest.fixture()
+def csv_filepath(synthetic_folder, tmp_path):
+    """A copy of the synthetic ``ukpostcodes.csv``, with a row without postcode and a duplicated postcode."""
+    table = pd.read_csv(os.path.join(synthetic_folder, "download_data", "ukpostcodes.csv"))
+    extra = pd.DataFrame({"id": [-1, -2], "postcode": [None, table["postcode"].iloc[0].lower().replace(" ", "")],
+                          "latitude": [54.5, 0.0], "longitude": [-6.5, 0.0]})
+    filepath = str(tmp_path / "ukpostcodes.csv")
+    pd.concat([table, extra]).to_csv(filepath, index=False)
+    return filepath
+
+
+def test_lookup_matches_csv(csv_filepath, tmp_path):
+    index_folder = str(tmp_path / "index")
+    count = build_postcode_index(csv_filepath, index_folder, prefix="BT")
+    index = PostcodeIndex(index_folder)
+    assert len(index) == count
+
+    # the first row of a duplicated postcode wins, and rows without postcode are dropped (no "nan" key)
+    table = pd.read_csv(csv_filepath, dtype={"postcode": str})
+    table = table[table["postcode"].notna()]
+    table = table.assign(key=normalise_postcodes(table["postcode"]).to_numpy()).drop_duplicates("key")
+    assert count == len(table)
+    assert b"NAN" not in index.keys
+
+    # lookups are exact (float64) whatever the spacing and case
+    queries = table["key"].str.lower().str.replace(" ", "", regex=False)
+    latitude, longitude, found = index.lookup(queries)
+    assert found.all()
+    np.testing.assert_array_equal(latitude, table["latitude"].to_numpy())
+    np.testing.assert_array_equal(longitude, table["longitude"].to_numpy())
+
+    latitude, longitude, found = index.lookup(["ZZ1 1ZZ", None, "nan"])
+    assert not found.any() and np.isnan(latitude).all() and np.isnan(longitude).all()
+
+
+def test_geocode_keeps_matched_rows(csv_filepath, tmp_path):
+    index_folder = str(tmp_path / "index")
+    build_postcode_index(csv_filepath, index_folder, prefix="BT")
+    gp = pd.DataFrame({"PracNo": [1, 2, 3], "Postcode": [PostcodeIndex(index_folder).keys[0].decode(), "ZZ1 1ZZ", None]})
+    geocoded = PostcodeIndex(index_folder).geocode(gp)
+    assert geocoded["PracNo"].tolist() == [1]
+    assert list(geocoded.columns[:3]) == ["postcode", "latitude", "longitude"]
+
+
+def test_is_index_current(csv_filepath, tmp_path):
+    index_folder = str(tmp_path / "index")
+    assert not is_index_current(csv_filepath, index_folder, prefix="BT")
+    build_postcode_index(csv_filepath, index_folder, prefix="BT")
+    assert is_index_current(csv_filepath, index_folder, prefix="BT")
+    assert not is_index_current(csv_filepath, index_folder, prefix="")
+
+    # a new download of the file (another modification time) needs a new index
+    stat = os.stat(csv_filepath)
+    os.utime(csv_filepath, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    assert not is_index_current(csv_filepath, index_folder, prefix="BT")
+
+    build_postcode_index(csv_filepath, index_folder, prefix="BT")
+    os.remove(os.path.join(index_folder, "coords.npy"))
+    assert not is_index_current(csv_filepath, index_folder, prefix="BT")
+
+
+def test_index_kept_without_source_file(csv_filepath, tmp_path):
+    index_folder = str(tmp_path / "index")
+    build_postcode_index(csv_filepath, index_folder, prefix="BT")
+    os.remove(csv_filepath)
+    assert is_index_current(csv_filepath, index_folder, prefix="BT")
+    assert not is_index_current(csv_filepath, index_folder, prefix="")
+    assert not is_index_current(csv_filepath, str(tmp_path / "missing"), prefix="BT")
+
+
+def test_pipeline_keeps_index_without_source_file(synthetic_folder, tmp_path):
+    folder = str(tmp_path / "data")
+    shutil.copytree(os.path.join(synthetic_folder, "download_data"), os.path.join(folder, "download_data"))
+    build_pipeline(folder, distance_cache=False).run()
+    os.remove(os.path.join(folder, "download_data", "ukpostcodes.csv"))
+    status = build_pipeline(folder, distance_cache=False).run()
+    assert set(status.values()) == {"skipped"}
@@ -0,0 +1,87 @@
+# Repository : https://github.com/sereneeosman/egm722_serenee
+
+"""Tests of road_network.py: the multi-source Dijkstra against one Dijkstra per facility."""
+
+import os
+
+import geopandas as gpd
+import numpy as np
+import pytest
+import shapely
+from scipy.sparse.csgraph import dijkstra
+
+from nearest_facility import ITM_CRS, query_points
+from road_network import NetworkFacilityIndex, RoadGraph
+
+
+def grid_graph(bounds, rng, size=30, directed=False):
+    """A jittered grid of roads over ``bounds``, with some roads missing, winding (longer than a straight line)."""
+    xmin, ymin, xmax, ymax = bounds
+    x, y = np.meshgrid(np.linspace(xmin, xmax, size), np.linspace(ymin, ymax, size))
+    coords = np.column_stack([x.ravel(), y.ravel()]) + rng.normal(0, 500, (size * size, 2))
+    node = np.arange(size * size).reshape(size, size)
+    source = np.concatenate([node[:, :-1].ravel(), node[:-1, :].ravel()])
+    target = np.concatenate([node[:, 1:].ravel(), node[1:, :].ravel()])
+    kept = rng.random(len(source)) > 0.2
+    source, target = source[kept], target[kept]
+    if directed: # a quarter of the roads are one-way, the others are listed both ways
+        two_way = rng.random(len(source)) > 0.25
+        source, target = np.concatenate([source, target[two_way]]), np.concatenate([target, source[two_way]])
+    length = np.hypot(*(coords[source] - coords[target]).T) * rng.uniform(1, 1.5, len(source))
+    return RoadGraph(coords, source, target, length, directed=directed)
+
+
+def brute_force(graph, facility_points, query, max_snap=None):
+    """The road distance of every query to every facility: one Dijkstra per facility, plus both snap distances."""
+    facility_node, facility_snap = graph.snap(shapely.get_coordinates(facility_points))
+    query_node, query_snap = graph.snap(shapely.get_coordinates(shapely.centroid(query)))
+    # on a directed graph, the distance is travelled from the query to the facility
+    matrix = graph.matrix.T if graph.directed else graph.matrix
+    road = dijkstra(matrix, directed=True, indices=facility_node)[:, query_node].T
+    distances = query_snap[:, None] + road + facility_snap[None, :]
+    if max_snap is not None:
+        distances[query_snap > max_snap] = np.inf
+        distances[:, facility_snap > max_snap] = np.inf
+    return distances
+
+
+@pytest.fixture(scope="module")
+def layers(synthetic_folder):
+    tourist = gpd.read_file(os.path.join(synthetic_folder, "NI_Tourist_Sites.shp")).to_crs(ITM_CRS)
+    post_gp = gpd.read_file(os.path.join(synthetic_folder, "NI_PostCodes_GP.geojson")).to_crs(ITM_CRS)
+    return tourist, post_gp
+
+
+@pytest.mark.parametrize("directed", [False, True])
+@pytest.mark.parametrize("max_snap", [None, 1500.0])
+def test_nearest_matches_dijkstra_per_facility(layers, directed, max_snap):
+    tourist, post_gp = layers
+    graph = grid_graph(post_gp.total_bounds, np.random.default_rng(0), directed=directed)
+    index = NetworkFacilityIndex(post_gp, "PracticeName", graph, key_column="PracNo", max_snap=max_snap)
+    query = query_points(tourist)
+
+    distances = brute_force(graph, index.facilities.geometry.values, query, max_snap)
+    idx, dist = index.nearest(query)
+
+    reached = np.isfinite(distances).any(axis=1)
+    assert reached.sum() > len(query) // 4
+    np.testing.assert_array_equal(idx[~reached], -1)
+    assert np.isnan(dist[~reached]).all()
+    np.testing.assert_allclose(dist[reached], distances[reached].min(axis=1), rtol=1e-9)
+    # the facility found is one of the nearest (co-located practices are the same source: the first one is given)
+    found = distances[reached, idx[reached]]
+    np.testing.assert_allclose(found, distances[reached].min(axis=1), rtol=1e-9)
+    np.testing.assert_array_equal(index.colocated(idx[reached])[0][0], idx[reached][0])
+
+
+def test_multi_source_offsets_and_unreachable_nodes():
+    # 0 - 1 - 2 - 3, and 4 alone
+    graph = RoadGraph(np.array([[0, 0], [10, 0], [20, 0], [30, 0], [100, 100]]), [0, 1, 2], [1, 2, 3])
+    source, distance = graph.multi_source(np.array([0, 3, -1]), offsets=np.array([0.0, 5.0, 0.0]))
+    # node 2 is 20 from the first source and 10 + 5 from the second one
+    np.testing.assert_array_equal(source, [0, 0, 1, 1, -1])
+    np.testing.assert_array_equal(distance, [0, 10, 15, 5, np.inf])
+
+    source, distance = graph.multi_source(np.array([-1]))
+    np.testing.assert_array_equal(source, -1)
+    assert np.isinf(distance).all()
@@ -0,0 +1,476 @@
+# Repository : https://github.com/sereneeosman/egm722_serenee
+
+#========================================= Vector Tile Export ====================================================================================================================
+#================================================================================================================================================================================
+"""
+Export the map layers to a vector tile pyramid (MBTiles) and show them on a Folium map.
+
+Instead of embedding every feature as GeoJSON in the map HTML, the counties, tourist sites and coastal spots are cut
+into Mapbox Vector Tiles (one SQLite ``.mbtiles`` file), and the map only fetches the tiles in view through the
+Leaflet.VectorGrid plugin (``folium.plugins.VectorGridProtobuf``).
+
+* Each zoom level is built with the geometries simplified for that zoom level (see :mod:`simplify_tiers`): each
+  tolerance tier of a layer is simplified once (and read from the cache of simplified layers when it was simplified
+  before), and the zoom levels are built in worker processes (one zoom level each).
+* A layer can be limited to a range of zoom levels (e.g. small polygons only from the zoom levels they are visible at).
+* The build is incremental: a key made of the contents of the layers in a zoom level and the tile settings is stored
+  per zoom level in the MBTiles metadata, and zoom levels whose key is unchanged are not rebuilt (so a change to a
+  layer only rebuilds the zoom levels it is in).
+* :func:`serve_mbtiles` is a small local tile server, so the tiles can be tested offline::
+
+    python vector_tiles.py data_files/NI_tiles.mbtiles --port 8765
+
+Encoding the tiles needs the ``mapbox-vector-tile`` package.
+
+Examples
+--------
+>>> layers = {"counties": counties, "sites": visit_all, "coastal": coastalpt}
+>>> export_mbtiles(layers, "data_files/NI_tiles.mbtiles", coverage_layers=["counties"])
+>>> add_vector_tile_layer(m, "http://localhost:8765/{z}/{x}/{y}.pbf", {"counties": {"fillColor": "#66c2a5"}})
+"""
+
+import argparse
+import gzip
+import hashlib
+import json
+import math
+import os
+import sqlite3
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+import pandas as pd
+import shapely
+from branca.element import MacroElement
+from folium.plugins import VectorGridProtobuf
+from jinja2 import Template
+
+from simplify_tiers import CACHE_FOLDER, geometry_hash, simplified_layer, tolerance_for_zoom
+
+# Web Mercator, the CRS of the tile grid.
+WEB_MERCATOR = "epsg:3857"
+
+# Half the width of the Web Mercator world, in metres.
+ORIGIN_SHIFT = 20037508.342789244
+
+# Tile coordinate extent and the buffer (in tile units) kept around each tile, so lines don't show seams.
+TILE_EXTENT = 4096
+TILE_BUFFER = 64
+
+
+def tile_bounds(zoom, x, y):
+    """
+    Get the Web Mercator bounds of an XYZ tile.
+
+    Parameters
+    ----------
+    zoom, x, y : int
+        The tile address (XYZ scheme, y counted from the top).
+
+    Returns
+    -------
+    tuple of float
+        ``(minx, miny, maxx, maxy)`` in metres.
+    """
+    size = 2 * ORIGIN_SHIFT / 2 ** zoom
+    minx = -ORIGIN_SHIFT + x * size
+    maxy = ORIGIN_SHIFT - y * size
+    return minx, maxy - size, minx + size, maxy
+
+
+def tile_range(bounds, zoom):
+    """
+    Get the XYZ tile columns and rows covering Web Mercator bounds.
+
+    Parameters
+    ----------
+    bounds : sequence of float
+        ``(minx, miny, maxx, maxy)`` in metres.
+    zoom : int
+        The zoom level.
+
+    Returns
+    -------
+    tuple of range
+        ``(columns, rows)``.
+    """
+    n = 2 ** zoom
+    size = 2 * ORIGIN_SHIFT / n
+    minx, miny, maxx, maxy = bounds
+    x0 = min(max(int((minx + ORIGIN_SHIFT) // size), 0), n - 1)
+    x1 = min(max(int((maxx + ORIGIN_SHIFT) // size), 0), n - 1)
+    y0 = min(max(int((ORIGIN_SHIFT - maxy) // size), 0), n - 1)
+    y1 = min(max(int((ORIGIN_SHIFT - miny) // size), 0), n - 1)
+    return range(x0, x1 + 1), range(y0, y1 + 1)
+
+
+def _properties(data):
+    """Convert the attribute columns of a layer to a list of JSON-able dicts, leaving out missing values."""
+    attributes = pd.DataFrame(data.drop(columns=data.geometry.name))
+    records = []
+    for row in attributes.to_dict("records"):
+        props = {}
+        for key, value in row.items():
+            if value is None or (isinstance(value, float) and math.isnan(value)):
+                continue
+            props[str(key)] = value.item() if isinstance(value, np.generic) else value
+        records.append(props)
+    return records
+
+
+def _layer_key(data):
+    """Key of the content of one layer: geometries and attributes."""
+    attributes = pd.DataFrame(data.drop(columns=data.geometry.name))
+    digest = hashlib.sha256(geometry_hash(data).encode())
+    digest.update(pd.util.hash_pandas_object(attributes, index=False).to_numpy().tobytes())
+    digest.update(repr(list(attributes.columns)).encode())
+    return digest.hexdigest()
+
+
+def _zoom_key(layer_keys, zoom, coverage_layers):
+    """Key of one zoom level: the keys of the layers it contains and the tile settings."""
+    content = sorted((name, key, name in coverage_layers) for name, key in layer_keys.items())
+    settings = (zoom, tolerance_for_zoom(zoom), TILE_EXTENT, TILE_BUFFER)
+    return hashlib.sha256(repr((content, settings)).encode()).hexdigest()
+
+
+def _is_blank(data):
+    """True if a layer has no geometry to draw (no rows, or only missing or empty geometries)."""
+    return bool((data.geometry.isna() | data.geometry.is_empty).all())
+
+
+def _tier_layers(layers, zoom, coverage_layers=(), cache_folder=CACHE_FOLDER, tiers=None):
+    """
+    Prepare the layers of one zoom level for :func:`_cut_tiles`: their geometries simplified for the zoom level (with
+    the cache of :func:`simplify_tiers.simplified_layer`) and projected to Web Mercator, and their properties.
+
+    ``tiers`` is an optional dict reused between zoom levels, so that each tolerance tier of a layer is only simplified
+    and projected once; empty layers are left out.
+    """
+    tiers = {} if tiers is None else tiers
+    tolerance = tolerance_for_zoom(zoom)
+    prepared = {}
+    for name, data in layers.items():
+        if _is_blank(data): # no bounds to cut tiles from
+            continue
+        if (name, tolerance) not in tiers:
+            simplified = simplified_layer(data, tolerance, name in coverage_layers, cache_folder)
+            if name not in tiers:
+                tiers[name] = _properties(data) # the properties are the same at every zoom level
+            tiers[name, tolerance] = (simplified.geometry.to_crs(WEB_MERCATOR).values, tiers[name])
+        prepared[name] = tiers[name, tolerance]
+    return prepared
+
+
+def _cut_tiles(layers, zoom):
+    """Cut prepared layers (``{name: (Web Mercator geometries, properties)}``) into the gzipped tiles of a zoom level."""
+    import mapbox_vector_tile
+
+    pad = TILE_BUFFER / TILE_EXTENT
+    tiles = {}
+
+    for name, (geometries, properties) in layers.items():
+        # every tile of the layer's bounding box, queried against the layer at once
+        columns, rows = tile_range(shapely.total_bounds(geometries), zoom)
+        xs, ys = np.meshgrid(np.array(columns), np.array(rows))
+        xs, ys = xs.ravel(), ys.ravel()
+        size = 2 * ORIGIN_SHIFT / 2 ** zoom
+        minx = -ORIGIN_SHIFT + xs * size
+        maxy = ORIGIN_SHIFT - ys * size
+        boxes = shapely.box(minx - pad * size, maxy - size - pad * size, minx + size + pad * size, maxy + pad * size)
+
+        # query pairs come sorted by tile, so split them into one group per tile
+        tile_pos, geom_pos = shapely.STRtree(geometries).query(boxes, predicate="intersects")
+        starts = np.flatnonzero(np.diff(tile_pos, prepend=-1))
+        for t, selected in zip(tile_pos[starts], np.split(geom_pos, starts[1:])):
+            x, y = int(xs[t]), int(ys[t])
+            bounds = tile_bounds(zoom, x, y)
+            clipped = shapely.clip_by_rect(geometries[selected], *shapely.bounds(boxes[t]))
+            features = [{"geometry": geom, "properties": properties[i], "id": int(i)}
+                        for geom, i in zip(clipped, selected) if not shapely.is_empty(geom)]
+            if features:
+                tiles.setdefault((x, y), []).append({"name": name, "features": features, "bounds": bounds})
+
+    encoded = []
+    for (x, y), tile_layers in tiles.items():
+        bounds = tile_layers[0].pop("bounds")
+        for layer in tile_layers[1:]:
+            layer.pop("bounds")
+        data = mapbox_vector_tile.encode(tile_layers, default_options={"quantize_bounds": bounds,
+                                                                        "extents": TILE_EXTENT})
+        encoded.append((x, y, gzip.compress(data)))
+    return encoded
+
+
+def build_zoom(layers, zoom, coverage_layers=(), cache_folder=CACHE_FOLDER):
+    """
+    Cut the layers into vector tiles for one zoom level.
+
+    Parameters
+    ----------
+    layers : dict
+        Maps a tile layer name to a GeoDataFrame.
+    zoom : int
+        The zoom level.
+    coverage_layers : collection of str, optional
+        The names of the layers simplified as a coverage (see :func:`simplify_tiers.simplify_geometries`).
+    cache_folder : str or None, optional
+        The folder of the cached simplified geometries (see :func:`simplify_tiers.simplified_layer`); None disables
+        the cache.
+
+    Returns
+    -------
+    list of tuple
+        ``(x, y, data)`` for every non-empty tile, ``data`` being the gzipped Mapbox Vector Tile.
+    """
+    return _cut_tiles(_tier_layers(layers, zoom, coverage_layers, cache_folder), zoom)
+
+
+def _pool_context():
+    """
+    The multiprocessing context of the tile workers: fork, so that a plain script (such as ``NI_TouristMap.py``)
+    needs no ``if __name__ == "__main__":`` guard; None where processes cannot be forked (Windows).
+    """
+    if "fork" in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context("fork")
+    return None
+
+
+def _open_mbtiles(filepath):
+    db = sqlite3.connect(filepath)
+    db.execute("CREATE TABLE IF NOT EXISTS metadata (name TEXT PRIMARY KEY, value TEXT)")
+    db.execute("CREATE TABLE IF NOT EXISTS tiles (zoom_level INTEGER, tile_column INTEGER, tile_row INTEGER, "
+               "tile_data BLOB, PRIMARY KEY (zoom_level, tile_column, tile_row))")
+    return db
+
+
+def export_mbtiles(layers, filepath, minzoom=6, maxzoom=14, coverage_layers=(), layer_zooms=None, workers=None,
+                   force=False, cache_folder=CACHE_FOLDER):
+    """
+    Export layers to an MBTiles vector tile pyramid, rebuilding only the zoom levels whose content changed.
+
+    Parameters
+    ----------
+    layers : dict
+        Maps a tile layer name to a GeoDataFrame (e.g. ``{"counties": counties, "sites": visit_all}``).
+    filepath : str
+        Path to the ``.mbtiles`` file (updated in place if it exists).
+    minzoom, maxzoom : int, optional
+        The zoom levels to build (default 6 to 14).
+    coverage_layers : collection of str, optional
+        The names of the layers simplified as a coverage (e.g. ``["counties"]``).
+    layer_zooms : dict, optional
+        Maps a layer name to the ``(minzoom, maxzoom)`` it is shown at (default: every layer at every zoom level).
+    workers : int, optional
+        The number of worker processes, at most one per zoom level (default: one per CPU). The workers are forked,
+        so the calling script needs no ``if __name__ == "__main__":`` guard; where processes cannot be forked
+        (Windows), or with ``workers=1``, the zoom levels are built in this process.
+    force : bool, optional
+        True to rebuild every zoom level.
+    cache_folder : str or None, optional
+        The folder of the cached simplified geometries, shared with the map (see
+        :func:`simplify_tiers.simplified_layer`); None disables the cache.
+
+    Returns
+    -------
+    dict
+        Maps each zoom level to the number of tiles written, or ``"skipped"``.
+
+    Examples
+    --------
+    >>> export_mbtiles({"counties": counties}, "data_files/NI_tiles.mbtiles", coverage_layers=["counties"])
+    >>> export_mbtiles({"counties": counties, "sites": visit_all}, "data_files/NI_tiles.mbtiles",
+    ...                layer_zooms={"sites": (8, 14)})
+    """
+    coverage_layers = tuple(coverage_layers)
+    zooms = range(minzoom, maxzoom + 1)
+    layer_zooms = {name: (layer_zooms or {}).get(name, (minzoom, maxzoom)) for name in layers}
+    # the layers of each zoom level, and its key over those layers only
+    zoom_layers = {z: {name: data for name, data in layers.items()
+                       if layer_zooms[name][0] <= z <= layer_zooms[name][1]} for z in zooms}
+    layer_keys = {name: _layer_key(data) for name, data in layers.items()}
+    keys = {z: _zoom_key({name: layer_keys[name] for name in zoom_layers[z]}, z, coverage_layers) for z in zooms}
+
+    db = _open_mbtiles(filepath)
+    stored = dict(db.execute("SELECT name, value FROM metadata WHERE name LIKE 'zoom_key_%'").fetchall())
+    todo = [z for z in zooms if force or stored.get(f"zoom_key_{z}") != keys[z]]
+    status = {z: "skipped" for z in zooms if z not in todo}
+
+    def store(z, tiles):
+        with db:
+            db.execute("DELETE FROM tiles WHERE zoom_level = ?", (z,))
+            # MBTiles rows are counted from the bottom (TMS scheme)
+            db.executemany("INSERT INTO tiles VALUES (?, ?, ?, ?)",
+                           [(z, x, 2 ** z - 1 - y, data) for x, y, data in tiles])
+            db.execute("INSERT OR REPLACE INTO metadata VALUES (?, ?)", (f"zoom_key_{z}", keys[z]))
+        status[z] = len(tiles)
+
+    # each tolerance tier of a layer is simplified and projected once, here, for all the zoom levels it serves
+    tiers = {}
+    prepared = {z: _tier_layers(zoom_layers[z], z, coverage_layers, cache_folder, tiers) for z in todo}
+
+    workers = min(workers or os.cpu_count() or 1, len(todo))
+    context = _pool_context()
+    if workers > 1 and context is not None:
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+            futures = {z: pool.submit(_cut_tiles, prepared[z], z) for z in todo}
+            for z, future in futures.items():
+                store(z, future.result())
+    else:
+        for z in todo:
+            store(z, _cut_tiles(prepared[z], z))
+
+    # the bounds of the non-empty layers (the whole Web Mercator world if they are all empty)
+    bounds = np.array([data.to_crs("epsg:4326").total_bounds for data in layers.values()
+                       if not _is_blank(data)]).reshape(-1, 4)
+    west, south, east, north = (*bounds[:, :2].min(axis=0), *bounds[:, 2:].max(axis=0)) if len(bounds) else \
+        (-180.0, -85.0511, 180.0, 85.0511)
+    vector_layers = [{"id": name, "fields": {col: "String" for col in data.columns if col != data.geometry.name},
+                      "minzoom": layer_zooms[name][0], "maxzoom": layer_zooms[name][1]}
+                     for name, data in layers.items()]
+    metadata = {"name": os.path.splitext(os.path.basename(filepath))[0],
+                "format": "pbf",
+                "minzoom": str(minzoom),
+                "maxzoom": str(maxzoom),
+                "bounds": f"{west},{south},{east},{north}",
+                "center": f"{(west + east) / 2},{(south + north) / 2},{minzoom}",
+                "json": json.dumps({"vector_layers": vector_layers})}
+    with db:
+        db.executemany("INSERT OR REPLACE INTO metadata VALUES (?, ?)", metadata.items())
+    db.close()
+    return dict(sorted(status.items()))
+
+
+#================================================================ Tile Server ===================================================================================================
+
+def serve_mbtiles(filepath, host="127.0.0.1", port=8765):
+    """
+    Serve an MBTiles file at ``http://host:port/{z}/{x}/{y}.pbf`` (blocks until interrupted).
+
+    Parameters
+    ----------
+    filepath : str
+        Path to the ``.mbtiles`` file.
+    host : str, optional
+        The address to listen on (default: localhost only).
+    port : int, optional
+        The port to listen on (default 8765).
+    """
+    filepath = os.path.abspath(filepath)
+
+    class TileHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            try:
+                z, x, y = self.path.split("?")[0].strip("/").removesuffix(".pbf").split("/")
+                z, x, y = int(z), int(x), int(y)
+            except ValueError:
+                self.send_error(404)
+                return
+
+            with sqlite3.connect(f"file:{filepath}?mode=ro", uri=True) as db:
+                row = db.execute("SELECT tile_data FROM tiles WHERE zoom_level = ? AND tile_column = ? "
+                                 "AND tile_row = ?", (z, x, 2 ** z - 1 - y)).fetchone()
+            if row is None:
+                self.send_response(204)
+                self.send_header("Access-Control-Allow-Origin", "*")
+                self.end_headers()
+                return
+
+            self.send_response(200)
+            self.send_header("Content-Type", "application/x-protobuf")
+            self.send_header("Content-Encoding", "gzip")
+            self.send_header("Content-Length", str(len(row[0])))
+            self.send_header("Access-Control-Allow-Origin", "*") # the map is usually opened from a local file
+            self.send_header("Cache-Control", "public, max-age=3600")
+            self.end_headers()
+            self.wfile.write(row[0])
+
+        def log_message(self, format, *args):
+            pass
+
+    with ThreadingHTTPServer((host, port), TileHandler) as server:
+        print(f"Serving {filepath} at http://{host}:{server.server_port}/{{z}}/{{x}}/{{y}}.pbf")
+        server.serve_forever()
+
+
+#================================================================= Folium Layer =================================================================================================
+
+class VectorTilePopups(MacroElement):
+    """
+    Show the properties of the clicked vector tile feature in a popup (HTML-escaped, as in :mod:`point_clusters`).
+
+    Parameters
+    ----------
+    layer : folium.plugins.VectorGridProtobuf
+        The vector tile layer (created with the ``"interactive": true`` option).
+    """
+
+    _template = Template("""
+        {% macro script(this, kwargs) %}
+            {{ this.layer.get_name() }}.on("click", function (e) {
+                var props = e.layer.properties || {};
+                var escape = function (value) {
+                    return String(value).replace(/&/g, "&amp;").replace(/</g, "&lt;").replace(/>/g, "&gt;");
+                };
+                var rows = Object.keys(props).map(function (k) {
+                    return "<tr><th>" + escape(k) + "</th><td>" + escape(props[k]) + "</td></tr>";
+                }).join("");
+                L.popup().setLatLng(e.latlng).setContent("<table>" + rows + "</table>")
+                    .openOn({{ this.layer.get_name() }}._map);
+            });
+        {% endmacro %}
+    """)
+
+    def __init__(self, layer):
+        super().__init__()
+        self._name = "VectorTilePopups"
+        self.layer = layer
+
+
+def add_vector_tile_layer(m, url, layer_styles, name="NI tourist map tiles", maxzoom=14):
+    """
+    Add a vector tile layer (served by :func:`serve_mbtiles`) to a Folium map.
+
+    Parameters
+    ----------
+    m : folium.Map
+        The map.
+    url : str
+        The tile URL template, e.g. ``"http://localhost:8765/{z}/{x}/{y}.pbf"``.
+    layer_styles : dict
+        Maps each tile layer name to a Leaflet path style dict, or to a JavaScript function (as a string) taking
+        the feature properties and the zoom level.
+    name : str, optional
+        The name of the layer in the layer control.
+    maxzoom : int, optional
+        The largest zoom level in the tiles; the tiles are over-zoomed beyond it.
+
+    Returns
+    -------
+    folium.plugins.VectorGridProtobuf
+        The vector tile layer.
+
+    Examples
+    --------
+    >>> styles = {"counties": {"fill": True, "fillColor": "#66c2a5", "color": "black", "weight": 1}}
+    >>> add_vector_tile_layer(m, "http://localhost:8765/{z}/{x}/{y}.pbf", styles)
+    """
+    styles = ",\n".join(f"{json.dumps(layer)}: {style if isinstance(style, str) else json.dumps(style)}"
+                        for layer, style in layer_styles.items())
+    options = f'{{"interactive": true, "maxNativeZoom": {maxzoom}, "vectorTileLayerStyles": {{{styles}}}}}'
+
+    layer = VectorGridProtobuf(url, name, options)
+    layer.add_to(m)
+    VectorTilePopups(layer).add_to(m)
+    return layer
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve an MBTiles vector tile file for local testing.")
+    parser.add_argument("mbtiles", help="path to the .mbtiles file")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+    serve_mbtiles(args.mbtiles, args.host, args.port)